@@ -1,95 +1,326 @@
 import sys
 import os
+from collections import OrderedDict
 
-from PyQt5.QtWidgets import (QApplication, QMainWindow, QAction,
-                            QComboBox, QWidget, QAbstractButton,
-                            QGridLayout, QHBoxLayout, QVBoxLayout, 
-                            QScrollArea, QDockWidget, QLabel,
-                            QLayout)
-from PyQt5.QtGui import (QPixmap, QPainter)
-from PyQt5.QtCore import (Qt, QSize,pyqtSignal, QRect)
-
-class MediaButton(QAbstractButton):
-    def __init__(self, pixmap, parent=None, width=200, height=112 ):
-        super(MediaButton, self).__init__(parent)
-        self.pixmap = QPixmap(pixmap)
-        self.setSize( width, height )
-
-    def setSize( self, w, h ):
-        self.setWidth( w )
-        self.setHeight( h )
-        
-    def setWidth( self, w ):
-        self.w = w
-
-    def setHeight( self, h ):
-        self.h = h
-        
-    def sizeHint(self):
-        return QSize(self.w, self.h)
-
-    def paintEvent(self, event):
-        painter = QPainter(self)
-        painter.drawPixmap(0, 0, self.width(), self.height(), self.pixmap)
-
-    def dpaintEvent(self, event):
-        painter = QPainter(self)
-        painter.drawPixmap(event.rect(), self.pixmap)
-
-    def pic_change(self, pixmap):
-        self.pixmap = QPixmap(pixmap)
-
-    @property
-    def path( self ):
-        return self._media_path
-
-    @path.setter
-    def path( self, value ):
-        self._media_path = value
-        
-class Gallery( QWidget ):
-    def __init__( self, parent = None, objectName = None ):
+from PyQt5.QtWidgets import (QApplication, QMainWindow, QListView,
+                            QStyledItemDelegate, QStyle, QAbstractItemView)
+from PyQt5.QtGui import (QPixmap, QPainter, QImage, QImageReader, QMovie, QPen, QColor)
+from PyQt5.QtCore import (Qt, QSize, pyqtSignal, QRect, QModelIndex, QObject,
+                          QAbstractListModel, QRunnable, QThreadPool)
+
+# Roles of the gallery model
+MediaRole   = Qt.UserRole       # Path of the media
+ImageRole   = Qt.UserRole + 1   # Still image (icon) to paint
+PreviewRole = Qt.UserRole + 2   # Animated preview, played on hover/selection
+
+
+class MediaModel( QAbstractListModel ):
+    '''
+    MediaModel
+
+    Just the paths: one (media, image, preview) row per item, nothing is
+    decoded here.  Rows are looked up by media for icon/preview updates.
+    '''
+    def __init__( self, parent = None ):
+        super( MediaModel, self ).__init__( parent )
+        self.items = []
+        self.rows  = {}
+
+    def rowCount( self, parent = QModelIndex() ):
+        return 0 if parent.isValid() else len( self.items )
+
+    def data( self, index, role = Qt.DisplayRole ):
+        if not index.isValid():
+            return None
+        media, img, preview = self.items[ index.row() ]
+        if role == Qt.DisplayRole:
+            return os.path.basename( media ) if media else img
+        if role == Qt.ToolTipRole or role == MediaRole:
+            return media
+        if role == ImageRole:
+            return img
+        if role == PreviewRole:
+            return preview
+        return None
+
+    def extend( self, items ):
+        if not items:
+            return
+        first = len( self.items )
+        self.beginInsertRows( QModelIndex(), first, first + len( items ) - 1 )
+        for i, ( img, media ) in enumerate( items ):
+            self.items.append( [ media, img, None ] )
+            if media is not None:
+                self.rows[ media ] = first + i
+        self.endInsertRows()
+
+    def set_role( self, media, column, value ):
+        row = self.rows.get( media )
+        if row is None:
+            return None
+        self.items[ row ][ column ] = value
+        index = self.index( row )
+        self.dataChanged.emit( index, index )
+        return index
+
+    def clear( self ):
+        self.beginResetModel()
+        self.items = []
+        self.rows  = {}
+        self.endResetModel()
+
+
+class _Decode( QRunnable ):
+    '''
+    Decode <img> at <size> on a pool thread, QImage is safe off the GUI
+    thread, the pixmap is made by the store once the image is back
+    '''
+    def __init__( self, store, img, size ):
+        super( _Decode, self ).__init__()
+        self.store = store
+        self.img   = img
+        self.size  = QSize( size )
+
+    def run( self ):
+        reader = QImageReader( self.img )
+        scaled = reader.size()
+        if scaled.isValid():
+            scaled.scale( self.size, Qt.KeepAspectRatio )
+            reader.setScaledSize( scaled )
+        image = reader.read()
+        self.store.decoded.emit( self.img, self.size, image )
+
+
+class PixmapStore( QObject ):
+    '''
+    PixmapStore
+
+    Thumbnails decoded off the GUI thread (QImageReader.setScaledSize)
+    at exactly the size they are painted, turned into pixmaps once and
+    kept, least recently used first out, within <limit> bytes.  get()
+    never decodes: a miss queues the decode and returns None, ready( img )
+    is emitted when the pixmap is in.  One store is shared by every view.
+    '''
+    ready   = pyqtSignal( str )
+    decoded = pyqtSignal( str, QSize, QImage )
+
+    def __init__( self, limit = 64 * 1024 * 1024, pool = None ):
+        super( PixmapStore, self ).__init__()
+        self.limit    = limit
+        self.cost     = 0
+        self.pixmaps  = OrderedDict()
+        self.inflight = set()
+        self.pool     = pool if pool is not None else QThreadPool.globalInstance()
+        self.decoded.connect( self.insert )
+
+    @staticmethod
+    def key( img, size ):
+        return ( img, size.width(), size.height() )
+
+    def get( self, img, size ):
+        key = self.key( img, size )
+        pixmap = self.pixmaps.get( key )
+        if pixmap is not None:
+            self.pixmaps.move_to_end( key )
+            return pixmap
+        if img and key not in self.inflight:
+            self.inflight.add( key )
+            self.pool.start( _Decode( self, img, size ) )
+        return None
+
+    def insert( self, img, size, image ):
+        key = self.key( img, size )
+        if key not in self.inflight:
+            return # Discarded while decoding
+        self.inflight.discard( key )
+        pixmap = QPixmap.fromImage( image )
+        self.pixmaps[ key ] = pixmap
+        self.cost += pixmap.width() * pixmap.height() * 4
+        while self.cost > self.limit and len( self.pixmaps ) > 1:
+            k, old = self.pixmaps.popitem( last = False )
+            self.cost -= old.width() * old.height() * 4
+        self.ready.emit( img )
+
+    def discard( self, img ):
+        for key in [ k for k in self.pixmaps if k[0] == img ]:
+            old = self.pixmaps.pop( key )
+            self.cost -= old.width() * old.height() * 4
+        self.inflight = set( k for k in self.inflight if k[0] != img )
+
+    def clear( self ):
+        self.pixmaps.clear()
+        self.inflight.clear()
+        self.cost = 0
+
+
+_store = None
+
+def pixmap_store():
+    '''
+    The store shared by all galleries (made on first use, after the
+    QApplication exists)
+    '''
+    global _store
+    if _store is None:
+        _store = PixmapStore()
+    return _store
+
+
+class MediaDelegate( QStyledItemDelegate ):
+    '''
+    MediaDelegate
+
+    Paints the thumbnail of a row, or the current frame of its preview
+    when the gallery is playing one for it
+    '''
+    def __init__( self, gallery, width = 200, height = 112 ):
+        super( MediaDelegate, self ).__init__( gallery )
+        self.gallery = gallery
+        self.size    = QSize( width, height )
+
+    def sizeHint( self, option, index ):
+        return self.size
+
+    def paint( self, painter, option, index ):
+        rect   = option.rect
+        movie  = self.gallery.movie_for( index )
+        if movie is not None:
+            pixmap = movie.currentPixmap() # Already decoded at the cell size
+        else:
+            pixmap = self.gallery.pixmaps.get( index.data( ImageRole ), rect.size() )
+
+        painter.save()
+        painter.fillRect( rect, Qt.black )
+        if pixmap is not None and not pixmap.isNull():
+            x = rect.x() + ( rect.width()  - pixmap.width() ) // 2
+            y = rect.y() + ( rect.height() - pixmap.height() ) // 2
+            painter.drawPixmap( x, y, pixmap )
+        if option.state & QStyle.State_Selected:
+            painter.setPen( QPen( QColor( 'orange' ), 3 ) )
+            painter.drawRect( rect.adjusted( 1, 1, -2, -2 ) )
+        painter.restore()
+
+
+class Gallery( QListView ):
+    '''
+    Gallery
+
+    Virtualized grid of media: the view only asks the delegate to paint
+    the visible rows, thumbnails come from the shared PixmapStore
+    (decoded in the background, the row is repainted once ready) and at
+    most two previews (hovered and selected) are animated.
+
+    append()/refresh() batch rows into the model, set_image() and
+    set_preview() update a row when its icon or preview is ready.
+    '''
+    def __init__( self, parent = None, objectName = None, width = 200, height = 112, store = None ):
         super( Gallery, self ).__init__( parent, objectName = objectName )
-        self.layout = QGridLayout()
-        self.layout.setContentsMargins( 0,0,0,0)
-        self.layout.setSizeConstraint( QLayout.SizeConstraint.SetFixedSize )
-        self.setLayout( self.layout )
-        self.buttons = []
+        self.media_model = MediaModel( self )
+        self.pixmaps     = store if store is not None else pixmap_store()
+        self.cell        = QSize( width, height )
+        self.pending     = []
+        self.movies      = {} # 'hover'/'selected' -> ( row, QMovie )
+
+        self.setModel( self.media_model )
+        self.setItemDelegate( MediaDelegate( self, width, height ) )
+        self.setViewMode( QListView.IconMode )
+        self.setMovement( QListView.Static )
+        self.setResizeMode( QListView.Adjust )
+        self.setLayoutMode( QListView.Batched )
+        self.setBatchSize( 256 )
+        self.setUniformItemSizes( True )
+        self.setSpacing( 2 )
+        self.setSelectionMode( QAbstractItemView.SingleSelection )
+        self.setMouseTracking( True )
+        self.entered.connect( self.hovered )
+        self.selectionModel().currentChanged.connect( self.selected )
+        self.pixmaps.ready.connect( self.thumbnail_ready )
 
         default_style = '''
-        QWidget{
+        QListView{
         background-color: black;
         }
         '''
         self.style( default_style )
 
-        self.clear()
-        self.refresh()
-        
     def style( self, style ):
         self.setStyleSheet( style )
 
     def append( self, img, media = None ):
-        button = MediaButton( img )
-        button.path = media
-        self.buttons.append( button )
+        self.pending.append( ( img, media ) )
+
+    def refresh( self, mod = None ):
+        # One insert for everything appended since the last refresh
+        pending, self.pending = self.pending, []
+        self.media_model.extend( pending )
+
+    def set_image( self, media, img ):
+        '''
+        Swap the image of <media>, e.g. once its icon exists
+        '''
+        self.pixmaps.discard( img )
+        self.media_model.set_role( media, 1, img )
+
+    def set_preview( self, media, gif ):
+        self.media_model.set_role( media, 2, gif )
 
     def clear( self ):
-        while self.layout.count():
-            child = self.layout.takeAt(0)
-            if child.widget():
-                child.widget().deleteLater()
-
-    def refresh( self, mod = 4 ):
-        row = 0
-        col = 0
-        for i, button in enumerate( self.buttons ):
-            if col > mod:
-                row=i+1
-                col=0
-            self.layout.addWidget( button, row, col )
-            col+=1
-      
+        self.stop_movie( 'hover' )
+        self.stop_movie( 'selected' )
+        self.pending = []
+        self.media_model.clear()
+
+    def __len__( self ):
+        return self.media_model.rowCount() + len( self.pending )
+
+    def thumbnail_ready( self, img ):
+        # Repaints are coalesced, only the visible rows are painted again
+        self.viewport().update()
+
+    # Previews
+    def movie_for( self, index ):
+        for row, movie in self.movies.values():
+            if row == index.row():
+                return movie
+        return None
+
+    def play_movie( self, slot, index ):
+        current = self.movies.get( slot )
+        if current is not None and current[0] == index.row():
+            return
+        self.stop_movie( slot )
+        gif = index.data( PreviewRole ) if index.isValid() else None
+        if not gif or not os.path.exists( gif ):
+            return
+        row   = index.row()
+        movie = QMovie( gif, parent = self )
+        # Frames decoded at the cell size, painting does no scaling
+        size  = QImageReader( gif ).size()
+        if size.isValid():
+            size.scale( self.cell, Qt.KeepAspectRatio )
+            movie.setScaledSize( size )
+        movie.frameChanged.connect( lambda frame : self.update( self.media_model.index( row ) ) )
+        self.movies[ slot ] = ( row, movie )
+        movie.start()
+
+    def stop_movie( self, slot ):
+        current = self.movies.pop( slot, None )
+        if current is not None:
+            row, movie = current
+            movie.stop()
+            movie.deleteLater()
+            self.update( self.media_model.index( row ) )
+
+    def hovered( self, index ):
+        self.play_movie( 'hover', index )
+
+    def selected( self, current, previous ):
+        self.play_movie( 'selected', current )
+
+    def leaveEvent( self, event ):
+        self.stop_movie( 'hover' )
+        super( Gallery, self ).leaveEvent( event )
+
 
 class gui(QMainWindow):
     def __init__(self):
@@ -97,17 +328,11 @@ class gui(QMainWindow):
         #self.ui_init()
         self.gallery=Gallery()
         img_path = "out.gif"
-        for x in range( 100 ):
-            self.gallery.append( img_path )
+        for x in range( 100000 ):
+            self.gallery.append( img_path, '{}.mp4'.format( x ) )
         self.gallery.refresh()
 
-        self.scroll = QScrollArea()
-        self.scroll.setVerticalScrollBarPolicy(Qt.ScrollBarAsNeeded)
-        self.scroll.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
-        self.scroll.setWidgetResizable(False)
-        self.scroll.setWidget(self.gallery)
-
-        self.setCentralWidget(self.scroll)
+        self.setCentralWidget(self.gallery)
 
         self.setGeometry(600, 600, 600, 600)
         self.show()
@@ -10,7 +10,9 @@ from PyQt5.QtWidgets import QHBoxLayout, QVBoxLayout, QStyle, QFrame
 # Setup imports from module
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from v4l2tricks.ffmpeg_if import DesktopScopeProcess
+from v4l2tricks.ffmpeg_if  import DesktopScopeProcess
+from v4l2tricks.scope      import LiveScope
+from v4l2tricks.controller import StreamController
 #from v4l2tricks.stream import desktop_stream
 
 get_video_devices = lambda : [ dev for dev in os.listdir('/dev') if 'video' in dev ]
@@ -210,16 +212,19 @@ class StreamScope( QWidget ):
             self.streamer.height = self.res_h
 
         self.streamer.device = self.device
+        screen = QApplication.desktop().geometry()
+        self.streamer.screen = ( screen.x(), screen.y(), screen.width(), screen.height() )
         #self.debug_frustum()
 
     def moveEvent( self, event ):
-        self.stop()
+        # The running capture follows, the stream is not restarted
         self.update_frustum()
+        self.streamer.move_region()
         super().moveEvent(event)
 
     def resizeEvent(self, event = None):
-        self.stop()
         self.update_frustum()
+        self.streamer.resize_region()
         self.resize_signal.emit( 1 )
 
     def closeEvent( self, event ):
@@ -234,41 +239,52 @@ class StreamScope( QWidget ):
 
 
 class DeskStreamer( QObject ):
+    '''
+    DeskStreamer
+
+    long_running() is the StreamController loop, asleep until stream()
+    or stop() is requested.  The stream is a LiveScope, move_region()
+    and resize_region() update it in place.
+    '''
     finished = pyqtSignal()
 
     def __init__( self ):
         super(DeskStreamer, self).__init__()
-        self._running = False
-        self._exit    = False
-        self.x        = 0
-        self.y        = 0
-        self.width    = 640
-        self.height   = 480
-        self.display  = None
-        self.device   = '/dev/video20'
+        self.x          = 0
+        self.y          = 0
+        self.width      = 640
+        self.height     = 480
+        self.display    = None
+        self.device     = '/dev/video20'
+        self.screen     = ( 0, 0, 1920, 1080 ) # Desktop captured, ( x, y, w, h )
+        self.controller = StreamController( self.start_streaming )
 
     def isStreaming( self ):
-        return self._running
+        return self.controller.streaming
 
     def stream( self ):
-        self._running = True
+        self.controller.start()
 
     def stop( self ):
-        self._running = False
+        self.controller.stop()
 
     def exit( self ):
         print( 'Exiting' )
-        self._running = False
-        self._exit = True
+        print( 'Stream latencies: {}'.format( self.controller.summary() ) )
+        self.controller.exit()
 
-    def long_running( self ):
-        while not self._exit:
-            if self._running:
-                print( 'Attempting to start stream' )
-                #self.debug_parameters()
-                #time.sleep(1)
-                self.start_streaming()
+    def move_region( self ):
+        scope = self.controller.stream
+        if scope is not None:
+            scope.move( self.x, self.y )
 
+    def resize_region( self ):
+        scope = self.controller.stream
+        if scope is not None:
+            scope.resize( self.x, self.y, self.width, self.height )
+
+    def long_running( self ):
+        self.controller.run()
         self.finished.emit()
         print( '{0} finished'.format( __class__.__name__ ) )
 
@@ -279,15 +295,8 @@ class DeskStreamer( QObject ):
         print( '{0}: {1}'.format( 'height', self.height ) )
         print( self.device )
 
-    def process_stream( self, stream ):
-        while stream.alive and self._running:
-            line  = stream.readline
-            if line is not None:
-                print( line )
-        stream.stop()
-        print( 'Bye' )
-
     def start_streaming( self ):
+        ''' Called by the controller, returns the new stream '''
         self.display = ':1'
         try:
             self.display = os.environ[ 'DISPLAY' ]
@@ -295,15 +304,15 @@ class DeskStreamer( QObject ):
             print( 'Could not detect DISPLAY variable (normally :0 or :1)' )
             pass
 
-        stream = DesktopScopeProcess( self.x,
-                                      self.y,
-                                      self.width,
-                                      self.height,
-                                      self.display,
-                                      self.device,
-                                      True )
-
-        self.process_stream( stream )
+        # One capture of the whole desktop, the region is cut out per
+        # frame so moving/resizing the scope never restarts ffmpeg
+        return LiveScope( self.x,
+                          self.y,
+                          self.width,
+                          self.height,
+                          self.screen,
+                          display = self.display,
+                          device  = self.device )
 
 
 # Main
@@ -2,8 +2,9 @@
 import os
 import sys
 import time
-import shutil
 import pdb
+import queue
+import threading
 
 from PyQt5.QtCore import *
 from PyQt5.QtGui import *
@@ -13,10 +14,14 @@ from grids import Gallery
 # Setup imports from module
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from v4l2tricks.stream    import stream_media
-from v4l2tricks.ffmpeg_if import generate_thumbnail, jpgs2gif, probe_duration, probe, deep_probe
+from v4l2tricks.stream    import stream_media, fanout_stream
+from v4l2tricks.ffmpeg_if import generate_thumbnail, generate_thumbnails, generate_previews, preview_times, probe_duration, probe, deep_probe
 from v4l2tricks.supported import MediaContainers
 from v4l2tricks           import fsutil
+from v4l2tricks.mediacache import MediaCache
+from v4l2tricks.proxy     import proxy_cache
+from v4l2tricks.scanner   import IncrementalScanner
+from v4l2tricks.controller import StreamController
 from gui.wait             import QtWaitSpinner
 
 def trap_exc_during_debug(*args):
@@ -72,9 +77,15 @@ class SettingsManager( object ):
 
 icon_path    = 'resources'
 icon_btn_res = 32
+icon_batch   = 32
+icon_default = os.path.join( icon_path, 'file.svg' )
+found_batch  = 256  # Media sent to the gallery at once ...
+found_time   = 0.05 # ... or at least this often (s)
 cache        = os.path.expanduser( '~/.v4l2tricks' )
-cached_path  = lambda media : os.path.join( cache, os.path.basename( media ) )
-config_path  = cached_path( 'vidstreamer.ini' )
+cache_budget = 512 * 1024 * 1024
+media_cache  = MediaCache( cache, cache_budget )
+cached_path  = lambda media : media_cache.entry( media )
+config_path  = os.path.join( cache, 'vidstreamer.ini' )
 
 #settings    = SettingsManager( config_path )
 #settings.dump()
@@ -87,45 +98,57 @@ def get_icon_path( path ):
 
 def create_icon( path ):
     ''' Create an icon of the media at <path> '''
-    duration = probe_duration( path )
     outdir   = cached_path( path )
     outpath  = os.path.join( outdir, 'icon.jpg' )
-    if not os.path.exists( outdir ):
-        fsutil.mkdir_p( outdir )
 
     # Make a thumbnail icon if it doesn't already exist
     if not os.path.exists( outpath ):
-        ts = duration * 0.10
+        ts = probe_duration( path ) * 0.10
         generate_thumbnail( path, outpath, time = ts )
+        media_cache.commit( path )
     return outpath
 
+def create_icons( paths ):
+    '''
+    Create icons for many media files, batching the ffmpeg runs
+    '''
+    jobs  = []
+    icons = []
+    for path in paths:
+        outdir  = cached_path( path )
+        outpath = os.path.join( outdir, 'icon.jpg' )
+        icons.append( outpath )
+        if os.path.exists( outpath ):
+            continue
+        try:
+            ts = probe_duration( path ) * 0.10
+        except Exception as e:
+            print( 'Could not probe {}: {}'.format( path, e ) )
+            continue
+        jobs.append( ( path, outpath, ts ) )
+
+    failures = generate_thumbnails( jobs )
+    for path, outpath, ts in jobs:
+        if outpath in failures:
+            print( 'Could not create icon for {}: {}'.format( path, failures[ outpath ] ) )
+        else:
+            media_cache.commit( path )
+    return icons
+
 def create_gif( path, increments = 4, overwrite = False ):
     '''
     Generate a gif from media at <path>, from <increments> fragments
     '''
-    duration  = probe_duration(path )
-    timestamp = lambda duration, step: ( ( duration/step ) - ( 0.5 * ( duration * 1.0/increments ) ) )
     basename  = os.path.basename( path )
-    outdir    = os.path.join( cache, basename )
+    outdir    = cached_path( path )
     gif       = '{}.gif'.format( basename )
-
-    if not os.path.exists( outdir ):
-        fsutil.mkdir_p( outdir )
-
-    # Make 4 thumbnails for previewing
-    for i in range( increments, 0, -1 ):
-        step = (increments + 1) - i
-        ts = timestamp( duration, step )
-        outfile= '{}_{:03}.jpg'.format( 'preview', i )
-        outpath = os.path.join( outdir, outfile )
-        if not os.path.exists( outpath ) or overwrite:
-            generate_thumbnail( path, outpath, time = ts )
-
-    # Generate a gif from the previews if one doesn't already exist
     outfile   = os.path.join( outdir, gif )
-    pattern   = os.path.join( outdir, 'preview_%03d.jpg' )                              
+
+    # Grab the previews and build the gif in one pass if one doesn't already exist
     if not os.path.exists( outfile ) or overwrite:
-        jpgs2gif( pattern, out = outfile )
+        duration = probe_duration( path )
+        generate_previews( path, outfile, preview_times( duration, increments ), frames = False )
+        media_cache.commit( path )
     return outfile
 
 
@@ -226,9 +249,11 @@ class VidStreamer( QWidget ):
         self.src_threads   = []
         self.devices       = get_video_devices()
         self.device        = '/dev/{0}'.format( self.devices[0] )
+        self.targets       = [] # Checked devices, decoded once for all
         self.log_shown      = True
         self.enable_icons   = True
         self.enable_preview = True
+        self.enable_proxies = False
         self.selected_media = None
 
         # Threading: Media updaters
@@ -237,6 +262,7 @@ class VidStreamer( QWidget ):
         # Threading: Streamer (Presentation Thread)
         self.stream_thread = QThread(parent=self)
         self.streamer      = MediaStreamer()
+        self.streamer.proxies = self.enable_proxies
         self.streamer.moveToThread( self.stream_thread )
         self.streamer.finished.connect( self.stream_thread.quit )
         self.streamer.finished.connect( self.streamer.deleteLater )
@@ -268,16 +294,16 @@ class VidStreamer( QWidget ):
         menubar.addMenu( filemenu )
 
         # Open folder
-        foldAct = QAction( QIcon(),'&Open Folder', self )
-        foldAct.setStatusTip( 'Open Folder' )
-        foldAct.triggered.connect( self.find )
-        filemenu.addAction( foldAct )
+        self.foldAct = QAction( QIcon(),'&Open Folder', self )
+        self.foldAct.setStatusTip( 'Open Folder' )
+        self.foldAct.triggered.connect( self.find )
+        filemenu.addAction( self.foldAct )
 
         # Add media
-        addAct = QAction( QIcon(), '&Add media', self )
-        addAct.setStatusTip( 'Add media' )
-        addAct.triggered.connect( self.add )
-        filemenu.addAction( addAct )
+        self.addAct = QAction( QIcon(), '&Add media', self )
+        self.addAct.setStatusTip( 'Add media' )
+        self.addAct.triggered.connect( self.add )
+        filemenu.addAction( self.addAct )
 
         # Remove media
         rmAct = QAction( QIcon(), '&Remove media', self )
@@ -304,6 +330,11 @@ class VidStreamer( QWidget ):
         self.iconact.triggered.connect( self.toggle_icons )
         editmenu.addAction( self.iconact )
 
+        self.proxyact = QAction( QIcon(), 'Enable P&roxies', self )
+        self.proxyact.setStatusTip( 'Transcode the media to device resolution proxies in the background' )
+        self.proxyact.triggered.connect( self.toggle_proxies )
+        editmenu.addAction( self.proxyact )
+
         self.cleanact = QAction( QIcon(), '&Clean Cache', self )
         self.cleanact.setStatusTip( 'Clean up cache files' )
         self.cleanact.triggered.connect( self.cleancache )
@@ -312,8 +343,9 @@ class VidStreamer( QWidget ):
         # Video Devices
         devmenu  = editmenu.addMenu( '&Device' )
 
+        # Several can be checked, the media is then fanned out to all
         self.devgroup = QActionGroup( devmenu )
-        self.devgroup.setExclusive( True )
+        self.devgroup.setExclusive( False )
         self.devgroup.triggered.connect( self.editDevice )
         for i, device in enumerate( self.devices ):
             act = QAction( device, self, checkable = True )
@@ -321,7 +353,8 @@ class VidStreamer( QWidget ):
             act.setStatusTip( location )
             if device == 'video20':
                 act.setChecked( True )
-                self.device = '/dev/{0}'.format( device )
+                self.device  = '/dev/{0}'.format( device )
+                self.targets = [ self.device ]
             self.devgroup.addAction( act )
             devmenu.addAction( act )
 
@@ -400,11 +433,10 @@ class VidStreamer( QWidget ):
         #----------------
         # Gallery View
         #---------------        
-        self.scrollArea = QScrollArea()
+        # The gallery scrolls itself and only paints the visible items
         self.gallery = Gallery()
-        self.scrollArea.setWidgetResizable( True )
-        self.scrollArea.setWidget( self.gallery )
-        self.scrollArea.setFixedWidth( 600 )
+        self.gallery.setFixedWidth( 600 )
+        self.gallery.clicked.connect( self.selectionChanged )
 
 
         #### test
@@ -419,7 +451,7 @@ class VidStreamer( QWidget ):
         self.playlist_busy.minTrailOpacity = 50
         self.playlist_busy.setColor( QColor( Qt.black ) )
 
-        layout_grid.addWidget( self.scrollArea )
+        layout_grid.addWidget( self.gallery )
         layout_grid.addLayout( layout_lbtn )
 
         # Log output
@@ -438,39 +470,15 @@ class VidStreamer( QWidget ):
 
 
     def add( self ):
-        self.playlist_busy.start()
         self.log.append('Adding: ' )
         add = FileDialog('Opens')
 
         self.log.append( '{}'.format( add.paths ) )
         if len( add.paths ) == 0:
-            self.playlist_busy.stop()
             return # Bail early
 
-        sources.extend( add.paths )
-
-        # This could take some time... it might need to be threaded after all
-        for path in add.paths:
-            self.log.append( 'Creating icon for: {}'.format( path ) )
-            icon = create_icon( path )
-            
-            # Add the media to the gallery
-            self.log.append( 'Appending {} to the gallery'.format( icon ) )
-            self.gallery.append( icon )
-
-            # Lazy select the last file
-            self.selected_media = path
-            
-        # Refresh the gallery
-        self.gallery.refresh()
-
-        # Update the selected media
-        self.log.append( 'Queued: {}'.format( self.selected_media ) )
-        self.streamer.path = self.selected_media
-
-        # Create a preview of the item selected.
-        create_gif( self.selected_media )
-        self.playlist_busy.stop()
+        # Icons and previews are made off the GUI thread and show up as they complete
+        self.ingest( list( add.paths ) )
 
 
     def selectMedia( self, btn ):
@@ -492,16 +500,30 @@ class VidStreamer( QWidget ):
         else:
             self.dirname = folder.path
 
+        # The folder replaces whatever was loaded
+        sources.clear()
+        self.gallery.clear()
+        self.selected_media = None
+        self.ingest( self.dirname )
+
+    def ingest( self, path ):
+        '''
+        Run the ingestion pipeline over a folder or a list of files, the
+        gallery fills in as media is found and icons complete
+        '''
         self.playlist_busy.start()
-        self.log.append( 'Sources: {0}'.format( sources ) )
         self.find_btn.setDisabled( True )
         self.add_btn.setDisabled( True )
         self.rm_btn.setDisabled( True )
+        # The menu entries too: a second ingest would replace the running
+        # updater and find() would clear sources under it
+        self.foldAct.setDisabled( True )
+        self.addAct.setDisabled( True )
 
         self.__updaters = []
         thread = QThread()
         thread.setObjectName( 'Updater' )
-        worker = SourceUpdater( 0, self.dirname, icons = self.enable_icons, preview = self.enable_preview )
+        worker = SourceUpdater( 0, path, icons = self.enable_icons, preview = self.enable_preview )
         # Keep references to worker and thread to avoid garbage collection
         self.__updaters.append( ( thread, worker ) )
         worker.moveToThread( thread )
@@ -510,6 +532,9 @@ class VidStreamer( QWidget ):
         worker.sig_step.connect( self.discover_step )
         worker.sig_done.connect( self.discover_done )
         worker.sig_msg.connect(  self.log.append )
+        worker.sig_found.connect( self.media_found )
+        worker.sig_icon.connect( self.icon_ready )
+        worker.sig_preview.connect( self.preview_ready )
         self.sig_abort_workers.connect( worker.abort )
 
         thread.started.connect( worker.discover )
@@ -521,6 +546,31 @@ class VidStreamer( QWidget ):
         ''' Busy doing work '''
         pass
 
+    @pyqtSlot( list )
+    def media_found( self, paths ):
+        sources.extend( paths )
+        for path in paths:
+            # Placeholder until the icon is ready
+            self.gallery.append( icon_default, path )
+            if self.enable_proxies:
+                proxy_cache().request( path )
+        self.gallery.refresh()
+
+        # Lazy select the first media found
+        if self.selected_media is None and len( sources ) > 0:
+            self.selected_media = sources[ 0 ]
+            self.log.append( 'Queued: {}'.format( self.selected_media ) )
+            self.streamer.path = self.selected_media
+
+    @pyqtSlot( str, str )
+    def icon_ready( self, path, icon ):
+        self.gallery.set_image( path, icon )
+
+    @pyqtSlot( str, str )
+    def preview_ready( self, path, gif ):
+        # Played by the gallery when the item is hovered or selected
+        self.gallery.set_preview( path, gif )
+
     @pyqtSlot( int )
     def discover_done( self, worker_id ):
         self.log.append( 'worker #{} finsihed'.format(worker_id) )
@@ -528,21 +578,9 @@ class VidStreamer( QWidget ):
         self.find_btn.setEnabled( True )
         self.add_btn.setEnabled( True )
         self.rm_btn.setEnabled( True )
-
-        # Update the list view
-        for path in sources:
-            self.log.append( 'Appending gallery with {}'.format( path ) )
-            icon = get_icon_path( path )
-            self.gallery.append( icon )
-            
-
-        self.gallery.refresh()
-
-        # Update the selected media
-        if len( sources ) > 0:
-            self.selected_media = sources[ 0 ]
-            self.log.append( 'Queued: {}'.format( self.selected_media ) )
-            self.streamer.path = self.selected_media
+        self.foldAct.setEnabled( True )
+        self.addAct.setEnabled( True )
+        self.log.append( 'Sources: {0}'.format( len( sources ) ) )
 
         # Clean up the thread
         for thread, work in self.__updaters:
@@ -555,6 +593,8 @@ class VidStreamer( QWidget ):
         self.sig_abort_workers.emit()
         self.log.append( 'Requesting abort' )
         for thread, work in self.__updaters:
+            # The worker is busy in discover(), a queued slot would never run
+            work.abort()
             thread.quit()
             thread.wait()
         self.log.append( 'All updaters exited' )
@@ -573,18 +613,27 @@ class VidStreamer( QWidget ):
             self.streamer.stop()
 
     def editDevice( self, action ):
-        text = action.text()
+        text     = action.text()
+        location = '/dev/{0}'.format( text )
+        if not action.isChecked() and self.targets == [ location ]:
+            # Always stream somewhere
+            action.setChecked( True )
+            return
         self.stop()
-        self.device = '/dev/{0}'.format( text )
-        self.streamer.device = self.device
-        self.log.append( 'Changed video device: {}'.format( text ) )
+        if action.isChecked():
+            if location not in self.targets:
+                self.targets.append( location )
+        elif location in self.targets:
+            self.targets.remove( location )
+        self.device = self.targets[ 0 ]
+        self.streamer.devices = list( self.targets )
+        self.log.append( 'Video devices: {}'.format( ', '.join( self.targets ) ) )
 
     def selectionChanged( self, index ):
         self.log.append( 'selected: {}'.format( index.row() ) )
         self.log.append( 'Queued: {}'.format( sources[ index.row()] ) )
         self.selected_media = sources[ index.row()]
         self.streamer.path  = self.selected_media
-        self.update_preview()
 
     def toggle_icons( self ):
         if self.enable_icons:
@@ -601,6 +650,20 @@ class VidStreamer( QWidget ):
         else:
             self.enable_preview = True
             self.previewact.setText( 'Disable &Preview' )
+
+    def toggle_proxies( self ):
+        if self.enable_proxies:
+            self.enable_proxies = False
+            self.streamer.proxies = False
+            self.proxyact.setText( 'Enable P&roxies' )
+        else:
+            self.enable_proxies = True
+            self.streamer.proxies = True
+            self.proxyact.setText( 'Disable P&roxies' )
+            # Streamed as soon as each is made, the originals until then
+            self.log.append( 'Making proxies of {} sources in the background'.format( len( sources ) ) )
+            for path in sources:
+                proxy_cache().request( path )
         
     def toggle_log( self ):
         if self.log_shown:
@@ -613,13 +676,14 @@ class VidStreamer( QWidget ):
             self.log.show()
 
     def cleancache( self ):
-        cache_objects = os.listdir( cache )
-        num = len( cache_objects )
-        for node in cache_objects:
-            self.log.append( 'Removing {}'.format( node ) )
-            path = os.path.join( cache, node )
-            shutil.rmtree( path )
-        self.log.append( 'Cleaned {} cache objects'.format( num ) )
+        # Deleting can take a while, keep it off the GUI thread
+        self.log.append( 'Cleaning {} cache objects ({} bytes) in the background'.format( len( media_cache ), media_cache.size ) )
+        media_cache.clean_async( clear = True,
+                                 callback = lambda removed : print( 'Cleaned {} cache objects'.format( removed ) ) )
+        proxies = proxy_cache()
+        self.log.append( 'Cleaning {} proxies ({} bytes) in the background'.format( len( proxies ), proxies.size ) )
+        proxies.clean_async( clear = True,
+                             callback = lambda removed : print( 'Cleaned {} proxies'.format( removed ) ) )
                 
     def closeEvent( self, event ):
         self.thread_clean_up()
@@ -631,23 +695,37 @@ class VidStreamer( QWidget ):
 
     def thread_clean_up( self ):
         print( 'Cleaning up thread' )
+        proxy_cache().stop()
         self.streamer.exit()
         self.stream_thread.quit()
         self.stream_thread.wait()
 
 
 class SourceUpdater( QObject ):
-    sig_step = pyqtSignal(int,int) # Id, step description
-    sig_done = pyqtSignal(int)     # Id, end of job
-    sig_msg  = pyqtSignal(str)     # msg to user
+    '''
+    SourceUpdater
 
-    def __init__( self, id:int, path:str, icons:bool, preview:bool ):
+    Ingestion pipeline behind both find (a folder) and add (a list of
+    files).  Found media is sent to the GUI in small batches as soon as
+    it is seen (sig_found); a stage thread makes the icons, then the
+    previews, and reports each one as it completes (sig_icon,
+    sig_preview).  Nothing here runs on the GUI thread.
+    '''
+    sig_step    = pyqtSignal(int,int)  # Id, step description
+    sig_done    = pyqtSignal(int)      # Id, end of job
+    sig_msg     = pyqtSignal(str)      # msg to user
+    sig_found   = pyqtSignal(list)     # batch of media paths
+    sig_icon    = pyqtSignal(str,str)  # media, icon
+    sig_preview = pyqtSignal(str,str)  # media, preview gif
+
+    def __init__( self, id:int, path, icons:bool, preview:bool ):
         super( SourceUpdater, self ).__init__()
         self.__id      = id
         self.__abort   = False
-        self.__path    = path
+        self.__path    = path # Folder to search, or a list of files
         self.__icons   = icons
         self.__preview = preview
+        self.__stages  = queue.Queue()
 
     @pyqtSlot()
     def discover( self ):
@@ -657,41 +735,91 @@ class SourceUpdater( QObject ):
         msg = 'Running worker #{} from thread "{}" (#{})'.format(self.__id, thread_name, thread_id)
         self.sig_msg.emit(msg)
 
-        # TODO: optimize
-        # These are not optimized and chew up resources
-        is_ext = lambda f, ext : any( f.endswith( e ) for e in ext )
-
         t0 = time.time()
+        stage = threading.Thread( target = self.stages, name = 'SourceStages' )
+        stage.daemon = True
+        stage.start()
 
-        self.sig_msg.emit( 'Clearing sources' )
-        sources.clear()
+        batch = []
+        last  = [ 0.0 ] # First item goes out straight away
+        is_ext = lambda f, ext : any( f.endswith( e ) for e in ext )
+
+        def found( path ):
+            if self.__abort or is_ext( path.lower(), exclude_types ):
+                return
+            batch.append( path )
+            if len( batch ) >= found_batch or time.time() - last[0] >= found_time:
+                flush()
+
+        def flush():
+            if batch:
+                self.sig_found.emit( list( batch ) )
+                self.sig_step.emit( 0, len( batch ) )
+                self.__stages.put( list( batch ) )
+                del batch[:]
+            last[0] = time.time()
 
-        fcnt = 0
         self.sig_msg.emit( 'Searching...' )
-        for root, dirs, files in os.walk( self.__path ):#, topdown=True ):
-            files=    [ f for f in files if not f.startswith( '.' ) ]
-            dirs[:] = [ d for d in dirs  if not d.startswith( '.' ) ]
-
-            for fname in files:
-                fcnt += 1
-                self.sig_msg.emit( 'checking root={}, file={}'.format(root, fname ) )
-                self.sig_step.emit( 0, fcnt )
-                if is_ext( fname.lower(), media_types ) and not is_ext( fname.lower(), exclude_types ):
-                    path = os.path.join( root, fname )
-                    sources.append( path )
-                    if self.__preview: create_gif( path )
-                    if self.__icons: create_icon( path )
-
-                # Check for abort
-                if self.__abort:
-                    self.sig_msg.emit('Aborting')
-                    break
+        if isinstance( self.__path, str ):
+            # Only directories changed since the last scan are read again
+            scanner = IncrementalScanner( self.__path, media_types )
+            diff    = scanner.scan( found )
+            flush()
+            self.sig_msg.emit( 'Found {} ({} new, {} modified, {} removed, {} directories read) in {:.3f}s'.format(
+                len( scanner.files ), len( diff.added ), len( diff.modified ), len( diff.removed ),
+                scanner.listed, time.time() - t0 ) )
+        else:
+            for path in self.__path:
+                found( path )
+            flush()
+
+        # Wait for the icons and previews
+        self.__stages.put( None )
+        stage.join()
 
         t1 = time.time()
         total = t1 - t0
         self.sig_msg.emit( 'Total time taken: {}'.format( total ) )
         self.sig_done.emit( self.__id )
 
+    def stages( self ):
+        '''
+        Icons for every batch as it arrives, previews once all media
+        has icons (they take much longer)
+        '''
+        previews = []
+        while True:
+            paths = self.__stages.get()
+            if paths is None or self.__abort:
+                break
+            previews.extend( paths )
+            if not self.__icons:
+                continue
+            # Unchanged media with an icon in the cache is skipped by create_icons
+            for i in range( 0, len( paths ), icon_batch ):
+                if self.__abort:
+                    break
+                chunk = paths[ i:i + icon_batch ]
+                try:
+                    icons = create_icons( chunk )
+                except Exception as e:
+                    self.sig_msg.emit( 'Could not create icons: {}'.format( e ) )
+                    continue
+                for path, icon in zip( chunk, icons ):
+                    if os.path.exists( icon ):
+                        self.sig_icon.emit( path, icon )
+
+        if not self.__preview:
+            return
+        for path in previews:
+            if self.__abort:
+                self.sig_msg.emit('Aborting')
+                break
+            try:
+                self.sig_preview.emit( path, create_gif( path ) )
+            except Exception as e:
+                self.sig_msg.emit( 'Could not create preview for {}: {}'.format( path, e ) )
+
     def abort( self ):
         msg = 'Worker #{} notified to abort'.format(self.__id)
         self.sig_msg.emit( msg )
@@ -699,42 +827,55 @@ class SourceUpdater( QObject ):
 
 
 class MediaStreamer( QObject ):
+    '''
+    MediaStreamer
+
+    Presentation thread: long_running() is the StreamController loop,
+    asleep until stream()/stop()/a new path is requested.  Changing
+    <path> while streaming switches to the new media.
+    '''
     finished = pyqtSignal()
 
     def __init__( self ):
         super(MediaStreamer, self).__init__()
-        self._running = False
-        self._exit    = False
-        self.x        = 0
-        self.y        = 0
-        self.width    = 640
-        self.height   = 480
-        self.display  = None
-        self.device   = '/dev/video20'
-        self.path     = None
-        
+        self.x          = 0
+        self.y          = 0
+        self.width      = 640
+        self.height     = 480
+        self.display    = None
+        self.devices    = [ '/dev/video20' ]
+        self.proxies    = False # Stream the proxies made for the media
+        self.size       = None  # ( width, height ) of the devices when known
+        self._path      = None
+        self.controller = StreamController( self.start_streaming )
+
+    @property
+    def path( self ):
+        return self._path
+
+    @path.setter
+    def path( self, value ):
+        changed    = value != self._path
+        self._path = value
+        if changed and self.isStreaming():
+            self.controller.switch()
+
     def isStreaming( self ):
-        return self._running
+        return self.controller.streaming
 
     def stream( self ):
-        self._running = True
+        self.controller.start()
 
     def stop( self ):
-        self._running = False
+        self.controller.stop()
 
     def exit( self ):
         print( 'Exiting' )
-        self._running = False
-        self._exit = True
+        print( 'Stream latencies: {}'.format( self.controller.summary() ) )
+        self.controller.exit()
 
     def long_running( self ):
-        while not self._exit:
-            if self._running:
-                print( 'Attempting to start stream' )
-                self.debug_parameters()
-                time.sleep(1)
-                self.start_streaming()
-
+        self.controller.run()
         self.finished.emit()
         print( '{0} finished'.format( __class__.__name__ ) )
 
@@ -743,17 +884,10 @@ class MediaStreamer( QObject ):
         print( '{0}: {1}'.format( 'y', self.y ) )
         print( '{0}: {1}'.format( 'width', self.width ) )
         print( '{0}: {1}'.format( 'height', self.height ) )
-        print( self.device )
-
-    def process_stream( self, stream ):
-        while stream.alive and self._running:
-            line  = stream.readline
-            if line is not None:
-                print( line )
-        stream.stop()
-        print( 'Bye' )
+        print( ', '.join( self.devices ) )
 
     def start_streaming( self ):
+        ''' Called by the controller, returns the new stream '''
         self.display = ':1'
         try:
             self.display = os.environ[ 'DISPLAY' ]
@@ -761,14 +895,22 @@ class MediaStreamer( QObject ):
             print( 'Could not detect DISPLAY variable (normally :0 or :1)' )
             pass
 
-
+        self.debug_parameters()
         print( 'Video Data: ', probe( self.path ) )
         #deep_probe( self.path )
-        stream = stream_media( self.path,
-                               self.device,
-                               True )
-
-        self.process_stream( stream )
+        # The proxy of the media when one has been made (see proxy.py),
+        # large enough for the devices when their size is known
+        proxy = ( self.size or True ) if self.proxies else False
+        if len( self.devices ) > 1:
+            # One decode for every device
+            return fanout_stream( self.path,
+                                  self.devices,
+                                  True,
+                                  proxy = proxy )
+        return stream_media( self.path,
+                             self.devices[ 0 ],
+                             True,
+                             proxy = proxy )
 
 
 # Main
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+'''
+Per frame cost of the compositor: one layer of each size blended into
+720p and 1080p frames, no decoding
+'''
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from v4l2tricks            import pixfmt
+from v4l2tricks.compositor import Compositor
+
+resolutions = { '720p' : ( 1280, 720 ), '1080p' : ( 1920, 1080 ) }
+
+def bench( width, height, pix_fmt, size, frames ):
+    comp  = Compositor( width, height, pix_fmt )
+    image = np.random.randint( 0, 256, ( size, size, 4 ) ).astype( np.uint8 )
+    comp.add( 'logo', image, width - size - 16, 16 )
+    frame = np.zeros( pixfmt.shape( width, height, pix_fmt ), dtype = np.uint8 )
+    for i in range( frames ):
+        comp.composite( frame )
+    return comp.cost
+
+def main( args ):
+    for name in args.resolution:
+        width, height = resolutions[ name ]
+        for pix_fmt in args.pix_fmt:
+            for size in args.size:
+                cost = bench( width, height, pix_fmt, size, args.frames )
+                print( '{0:>6} {1:<8} {2:>4}px layer: {3:8.1f} us/frame'.format( name, pix_fmt, size, cost * 1e6 ) )
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser( description='Benchmark the overlay compositor' )
+    parser.add_argument( '-n', '--frames', type = int, default = 1000,
+                         help = 'Frames per run (default: 1000)' )
+    parser.add_argument( '-r', '--resolution', nargs = '+', default = [ '720p', '1080p' ],
+                         choices = sorted( resolutions.keys() ) )
+    parser.add_argument( '-p', '--pix-fmt', nargs = '+', default = [ 'yuv420p', 'yuyv422', 'rgb24' ] )
+    parser.add_argument( '-s', '--size', type = int, nargs = '+', default = [ 64, 128, 256 ],
+                         help = 'Square layer sizes (default: 64 128 256)' )
+
+    # Parse the arguments
+    args = parser.parse_args()
+    main( args )
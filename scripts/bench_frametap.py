@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+'''
+Throughput of FrameTap (ffmpeg rawvideo -> NumPy) at 720p and 1080p
+'''
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from v4l2tricks.ffmpeg_if import FrameTap
+
+resolutions = { '720p' : ( 1280, 720 ), '1080p' : ( 1920, 1080 ) }
+
+def bench( width, height, pix_fmt, frames, source = None ):
+    if source is None:
+        # Cheap generator so the pipe and the copy dominate, not the decode
+        tap = FrameTap( 'color=c=gray:size={}x{}:rate=1000'.format( width, height ),
+                        width,
+                        height,
+                        pix_fmt,
+                        input_args = { 'f' : 'lavfi', 't' : frames / 1000.0 } )
+    else:
+        tap = FrameTap( source, width, height, pix_fmt )
+
+    t0 = time.time()
+    checksum = 0
+    for frame in tap:
+        checksum += int( frame[ 0, 0 ].sum() ) if frame.ndim > 1 else int( frame[0] )
+    elapsed = time.time() - t0
+    tap.stop()
+
+    fps  = tap.frames / elapsed if elapsed > 0 else 0.0
+    mbps = fps * tap.frame_size / ( 1024 * 1024 )
+    return tap.frames, elapsed, fps, mbps
+
+def main( args ):
+    for name in args.resolution:
+        width, height = resolutions[ name ]
+        for pix_fmt in args.pix_fmt:
+            frames, elapsed, fps, mbps = bench( width, height, pix_fmt, args.frames, args.source )
+            print( '{0:>6} {1:<8} {2:>6} frames in {3:6.2f}s: {4:8.1f} fps {5:8.1f} MB/s'.format(
+                name, pix_fmt, frames, elapsed, fps, mbps ) )
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser( description='Benchmark the rawvideo frame tap' )
+    parser.add_argument( '-n', '--frames', type = int, default = 600,
+                         help = 'Frames per run (default: 600)' )
+    parser.add_argument( '-r', '--resolution', nargs = '+', default = [ '720p', '1080p' ],
+                         choices = sorted( resolutions.keys() ) )
+    parser.add_argument( '-p', '--pix-fmt', nargs = '+', default = [ 'rgb24', 'yuv420p' ] )
+    parser.add_argument( '-s', '--source', default = None,
+                         help = 'Media file to decode instead of a generated source' )
+
+    # Parse the arguments
+    args = parser.parse_args()
+    main( args )
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+'''
+CPU of the planned stream graph (planner.plan) against the fixed one
+StreamProcess used before (every stream, scale=<width>:-1, forced
+pix_fmt), rawvideo to /dev/null as fast as ffmpeg goes
+'''
+import os
+import sys
+import shutil
+import tempfile
+import resource
+import subprocess
+
+import ffmpeg
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from v4l2tricks.ffmpeg_if import probe_info
+from v4l2tricks.planner   import plan
+
+def make_source( path, size, duration ):
+    '''
+    testsrc video and a sine audio track in one mkv
+    '''
+    video = ffmpeg.input( 'testsrc=size={}:rate=30'.format( size ), f='lavfi', t=duration )
+    audio = ffmpeg.input( 'sine=frequency=1000', f='lavfi', t=duration )
+    ffmpeg.output( video, audio, path, pix_fmt='yuv420p' ).overwrite_output().run( quiet = True )
+
+def fixed_graph( fname, width ):
+    return ffmpeg.input( fname ).output( '/dev/null', vf='scale={}:-1'.format( width ), pix_fmt='yuv420p', f='rawvideo' )
+
+def planned_graph( fname, info, width ):
+    p = plan( info, width if width != info[ 'width' ] else None, pix_fmt = 'yuv420p' )
+    stream = p.apply( ffmpeg.input( fname )[ 'v:0' ] ).output( '/dev/null', f='rawvideo', **p.output_args )
+    return stream, p
+
+def cpu( stream, runs ):
+    '''
+    Best of <runs>: user + system seconds of the ffmpeg process
+    '''
+    best = None
+    args = stream.compile( overwrite_output = True )
+    for i in range( runs ):
+        before = resource.getrusage( resource.RUSAGE_CHILDREN )
+        subprocess.run( args, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL, check = True )
+        after  = resource.getrusage( resource.RUSAGE_CHILDREN )
+        used   = ( after.ru_utime - before.ru_utime ) + ( after.ru_stime - before.ru_stime )
+        best   = used if best is None else min( best, used )
+    return best
+
+def main( args ):
+    workdir = tempfile.mkdtemp( prefix = 'bench_planner_' )
+    try:
+        for size in args.size:
+            fname = os.path.join( workdir, 'src_{}.mkv'.format( size ) )
+            make_source( fname, size, args.duration )
+            info  = probe_info( fname, cache = False )
+            for width in sorted( set( [ info[ 'width' ] ] + args.width ), reverse = True ):
+                fixed            = cpu( fixed_graph( fname, width ), args.runs )
+                planned, chosen  = planned_graph( fname, info, width )
+                planned          = cpu( planned, args.runs )
+                saved            = ( fixed - planned ) / fixed if fixed > 0 else 0.0
+                print( '{0:>9} -> width {1:<5} fixed {2:6.2f}s  planned {3:6.2f}s  saved {4:5.1%}  [{5}]'.format(
+                    size, width, fixed, planned, saved, chosen ) )
+                if args.verbose:
+                    print( '    ' + chosen.explain().replace( '\n', '\n    ' ) )
+    finally:
+        shutil.rmtree( workdir, ignore_errors = True )
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser( description='Benchmark the planned stream graph against the fixed one' )
+    parser.add_argument( '-s', '--size', nargs = '+', default = [ '1280x720', '853x481', '1920x1080' ],
+                         help = 'Generated source sizes (default: 1280x720 853x481 1920x1080)' )
+    parser.add_argument( '-w', '--width', type = int, nargs = '+', default = [ 640 ],
+                         help = 'Output widths besides the source width (default: 640)' )
+    parser.add_argument( '-d', '--duration', type = float, default = 10,
+                         help = 'Seconds of source (default: 10)' )
+    parser.add_argument( '-r', '--runs', type = int, default = 3,
+                         help = 'Best of <runs> (default: 3)' )
+    parser.add_argument( '-v', '--verbose',
+                         help   = 'Explain each planned graph',
+                         action = 'store_true' )
+
+    # Parse the arguments
+    args = parser.parse_args()
+    main( args )
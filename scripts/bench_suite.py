@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+'''
+Streaming benchmark suite: every stream variant, thumbnails, previews
+and the media walkers against generated sources, each case in its own
+process.  Results are saved as JSON and compared with a baseline.
+'''
+import os
+import sys
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from v4l2tricks import bench
+
+def main( args ):
+    workdir = args.workdir or tempfile.mkdtemp( prefix = 'bench_suite_' )
+    try:
+        fx = bench.Fixture( workdir,
+                            duration    = args.duration,
+                            size        = args.size,
+                            rate        = args.rate,
+                            files       = args.files,
+                            sink        = args.sink,
+                            display     = args.display,
+                            reader_rate = args.reader_rate )
+        results = bench.run_suite( fx, args.cases )
+    finally:
+        if not args.workdir:
+            shutil.rmtree( workdir, ignore_errors = True )
+
+    if args.output:
+        bench.save( results, args.output )
+        print( 'Results saved to {}'.format( args.output ) )
+
+    if args.baseline:
+        if not os.path.exists( args.baseline ):
+            bench.save( results, args.baseline )
+            print( 'No baseline yet, saved this run as {}'.format( args.baseline ) )
+            return 0
+        regressions = bench.compare( bench.load( args.baseline ), results, args.tolerance )
+        if not regressions:
+            print( 'No regressions against {}'.format( args.baseline ) )
+            return 0
+        print( '{} regression(s) against {}:'.format( len( regressions ), args.baseline ) )
+        for r in regressions:
+            print( '  ' + bench.format_regression( r ) )
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser( description='Benchmark streaming, previews and media walks' )
+    parser.add_argument( '-c', '--cases', nargs = '+', default = None, choices = list( bench.cases.keys() ),
+                         help = 'Cases to run (default: all)' )
+    parser.add_argument( '-d', '--duration', type = float, default = 5,
+                         help = 'Seconds of generated source (default: 5)' )
+    parser.add_argument( '-s', '--size', default = '1280x720',
+                         help = 'Size of the generated source (default: 1280x720)' )
+    parser.add_argument( '-r', '--rate', type = int, default = 30,
+                         help = 'Frame rate of the generated source (default: 30)' )
+    parser.add_argument( '-n', '--files', type = int, default = 20000,
+                         help = 'Files in the synthetic tree (default: 20000)' )
+    parser.add_argument( '--sink', choices = [ 'fifo', 'file' ], default = 'fifo',
+                         help = 'Where streams write: an emulated device or a file (default: fifo)' )
+    parser.add_argument( '--reader-rate', type = float, default = None,
+                         help = 'Frames per second the emulated device is read at (default: as fast as they come)' )
+    parser.add_argument( '--display', default = None,
+                         help = 'X display for the desktop case (default: a private Xvfb)' )
+    parser.add_argument( '-w', '--workdir', default = None,
+                         help = 'Keep the generated inputs here between runs' )
+    parser.add_argument( '-o', '--output', default = None,
+                         help = 'Save the results (JSON)' )
+    parser.add_argument( '-b', '--baseline', default = None,
+                         help = 'Compare with this result file, made from this run if missing' )
+    parser.add_argument( '-t', '--tolerance', type = float, default = bench.default_tolerance,
+                         help = 'Relative change flagged as a regression (default: {})'.format( bench.default_tolerance ) )
+
+    # Parse the arguments
+    args = parser.parse_args()
+    sys.exit( main( args ) )
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+'''
+Media walker throughput: fsutil.find and fsutil.discover (os.walk)
+against fsutil.walk_media (parallel os.scandir) on a synthetic tree
+'''
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from v4l2tricks           import fsutil
+from v4l2tricks.supported import MediaContainers
+from v4l2tricks.bench     import make_tree
+
+def timed( name, func, runs ):
+    best  = None
+    found = 0
+    for i in range( runs ):
+        t0    = time.time()
+        found = sum( 1 for f in func() )
+        elapsed = time.time() - t0
+        best  = elapsed if best is None else min( best, elapsed )
+    print( '{0:<24} {1:>7} found in {2:7.3f}s'.format( name, found, best ) )
+    return found
+
+def main( args ):
+    media_types = MediaContainers().extensions()
+    root = args.tree or tempfile.mkdtemp( prefix = 'bench_walk_' )
+    try:
+        if not args.tree:
+            t0    = time.time()
+            ndirs = make_tree( root, args.files, args.per_dir, args.fanout )
+            print( 'Made {0} files in {1} directories ({2:.1f}s)'.format( args.files, ndirs, time.time() - t0 ) )
+
+        timed( 'find',     lambda : fsutil.find( root, media_types ), args.runs )
+        timed( 'discover', lambda : fsutil.discover( root, media_types ), args.runs )
+        for workers in args.workers:
+            timed( 'walk_media workers={0}'.format( workers ),
+                   lambda : fsutil.walk_media( root, media_types, workers = workers ), args.runs )
+    finally:
+        if not args.tree:
+            shutil.rmtree( root, ignore_errors = True )
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser( description='Benchmark the media file walkers' )
+    parser.add_argument( '-n', '--files', type = int, default = 100000,
+                         help = 'Files in the synthetic tree (default: 100000)' )
+    parser.add_argument( '-d', '--per-dir', type = int, default = 50,
+                         help = 'Files per directory (default: 50)' )
+    parser.add_argument( '-f', '--fanout', type = int, default = 8,
+                         help = 'Subdirectories per directory (default: 8)' )
+    parser.add_argument( '-w', '--workers', type = int, nargs = '+', default = [ 1, 4, 16 ] )
+    parser.add_argument( '-r', '--runs', type = int, default = 3,
+                         help = 'Best of <runs> (default: 3)' )
+    parser.add_argument( '-t', '--tree', default = None,
+                         help = 'Walk an existing tree instead, e.g. an NFS or USB mount' )
+
+    # Parse the arguments
+    args = parser.parse_args()
+    main( args )
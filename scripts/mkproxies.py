@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+'''
+Make the device resolution proxies of a library ahead of streaming,
+stream_media then uses them in place of the originals for any device
+up to -W x -H
+'''
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from v4l2tricks.supported import MediaContainers
+from v4l2tricks           import fsutil
+from v4l2tricks.proxy     import ProxyCache, proxy_width, proxy_height, proxy_budget, proxy_nice
+
+def get_media( paths ):
+    media_types = MediaContainers().extensions()
+    media = []
+    for path in paths:
+        if os.path.isdir( path ):
+            media.extend( sorted( fsutil.walk_media( path, media_types ) ) )
+        else:
+            media.append( path )
+    return media
+
+def main( args ):
+    cache = ProxyCache( args.width, args.height,
+                        budget  = int( args.budget * 1024 * 1024 * 1024 ),
+                        nice    = args.nice,
+                        verbose = args.verbose )
+    media = get_media( args.path )
+    print( 'Making {}x{} proxies of {} files'.format( args.width, args.height, len( media ) ) )
+    t0 = time.time()
+    for fname in media:
+        cache.request( fname )
+    for fname in media:
+        cache.ready( fname )
+    cache.stop()
+    print( 'Made {} proxies, {} not needed, {} failed in {:.1f}s ({} bytes cached)'.format(
+        cache.made, cache.skipped, cache.failed, time.time() - t0, cache.size ) )
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser( description='Transcode media to cheap to decode proxies at device resolution' )
+    parser.add_argument( 'path', nargs = '+', help = 'Media files or folders' )
+    parser.add_argument( '-W', '--width', type = int, default = proxy_width,
+                         help = 'Device width (default: {})'.format( proxy_width ) )
+    parser.add_argument( '-H', '--height', type = int, default = proxy_height,
+                         help = 'Device height (default: {})'.format( proxy_height ) )
+    parser.add_argument( '-b', '--budget', type = float, default = proxy_budget / float( 1024 ** 3 ),
+                         help = 'Cache size in GiB (default: {:g})'.format( proxy_budget / float( 1024 ** 3 ) ) )
+    parser.add_argument( '-n', '--nice', type = int, default = proxy_nice,
+                         help = 'Niceness of the transcodes (default: {})'.format( proxy_nice ) )
+    parser.add_argument( '-v', '--verbose',
+                         help   = 'Increase verbosity',
+                         action = 'store_true' )
+
+    # Parse the arguments
+    args = parser.parse_args()
+    main( args )
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+'''
+Run several streams under one CPU budget (see orchestrator.py): each
+SOURCE=DEVICE pair is admitted, pinned and niced, utilization is
+printed until every stream ends or ctrl-c
+'''
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from v4l2tricks.orchestrator import Orchestrator, Budget, Saturated, max_load
+from v4l2tricks.sink         import EmulatorSink
+
+def main( args ):
+    orch = Orchestrator( cpus     = args.cpus,
+                         reserve  = args.reserve,
+                         max_load = args.max_load,
+                         budget   = Budget( args.cores, args.nice, threads = args.threads ),
+                         degrade  = not args.no_degrade,
+                         verbose  = args.verbose )
+    for i, pair in enumerate( args.streams ):
+        source, sep, device = pair.partition( '=' )
+        if not sep:
+            device = '/dev/video{}'.format( 20 + i )
+        if args.emulate is not None:
+            device = EmulatorSink( rate = args.emulate or None, verbose = args.verbose )
+        try:
+            orch.stream_media( source, device, args.verbose, loop = args.loop )
+        except Saturated as e:
+            print( 'Refused {}: {}'.format( source, e ) )
+
+    orch.sample()
+    try:
+        while len( orch ):
+            time.sleep( args.report )
+            print( orch.summary() )
+    except KeyboardInterrupt:
+        pass
+    orch.stop_all()
+    print( 'Bye' )
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser( description='Stream several sources under one CPU budget' )
+    parser.add_argument( 'streams', nargs = '+',
+                         help = 'SOURCE[=DEVICE], devices default to /dev/video20, /dev/video21, ...' )
+    parser.add_argument( '-c', '--cores', type = float, default = 1.0,
+                         help = 'Cores per stream (default: 1)' )
+    parser.add_argument( '-n', '--nice', type = int, default = 5,
+                         help = 'Niceness of the streams (default: 5)' )
+    parser.add_argument( '-t', '--threads', type = int, default = None,
+                         help = 'ffmpeg threads per stream (default: the cores rounded up)' )
+    parser.add_argument( '--cpus', type = int, nargs = '+', default = None,
+                         help = 'Cpus to use (default: all this process may run on)' )
+    parser.add_argument( '-r', '--reserve', type = int, default = None,
+                         help = 'Cpus left to the host (default: 1 with more than 2 cpus)' )
+    parser.add_argument( '-m', '--max-load', type = float, default = max_load,
+                         help = 'Share of the cpus streams may take (default: {})'.format( max_load ) )
+    parser.add_argument( '--no-degrade',
+                         help   = 'Refuse streams that do not fit instead of degrading them',
+                         action = 'store_true' )
+    parser.add_argument( '-e', '--emulate', type = float, default = None,
+                         help = 'Stream to emulated devices read at EMULATE fps (0: as fast as they come)' )
+    parser.add_argument( '-l', '--loop',
+                         help   = 'Loop the sources',
+                         action = 'store_true' )
+    parser.add_argument( '--report', type = float, default = 2.0,
+                         help = 'Seconds between reports (default: 2)' )
+    parser.add_argument( '-v', '--verbose',
+                         help   = 'Increase verbosity',
+                         action = 'store_true' )
+
+    # Parse the arguments
+    args = parser.parse_args()
+    main( args )
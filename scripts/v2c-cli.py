@@ -3,12 +3,15 @@ import os
 import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from v4l2tricks.stream    import stream_media
+from v4l2tricks.stream    import stream_media, switch_stream
 from v4l2tricks.supported import MediaContainers
 from v4l2tricks           import fsutil
+from v4l2tricks.scanner   import IncrementalScanner
+from v4l2tricks.prefetch  import Prefetcher
 
 import cmd
 import pdb
+import time
 def line2index( line ):
     index = None
     try:
@@ -21,7 +24,7 @@ def line2index( line ):
 def get_media( path ):
     containers = MediaContainers()
     media_types = containers.extensions()
-    return fsutil.find( args.path, media_types )
+    return sorted( fsutil.walk_media( path, media_types ) )
 
 class AppMode( object ):
     STOPPED = 0
@@ -62,6 +65,9 @@ class v2cConsole( cmd.Cmd ):
     stream      = None
     sink        = '/dev/video20'
     loaded      = set()
+    warm        = 2    # Pre-started decoders, 0 starts a new ffmpeg per source
+    latencies   = []   # ( source, switch latency, warm )
+    prefetcher  = None # Reads ahead and probes the next sources
     prompt_tmpl = '([ {0} : {1} ]{2})\n(!>)'
     prompt      = prompt_tmpl.format( str( state ), sink, '' )
 
@@ -70,22 +76,67 @@ class v2cConsole( cmd.Cmd ):
         containers  = MediaContainers()
         media_types = containers.extensions()
 
-        found = None
+        if not os.path.exists( path ):
+            print( 'Finished!' )
+            return
+
+        # Only what changed since the last load of <path> is walked and reported
         pre_load = len( self.loaded )
-        if os.path.exists( path ):
-            found = fsutil.find( path, media_types )
-            self.loaded.update( found )
+        scanner  = IncrementalScanner( path, media_types )
+        diff     = scanner.scan()
+        self.loaded.difference_update( diff.removed )
+        self.loaded.update( scanner.files )
 
-        if found is not None:
+        if diff.added:
             print( 'Loaded:' )
-            for i, fname in enumerate( self.loaded ):
-                print( '[{0}]: {1}'.format( i, fname ) )
+            for fname in diff.added:
+                print( '  {0}'.format( fname ) )
+        for fname in diff.removed:
+            print( 'Removed: {0}'.format( fname ) )
+        for fname in diff.modified:
+            print( 'Modified: {0}'.format( fname ) )
         print( 'Finished!' )
-        num_found = len( found )
+        num_found = len( scanner.files )
         post_load = len( self.loaded )
         total_loaded = post_load - pre_load
-        print( 'Found {0}, new media loaded {1}'.format( num_found,
-                                                         total_loaded ) )
+        print( 'Found {0} ({1} directories read), new media loaded {2}'.format( num_found,
+                                                                                scanner.listed,
+                                                                                total_loaded ) )
+
+    def play( self, source ):
+        '''
+        Make <source> the active stream, warm up the sources after it
+        '''
+        print( 'Source: {0}'.format( source ) )
+        loaded = list( self.loaded )
+        index  = loaded.index( source ) if source in loaded else -1
+        queued = [ loaded[ ( index + i ) % len( loaded ) ] for i in range( 1, max( 1, self.warm ) + 1 ) ]
+        queued = [ q for q in queued if q != source ]
+        if self.prefetcher is None:
+            self.prefetcher = Prefetcher()
+
+        if self.warm > 0:
+            if self.stream is None or not self.stream.alive:
+                self.stream = switch_stream( source, self.sink, self.warm )
+                self.stream.switches = self.latencies # Shared history
+                self.prefetcher.pool = self.stream.pool
+            self.stream.switch( source )
+            # Read ahead, probed and decoders started in the background
+            for q in queued:
+                self.prefetcher.prefetch( q )
+            return
+
+        # Cold: a new ffmpeg, latency up to its first frame out
+        self.do_stop( 'Stop' )
+        t0 = time.time()
+        self.stream = stream_media( source, self.sink )
+        def first_frame( snapshot, stream = self.stream ):
+            if ( snapshot.get( 'frame' ) or 0 ) > 0:
+                stream.metrics.unsubscribe( first_frame )
+                self.latencies.append( ( source, time.time() - t0, False ) )
+        self.stream.metrics.subscribe( first_frame )
+        for q in queued:
+            self.prefetcher.prefetch( q )
 
     def update_state( self ):
         self.state.mode = AppMode.STOPPED
@@ -169,9 +220,7 @@ class v2cConsole( cmd.Cmd ):
         except ValueError as e:
             source = None
 
-        self.do_stop('Stop')
-        print( 'Source: {0}'.format( source ) )
-        self.stream = stream_media( source, self.sink )
+        self.play( source )
 
 
     def help_n( self ):
@@ -227,8 +276,7 @@ class v2cConsole( cmd.Cmd ):
             except ValueError as e:
                 source = None
 
-            print( 'Source: {0}'.format( source ) )
-            self.stream = stream_media( source, self.sink )
+            self.play( source )
 
     def complete_stream( self, text, line, begidx, endidx ):
         loaded = list( self.loaded )
@@ -248,6 +296,24 @@ class v2cConsole( cmd.Cmd ):
         print( '\n'.join( [ 'stream',
                             'Stream media to v4l2loopback device' ] ) )
 
+    def do_latency( self, line ):
+        '''
+        Show switch latencies
+        '''
+        for source, latency, warm in self.latencies:
+            print( '{0:7.3f}s {1:<4} {2}'.format( latency, 'warm' if warm else 'cold', os.path.basename( source ) ) )
+        for kind in ( True, False ):
+            values = [ l for s, l, w in self.latencies if w == kind ]
+            if values:
+                print( '{0}: n={1} mean={2:.3f}s max={3:.3f}s'.format( 'warm' if kind else 'cold',
+                                                                      len( values ),
+                                                                      sum( values ) / len( values ),
+                                                                      max( values ) ) )
+
+    def help_latency( self ):
+        print( '\n'.join( [ 'latency',
+                            'Switch latencies (command to first frame out)' ] ) )
+
     def do_stop( self, line ):
         '''
         Stop active stream
@@ -259,6 +325,9 @@ class v2cConsole( cmd.Cmd ):
         if self.stream.alive:
             print( 'Stopping Stream' )
             self.stream.stop()
+        if self.prefetcher is not None:
+            # The stream's decoders went with it
+            self.prefetcher.pool = None
 
     def help_stop( self ):
         print( '\n'.join( [ 'stop', 'Stops the active stream' ] ) )
@@ -326,6 +395,7 @@ def main( args ):
         console.load_sources( args.source )
 
     console.update_sink( args.out )
+    console.warm = args.warm
     console.cmdloop()
 
 
@@ -348,6 +418,10 @@ if __name__ == '__main__':
     parser.add_argument( '-o', '--out',
                          help = 'Device to stream to ("/dev/video20")',
                          default = '/dev/video20' )
+    parser.add_argument( '-w', '--warm',
+                         help = 'Decoders kept pre-started for the next sources, 0 starts ffmpeg per source (2)',
+                         type = int,
+                         default = 2 )
 
     # Parse the arguments
     args = parser.parse_args()
@@ -1,21 +1,67 @@
 #!/usr/bin/env python
 import os
 import sys
+import time
 from time import sleep
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from v4l2tricks.stream    import stream_media, overlay_stream, desktop_stream
+from v4l2tricks.stream    import stream_media, fanout_stream, overlay_stream, composite_stream, desktop_stream, playout_stream, parse_target, Target
 from v4l2tricks.supported import MediaContainers
 from v4l2tricks           import fsutil
-
-def process_stream( stream ):
+from v4l2tricks.prefetch  import Prefetcher
+from v4l2tricks.sink      import EmulatorSink
+
+def output( args ):
+    '''
+    The device, or an emulated one read at <args.emulate> fps
+    '''
+    if args.emulate is None:
+        return args.out
+    return EmulatorSink( rate = args.emulate or None, verbose = args.verbose )
+
+def targets( args ):
+    '''
+    Every -o as a Target (see parse_target), emulated with -e
+    '''
+    result = []
+    for spec in args.out or [ '/dev/video20' ]:
+        target = parse_target( spec )
+        if args.emulate is not None:
+            target = target._replace( device = EmulatorSink( rate = args.emulate or None, verbose = args.verbose ) )
+        result.append( target )
+    return result
+
+def stream_to( source, outs, verbose, loop = False ):
+    '''
+    One device as is: stream_media.  Several, or sizes/formats given:
+    one decode fanned out to all of them
+    '''
+    first = outs[ 0 ]
+    if len( outs ) == 1 and first._replace( device = None ) == Target( None ):
+        return stream_media( source, first.device, verbose, loop = loop )
+    return fanout_stream( source, outs, verbose, loop = loop )
+
+def process_stream( stream, report = 2.0 ):
+    last = time.time()
     while stream.alive:
         try:
             line  = stream.readline
             if line is not None:
                 print( line )
+
+            # Throughput every <report> seconds
+            if time.time() - last >= report:
+                last = time.time()
+                print( stream.metrics.summary() )
+                for sink in stream.outputs:
+                    if isinstance( sink, EmulatorSink ):
+                        print( 'reader: ' + sink.summary() )
         except KeyboardInterrupt:
             pass
+    stream.stop()
+    for sink in stream.outputs:
+        if isinstance( sink, EmulatorSink ):
+            print( 'reader: ' + sink.summary() )
     print( 'Bye' )
 
 # Stream the desktop to device
@@ -33,17 +79,22 @@ def dsk_stream( args ):
                              args.width,
                              args.height,
                              display,
-                             args.out,
+                             output( args ),
                              args.verbose )
     process_stream( stream )
 
 
 # Stream a media files to device
 def fil_stream(args):
+    outs = targets( args )
     if args.overlay is None:
-        stream = stream_media( args.source, args.out, args.verbose )
+        stream = stream_to( args.source, outs, args.verbose, loop = args.loop )
     else:
-        stream = overlay_stream( args.source, args.overlay, args.out, args.verbose )
+        if len( outs ) > 1: print( 'The overlay is streamed to {} only'.format( outs[ 0 ].device ) )
+        if args.composite:
+            stream = composite_stream( args.source, [ ( 'overlay', args.overlay, 10, 10 ) ], outs[ 0 ].device, verbose = args.verbose )
+        else:
+            stream = overlay_stream( args.source, args.overlay, outs[ 0 ].device, args.verbose )
 
     print( 'Streaming: {0}'.format( stream.alive ) )
     process_stream( stream )
@@ -56,10 +107,29 @@ def dir_stream( args ):
     media_types = containers.extensions()
     print( media_types )
 
-    found = fsutil.find( args.path, media_types )
+    found = sorted( fsutil.walk_media( args.path, media_types ) )
+    outs  = targets( args )
+    if args.gapless:
+        if len( found ) == 0:
+            print( 'Nothing to play' )
+            return
+        if len( outs ) > 1: print( 'Gapless playout goes to {} only'.format( outs[ 0 ].device ) )
+        stream = playout_stream( found, outs[ 0 ].device, args.loop, args.verbose )
+        process_stream( stream )
+        for source, latency in stream.transitions:
+            print( '{0:.3f}s -> {1}'.format( latency, source ) )
+        print( 'Finished' )
+        return
+
+    # Item N+1 is read ahead and probed while item N plays
+    prefetcher = Prefetcher( verbose = args.verbose )
     while True:
-        for source in found:
-            stream = stream_media( source, args.out, args.verbose )
+        for i, source in enumerate( found ):
+            stream = stream_to( source, outs, args.verbose )
+            if i + 1 < len( found ):
+                prefetcher.prefetch( found[ i + 1 ] )
+            elif args.loop:
+                prefetcher.prefetch( found[0] )
             while stream.alive:
                 try:
                     if args.verbose: print( stream.readline )
@@ -85,6 +155,12 @@ if __name__ == '__main__':
     parser.add_argument( '-v', '--verbose',
                          help   = 'Increase verbosity',
                          action ='store_true' )
+    parser.add_argument( '-e', '--emulate',
+                         help    = 'No device: stream to an emulated one read at EMULATE fps (0: as fast as it can) and report what its reader sees',
+                         type    = float,
+                         nargs   = '?',
+                         const   = 0,
+                         default = None )
 
     # Create subparser
     subparsers = parser.add_subparsers( help='Sub-commands' )
@@ -96,10 +172,14 @@ if __name__ == '__main__':
     parser_fil.add_argument( 'source',
                              help = 'Source to stream' )
     parser_fil.add_argument( '-o', '--out',
-                             help = 'Device to stream to ("/dev/video20")',
-                             default = '/dev/video20' )
+                             help   = 'Device to stream to ("/dev/video20"), repeat to decode once for several: DEVICE[:WxH][:PIX_FMT]',
+                             action = 'append',
+                             default = None )
     parser_fil.add_argument( '--overlay',
                              help = 'Overlay input', default = None  )
+    parser_fil.add_argument( '--composite',
+                             help   = 'Blend the overlay in Python (compositor) instead of an ffmpeg filter',
+                             action = 'store_true' )
     parser_fil.set_defaults( func = fil_stream )
 
     #-------------------------
@@ -108,8 +188,12 @@ if __name__ == '__main__':
     parser_dir = subparsers.add_parser( 'dir', help = 'Stream files in directory subtree to device' )
     parser_dir.add_argument( 'path', help = 'Path to media files.' )
     parser_dir.add_argument( '-o', '--out',
-                             help = 'Device to stream to ("/dev/video20")',
-                             default = '/dev/video20' )
+                             help   = 'Device to stream to ("/dev/video20"), repeat to decode once for several: DEVICE[:WxH][:PIX_FMT]',
+                             action = 'append',
+                             default = None )
+    parser_dir.add_argument( '-g', '--gapless',
+                             help   = 'Keep one writer on the device for the whole list',
+                             action = 'store_true' )
 
     parser_dir.set_defaults( func = dir_stream )
 
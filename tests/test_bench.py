@@ -0,0 +1,67 @@
+import os
+import sys
+import tempfile
+import subprocess
+
+# Add the project root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from v4l2tricks import bench, ffmpeg_if
+
+def results( **cases ):
+    return { 'cases' : cases }
+
+def test_compare():
+    base = results( stream = { 'status' : 'ok', 'first_frame' : 0.20, 'fps' : 30.0, 'cpu' : 1.0, 'spawns' : 2 },
+                    find   = { 'status' : 'ok', 'wall' : 1.00 } )
+
+    # Within tolerance or under the noise floor
+    same = results( stream = { 'status' : 'ok', 'first_frame' : 0.22, 'fps' : 29.5, 'cpu' : 1.1, 'spawns' : 2 },
+                    find   = { 'status' : 'ok', 'wall' : 0.50 } )
+    assert bench.compare( base, same ) == []
+
+    worse = results( stream = { 'status' : 'ok', 'first_frame' : 0.40, 'fps' : 20.0, 'cpu' : 1.0, 'spawns' : 3 },
+                     find   = { 'status' : 'failed' } )
+    regressions = bench.compare( base, worse )
+    for r in regressions:
+        print( bench.format_regression( r ) )
+    assert [ ( r.case, r.metric ) for r in regressions ] == [ ( 'stream', 'first_frame' ),
+                                                               ( 'stream', 'fps' ),
+                                                               ( 'stream', 'spawns' ) ]
+    assert abs( regressions[0].change - 1.0 ) < 1e-9
+
+def test_run_case():
+    with tempfile.TemporaryDirectory() as tmp:
+        fx = bench.Fixture( tmp, files = 400 )
+        results = bench.run_suite( fx, [ 'find', 'walk_media' ] )
+        save = os.path.join( tmp, 'results.json' )
+        bench.save( results, save )
+        loaded = bench.load( save )
+        for name in ( 'find', 'walk_media' ):
+            result = loaded[ 'cases' ][ name ]
+            print( bench.format_case( name, result ) )
+            assert result[ 'status' ] == 'ok'
+            assert result[ 'items' ] >= 100 # A quarter is media
+            assert result[ 'spawns' ] == 0
+            assert result[ 'peak_rss' ] > 0
+        assert loaded[ 'cases' ][ 'find' ][ 'items' ] == loaded[ 'cases' ][ 'walk_media' ][ 'items' ]
+        assert bench.compare( loaded, results ) == []
+
+def test_count_spawns():
+    spawns, hook = bench.count_spawns()
+    try:
+        # Helpers started with Popen are not ffmpeg runs
+        subprocess.Popen( [ sys.executable, '-c', 'pass' ] ).wait()
+        ffmpeg_if._spawned( [ 'ffmpeg', '-i', 'in.mp4', 'out.jpg' ] )
+        ffmpeg_if._spawned( [ 'ffprobe', 'in.mp4' ] )
+    finally:
+        ffmpeg_if.spawn_hooks.remove( hook )
+    ffmpeg_if._spawned( [ 'ffmpeg' ] )
+    assert spawns[0] == 2
+
+def main():
+    test_compare()
+    test_count_spawns()
+    test_run_case()
+
+if __name__ == '__main__':
+    main()
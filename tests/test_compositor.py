@@ -0,0 +1,132 @@
+import os
+import sys
+
+import numpy as np
+
+# Add the project root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from v4l2tricks import compositor, pixfmt
+from v4l2tricks.sink import EmulatorSink
+
+W, H = 64, 48
+rng  = np.random.RandomState( 1 )
+logo = rng.randint( 0, 256, ( 10, 13, 4 ) ).astype( np.uint8 )
+logo[ :2, :, 3 ] = 0 # Transparent rows, cropped away
+
+def over( dst, src, alpha ):
+    return src * alpha + dst * ( 1.0 - alpha )
+
+def reference( frame, x, y, image ):
+    '''
+    Straight alpha blend in float, clipped to the frame
+    '''
+    out  = frame.astype( np.float64 )
+    h, w = image.shape[ :2 ]
+    ys, xs = slice( max( y, 0 ), min( y + h, H ) ), slice( max( x, 0 ), min( x + w, W ) )
+    ly, lx = slice( ys.start - y, ys.stop - y ), slice( xs.start - x, xs.stop - x )
+    out[ ys, xs ] = over( out[ ys, xs ], image[ ly, lx, :3 ], image[ ly, lx, 3: ] / 255.0 )
+    return out
+
+def test_rgb():
+    for x, y in ( ( 5, 7 ), ( -4, -3 ), ( 58, 40 ), ( 100, 100 ) ):
+        comp  = compositor.Compositor( W, H, 'rgb24' )
+        comp.add( 'logo', logo, x, y )
+        frame = rng.randint( 0, 256, ( H, W, 3 ) ).astype( np.uint8 )
+        ref   = reference( frame, x, y, logo )
+        assert comp.composite( frame ) is frame
+        error = np.abs( frame - ref ).max()
+        print( 'rgb24 at {},{}: max error {:.2f}'.format( x, y, error ) )
+        assert error < 2.0
+
+def test_yuv420p():
+    x, y  = 6, 4
+    comp  = compositor.Compositor( W, H, 'yuv420p' )
+    comp.add( 'logo', logo, x, y )
+    frame = rng.randint( 16, 236, pixfmt.shape( W, H, 'yuv420p' ) ).astype( np.uint8 )
+    before = [ p.astype( np.float64 ) for p in compositor.planes( frame, W, H, 'yuv420p' ) ]
+    comp.composite( frame )
+    after  = compositor.planes( frame, W, H, 'yuv420p' )
+
+    # Luma per pixel, chroma per 2x2 block with the block's mean alpha
+    rgba = np.zeros( ( H, W, 4 ) )
+    rgba[ y:y + logo.shape[0], x:x + logo.shape[1] ] = logo
+    yuv   = np.dot( rgba[ :, :, :3 ], np.array( compositor.yuv_matrix ).T ) / 255.0 + np.array( compositor.yuv_offset )
+    alpha = rgba[ :, :, 3 ] / 255.0
+    block = lambda a : a.reshape( H // 2, 2, W // 2, 2 ).mean( axis = ( 1, 3 ) )
+    assert np.abs( after[0] - over( before[0], yuv[ :, :, 0 ], alpha ) ).max() < 2.0
+    for i in ( 1, 2 ):
+        ref = block( yuv[ :, :, i ] * alpha ) + before[ i ] * ( 1.0 - block( alpha ) )
+        assert np.abs( after[ i ] - ref ).max() < 2.0
+
+    # Packed 4:2:2 and nv12 touch only the layer's region
+    for pix_fmt in ( 'yuyv422', 'uyvy422', 'nv12' ):
+        comp  = compositor.Compositor( W, H, pix_fmt )
+        comp.add( 'logo', logo, 31, 20 )
+        frame = np.zeros( pixfmt.shape( W, H, pix_fmt ), dtype = np.uint8 )
+        comp.composite( frame )
+        touched = np.argwhere( compositor.planes( frame, W, H, pix_fmt )[0] )
+        assert touched[ :, 0 ].min() >= 22 and touched[ :, 1 ].min() >= 30
+
+def test_layers():
+    comp = compositor.Compositor( W, H, 'rgb24' )
+    red  = np.zeros( ( 4, 4, 4 ), dtype = np.uint8 )
+    red[ :, :, 0 ], red[ :, :, 3 ] = 255, 255
+    comp.add( 'a', red, 0, 0 )
+    comp.add( 'b', red.copy(), 10, 10 ) # Same image: converted once
+    assert comp.names() == [ 'a', 'b' ] and len( comp._cache ) == 1
+    comp.add( 'rgb', red[ :, :, :3 ], 30, 30 ) # Opaque without alpha
+
+    frame = np.zeros( ( H, W, 3 ), dtype = np.uint8 )
+    comp.composite( frame )
+    assert frame[ 0, 0, 0 ] == 255 and frame[ 10, 10, 0 ] == 255 and frame[ 33, 33, 0 ] == 255
+    comp.remove( 'rgb' )
+
+    # Moved, faded and removed without a new compositor
+    comp.move( 'a', 20, 20 )
+    comp.set_opacity( 'b', 0.5 )
+    comp.remove( 'missing' )
+    frame[ : ] = 0
+    comp.composite( frame )
+    assert frame[ 0, 0, 0 ] == 0 and frame[ 20, 20, 0 ] == 255
+    assert 126 <= frame[ 10, 10, 0 ] <= 128
+    comp.remove( 'a' )
+    assert 'a' not in comp and len( comp ) == 1
+
+    # Fully transparent: nothing to blend
+    comp.add( 'c', np.zeros( ( 8, 8, 4 ), dtype = np.uint8 ) )
+    comp.composite( frame )
+    comp.clear()
+    assert len( comp ) == 0 and comp.frames == 3
+
+    # A fade keeps only the step shown, a removed layer keeps nothing
+    comp.add( 'fade', red )
+    for i in range( 50 ):
+        comp.set_opacity( 'fade', i / 50.0 )
+    assert len( comp._cache ) == 1 and len( comp._images ) == 1
+    comp.remove( 'fade' )
+    assert comp._cache == {} and comp._images == {}
+    print( 'cost: {:.1f}us'.format( comp.cost * 1e6 ) )
+
+def test_failed_tap():
+    def tap( *args, **kwargs ):
+        raise OSError( 'no ffmpeg' )
+    frame_tap, compositor.FrameTap = compositor.FrameTap, tap
+    emulated = EmulatorSink()
+    try:
+        compositor.CompositeStream( 'in.mp4', emulated, width = W, height = H, verbose = False )
+        assert False, 'Started'
+    except OSError as e:
+        pass
+    finally:
+        compositor.FrameTap = frame_tap
+    # The device (here an emulator's reader and FIFO) is not left open
+    assert emulated._reader is None and not os.path.exists( emulated.target )
+
+def main():
+    test_rgb()
+    test_yuv420p()
+    test_layers()
+    test_failed_tap()
+
+if __name__ == '__main__':
+    main()
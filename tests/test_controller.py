@@ -0,0 +1,119 @@
+import os
+import sys
+import time
+import threading
+
+# Add the project root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from v4l2tricks.controller import StreamController, STREAMING, IDLE, EXITED
+from v4l2tricks.progress   import StreamMetrics
+
+class FakeStream( object ):
+    ''' Stands in for a StreamProcess, ends on stop() or end() '''
+    def __init__( self ):
+        self.metrics = StreamMetrics()
+        self._done   = threading.Event()
+        self.stopped = False
+
+    def wait( self, timeout = None ):
+        self._done.wait( timeout )
+
+    def end( self ):
+        self._done.set()
+
+    def stop( self ):
+        self.stopped = True
+        self._done.set()
+
+def wait_for( predicate, timeout = 2.0 ):
+    end = time.time() + timeout
+    while time.time() < end:
+        if predicate():
+            return True
+        time.sleep( 0.005 )
+    return False
+
+def test_lifecycle():
+    launched = []
+    def launch():
+        launched.append( FakeStream() )
+        return launched[-1]
+
+    controller = StreamController( launch, restart = False, verbose = False )
+    controller.spawn()
+    assert controller.state == IDLE
+
+    controller.start()
+    assert wait_for( lambda : controller.state == STREAMING )
+    assert len( launched ) == 1
+
+    # First frame out
+    for line in [ 'frame=1', 'progress=continue' ]:
+        launched[0].metrics.feed( line )
+    assert len( controller.latencies[ 'first_frame' ] ) == 1
+
+    controller.switch()
+    assert wait_for( lambda : len( launched ) == 2 and controller.state == STREAMING )
+    assert launched[0].stopped
+
+    controller.stop()
+    assert wait_for( lambda : controller.state == IDLE )
+    assert launched[1].stopped
+    assert not controller.streaming
+
+    for kind in ( 'start', 'switch', 'stop' ):
+        assert len( controller.latencies[ kind ] ) == 1, kind
+    print( controller.summary() )
+
+    controller.exit( timeout = 2.0 )
+    assert controller.state == EXITED
+
+def test_restart():
+    launched = []
+    def launch():
+        launched.append( FakeStream() )
+        return launched[-1]
+
+    controller = StreamController( launch, restart = True, verbose = False, backoff = 0.05 )
+    controller.spawn()
+    controller.start()
+    assert wait_for( lambda : len( launched ) == 1 )
+
+    # Ends by itself, started again while wanted
+    launched[0].end()
+    assert wait_for( lambda : len( launched ) == 2 and controller.state == STREAMING )
+
+    controller.exit( timeout = 2.0 )
+    assert launched[1].stopped
+
+def test_backoff():
+    launched = []
+    def launch():
+        # Dies at once, like ffmpeg without its device
+        launched.append( time.time() )
+        stream = FakeStream()
+        stream.end()
+        return stream
+
+    controller = StreamController( launch, restart = True, verbose = False,
+                                   backoff = 0.05, max_failures = 3 )
+    controller.spawn()
+    controller.start()
+    assert wait_for( lambda : controller.error is not None and controller.state == IDLE )
+    assert len( launched ) == 4 and not controller.streaming
+    gaps = [ b - a for a, b in zip( launched, launched[ 1: ] ) ]
+    print( 'gaps: {}'.format( ' '.join( '{:.3f}'.format( gap ) for gap in gaps ) ) )
+    assert gaps[0] >= 0.05 and gaps[1] >= 0.1 and gaps[2] >= 0.2
+
+    # A new request starts over
+    controller.start()
+    assert wait_for( lambda : len( launched ) >= 5 )
+    controller.exit( timeout = 2.0 )
+
+def main():
+    test_lifecycle()
+    test_restart()
+    test_backoff()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+import os
+import sys
+import tempfile
+
+# Add the project root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from v4l2tricks import emulator
+
+def test_reader_stats():
+    stats = emulator.ReaderStats( rate = 10 )
+    now = 0.0
+    for i in range( 10 ):
+        stats.frame( 100, now )
+        now += 0.35 if i == 5 else 0.1
+    result = stats.as_dict()
+    print( result )
+    assert result[ 'frames' ] == 10
+    assert result[ 'bytes' ] == 1000
+    assert result[ 'stalls' ] == 1
+    assert abs( result[ 'max_ms' ] - 350.0 ) < 1e-6
+    assert abs( result[ 'interval_ms' ] - 1150.0 / 9 ) < 1e-6
+    assert result[ 'jitter_ms' ] > 0
+
+    # Without a rate the mean interval so far is the frame period
+    steady = emulator.ReaderStats()
+    for i in range( 10 ):
+        steady.frame( 100, i * 0.04 )
+    assert steady.as_dict()[ 'stalls' ] == 0
+    assert abs( steady.as_dict()[ 'fps' ] - 25.0 ) < 1e-6
+
+def test_consume():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join( tmp, 'frames.raw' )
+        with open( path, 'wb' ) as f:
+            f.write( bytes( 5 * 64 + 10 ) ) # A partial frame at the end
+        reports = []
+        result = emulator.consume( path, 64, on_report = reports.append )
+        assert result[ 'frames' ] == 5
+        assert reports[-1] == result
+
+def main():
+    test_reader_stats()
+    test_consume()
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,13 @@
 import os
 import sys
 import pdb
+import tempfile
 
 # Add the project root to the path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from v4l2tricks import ffmpeg_if
+from v4l2tricks import ffmpeg_if, pixfmt, stream
+from v4l2tricks.planner import plan
+from v4l2tricks.sink    import DeviceSink, EmulatorSink
         
 m = './testsrc.mp4'
 
@@ -23,6 +26,14 @@ def test_thumbnail():
 
     ffmpeg_if.jpgs2gif( 'preview_%03d.jpg' )
 
+def test_thumbnails():
+    duration = ffmpeg_if.probe_duration( m )
+    jobs = [ ( m, 'batch_{:03}.jpg'.format( i ), duration * i / 10.0 ) for i in range( 1, 10 ) ]
+    jobs.append( ( './missing.mp4', 'batch_missing.jpg', 0.1 ) )
+    failures = ffmpeg_if.generate_thumbnails( jobs, batch = 4 )
+    print( 'failures: {}'.format( failures ) )
+    assert list( failures.keys() ) == [ 'batch_missing.jpg' ]
+
 def test_gif():
     print( 'Generating gif' )
     duration = ffmpeg_if.probe_duration( m )
@@ -31,15 +42,219 @@ def test_gif():
 
     ffmpeg_if.generate_gif( m, 'test.gif', time = timestamp( duration, 3 ), duration =3 )
     
+def test_previews():
+    print( 'Generating previews' )
+    duration = ffmpeg_if.probe_duration( m )
+    times    = ffmpeg_if.preview_times( duration, 4 )
+    frames   = ffmpeg_if.generate_previews( m, 'preview.gif', times )
+    print( 'frames: {}'.format( len( frames ) ) )
+    assert len( frames ) == 4
+
+def test_split_jpegs():
+    jpg = b'\xff\xd8data\xff\xd9'
+    assert ffmpeg_if.split_jpegs( jpg * 3 ) == [ jpg ] * 3
+    assert ffmpeg_if.split_jpegs( b'' ) == []
+
+    # FF D9 inside a table and the scan (stuffed, restart markers) is
+    # not the end of the image
+    segment = lambda marker, body : b'\xff' + marker + ( len( body ) + 2 ).to_bytes( 2, 'big' ) + body
+    real = ( b'\xff\xd8' +
+             segment( b'\xe0', b'JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00' ) +
+             segment( b'\xdb', b'\x00' + b'\x01\xff\xd9\x02' * 16 ) +
+             segment( b'\xda', b'\x01\x01\x00\x00\x3f\x00' ) +
+             b'\x12\xff\x00\xd9\x34\xff\xd0\x56' +
+             b'\xff\xd9' )
+    assert ffmpeg_if.split_jpegs( real * 2 + real[ :-5 ] ) == [ real ] * 2
+    assert ffmpeg_if.split_jpegs( b'junk' + real + jpg ) == [ real, jpg ]
+
 def test_probe():
     print( ffmpeg_if.probe( m ) )
     print( ffmpeg_if.probe_duration( m ) )
 
     
+def test_warm_pool():
+    class Decoder( object ):
+        def __init__( self, fname ):
+            self.fname   = fname
+            self.stopped = False
+        def stop( self ):
+            self.stopped = True
+
+    made = []
+    def factory( fname ):
+        made.append( Decoder( fname ) )
+        return made[-1]
+
+    pool = ffmpeg_if.WarmPool( factory, size = 2 )
+    pool.prepare( [ 'a', 'b', 'c' ] ) # Only the first <size>
+    assert 'a' in pool and 'b' in pool and 'c' not in pool
+
+    dec, warm = pool.take( 'a' )
+    assert warm and dec.fname == 'a' and 'a' not in pool
+    dec, warm = pool.take( 'x' )
+    assert not warm and dec.fname == 'x'
+
+    # Over size, the oldest is stopped
+    pool.prepare( [ 'c' ] )
+    pool.prepare( [ 'd' ] )
+    assert 'b' not in pool and made[1].stopped
+    pool.clear()
+    assert all( d.stopped for d in made if d.fname in ( 'c', 'd' ) )
+    print( 'hits={} misses={}'.format( pool.hits, pool.misses ) )
+
+def test_fanout_graph():
+    info = { 'width' : 1920, 'height' : 1080, 'pix_fmt' : 'yuv420p', 'frame_rate' : 30.0 }
+    outputs = []
+    for spec in ( '/dev/video20:1280x-1', '/dev/video21:1280x720', '/dev/video22:640x360:yuyv422', '/dev/video23' ):
+        target = stream.parse_target( spec )
+        p      = plan( info, target.width, target.height, target.pix_fmt )
+        outputs.append( ( DeviceSink( target.device ), p ) )
+    assert stream.parse_target( '/dev/video22:640x360:yuyv422' ) == ffmpeg_if.Target( '/dev/video22', 640, 360, 'yuyv422' )
+
+    args  = ffmpeg_if.fanout_graph( ffmpeg_if.ffmpeg.input( m )[ 'v:0' ], outputs ).compile()
+    graph = args[ args.index( '-filter_complex' ) + 1 ]
+    print( graph )
+    # One decode, one 1280x720 scale shared by two devices
+    assert args.count( '-i' ) == 1 and args.count( '-map' ) == 4
+    assert graph.count( 'scale=1280:720' ) == 1 and graph.count( 'scale=640:360' ) == 1
+    assert graph.count( 'split' ) == 2
+    assert [ args[ i + 1 ] for i, a in enumerate( args ) if a == '-pix_fmt' ] == [ 'yuv420p', 'yuv420p', 'yuyv422', 'yuv420p' ]
+
+def test_failed_start():
+    class Broken( object ):
+        ''' Limits that fail once the sink is open '''
+        def args( self, args ):
+            raise ValueError( 'broken limits' )
+
+    info = { 'width' : 64, 'height' : 48, 'pix_fmt' : 'yuv420p', 'frame_rate' : 30.0 }
+    probe_info = ffmpeg_if.probe_info
+    ffmpeg_if.probe_info = lambda fname : info
+    try:
+        for make in ( lambda sink : ffmpeg_if.StreamProcess( m, sink, verbose = False, limits = Broken() ),
+                      lambda sink : ffmpeg_if.FanoutStreamProcess( m, [ sink ], verbose = False, limits = Broken() ) ):
+            emulated = EmulatorSink()
+            try:
+                make( emulated )
+                assert False, 'Started'
+            except ValueError as e:
+                pass
+            # The reader and its FIFO went with the stream
+            assert emulated._reader is None and not os.path.exists( emulated.target )
+
+        # The second of two outputs fails to open: the first is closed
+        emulated = EmulatorSink()
+        try:
+            ffmpeg_if.FanoutStreamProcess( m, [ emulated, ffmpeg_if.Target( EmulatorSink(), 64, 48, 'bogus' ) ], verbose = False )
+            assert False, 'Started'
+        except ValueError as e:
+            print( e )
+        assert emulated._reader is None and not os.path.exists( emulated.target )
+    finally:
+        ffmpeg_if.probe_info = probe_info
+
+def test_decode_aligned():
+    # A stand-in ffmpeg writing three 852x480 yuv420p frames, what the
+    # real one makes of an 853x481 request
+    size = ffmpeg_if.frame_size( 852, 480, 'yuv420p' )
+    info = { 'width' : 1920, 'height' : 1080, 'pix_fmt' : 'yuv420p', 'frame_rate' : 30.0 }
+    with tempfile.TemporaryDirectory() as tmp:
+        fake = os.path.join( tmp, 'ffmpeg' )
+        with open( fake, 'w' ) as f:
+            f.write( '#!{}\nimport sys\nfor i in range( 3 ): sys.stdout.buffer.write( bytes( [ i ] ) * {} )\n'.format( sys.executable, size ) )
+        os.chmod( fake, 0o755 )
+        path, probe_info = os.environ[ 'PATH' ], ffmpeg_if.probe_info
+        os.environ[ 'PATH' ]  = tmp + os.pathsep + path
+        ffmpeg_if.probe_info = lambda fname : info
+        try:
+            decoder = ffmpeg_if.DecodeProcess( m, 853, 481 )
+            assert ( decoder.plan.width, decoder.plan.height ) == ( 852, 480 )
+            assert decoder.frame_size == size
+            frame = bytearray( size )
+            for i in range( 3 ):
+                assert decoder.readinto( memoryview( frame ) )
+                assert frame[ 0 ] == frame[ -1 ] == i
+            assert not decoder.readinto( memoryview( frame ) )
+            decoder.stop()
+        finally:
+            os.environ[ 'PATH' ], ffmpeg_if.probe_info = path, probe_info
+
+def test_frame_tap():
+    assert pixfmt.shape( 64, 48, 'yuv420p' ) == ( 72, 64 )
+    assert pixfmt.shape( 64, 48, 'nv12' )    == ( 72, 64 )
+    assert pixfmt.shape( 64, 48, 'yuyv422' ) == ( 48, 64, 2 )
+    assert pixfmt.shape( 64, 48, 'rgb24' )   == ( 48, 64, 3 )
+
+    # A stand-in ffmpeg writing five 64x48 rgb24 frames and half of a sixth
+    size = ffmpeg_if.frame_size( 64, 48, 'rgb24' )
+    with tempfile.TemporaryDirectory() as tmp:
+        fake = os.path.join( tmp, 'ffmpeg' )
+        with open( fake, 'w' ) as f:
+            f.write( '#!{0}\nimport sys\nfor i in range( 5 ): sys.stdout.buffer.write( bytes( [ i ] ) * {1} )\n'
+                     'sys.stdout.buffer.write( bytes( {1} // 2 ) )\n'.format( sys.executable, size ) )
+        os.chmod( fake, 0o755 )
+        path = os.environ[ 'PATH' ]
+        os.environ[ 'PATH' ] = tmp + os.pathsep + path
+        try:
+            tap    = ffmpeg_if.FrameTap( 'testsrc', 64, 48, ring = 2, input_args = { 'f' : 'lavfi' } )
+            frames = []
+            for i in range( 5 ):
+                frame = tap.read()
+                assert frame.shape == ( 48, 64, 3 )
+                assert frame[ 0, 0, 0 ] == frame[ -1, -1, -1 ] == i
+                frames.append( frame )
+            # The ring is reused every two frames
+            assert frames[ 0 ] is frames[ 2 ] is frames[ 4 ]
+            assert frames[ 1 ] is frames[ 3 ]
+            assert frames[ 0 ] is not frames[ 1 ]
+            # The short final frame is not handed out
+            assert tap.read() is None
+            assert tap.frames == 5
+            tap.stop()
+        finally:
+            os.environ[ 'PATH' ] = path
+
+def test_thumbnails_stale():
+    # A stand-in ffmpeg that writes every .jpg output but the 'bad' ones
+    with tempfile.TemporaryDirectory() as tmp:
+        fake = os.path.join( tmp, 'ffmpeg' )
+        with open( fake, 'w' ) as f:
+            f.write( '#!{}\nimport sys\nfor a in sys.argv[ 1: ]:\n'
+                     '    if a.endswith( \'.jpg\' ) and \'bad\' not in a: open( a, \'wb\' ).write( b\'jpg\' )\n'.format( sys.executable ) )
+        os.chmod( fake, 0o755 )
+        out  = lambda name : os.path.join( tmp, name )
+        jobs = [ ( m, out( 'good_1.jpg' ), 1.0 ),
+                 ( m, out( 'bad_1.jpg' ), 2.0 ),
+                 ( m, out( 'bad_2.jpg' ), 3.0 ),
+                 ( m, out( 'good_2.jpg' ), 4.0 ) ]
+        # Left over from an earlier run
+        for name in ( 'bad_1.jpg', 'bad_2.jpg' ):
+            open( out( name ), 'wb' ).write( b'stale' )
+        path, k = os.environ[ 'PATH' ], ffmpeg_if._thumbnail_k
+        os.environ[ 'PATH' ]   = tmp + os.pathsep + path
+        ffmpeg_if._thumbnail_k = 2
+        try:
+            failures = ffmpeg_if.generate_thumbnails( jobs )
+            print( 'failures: {}'.format( failures ) )
+            # Both jobs on the same input are reported
+            assert sorted( failures.keys() ) == [ out( 'bad_1.jpg' ), out( 'bad_2.jpg' ) ]
+            # K grew and the next call starts from there
+            assert ffmpeg_if._thumbnail_k == 4
+        finally:
+            os.environ[ 'PATH' ], ffmpeg_if._thumbnail_k = path, k
+
 def main():
     test_probe()
     test_thumbnail()
+    test_thumbnails()
     test_gif()
+    test_previews()
+    test_split_jpegs()
+    test_warm_pool()
+    test_fanout_graph()
+    test_failed_start()
+    test_decode_aligned()
+    test_thumbnails_stale()
+    test_frame_tap()
     
 if __name__ == '__main__':
     main()
@@ -1,5 +1,6 @@
 import os
 import sys
+import tempfile
 
 # Add the project root to the path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -15,8 +16,32 @@ def test_filewalker():
     patterns.append( '.gif' )
     print( discover( path, patterns ) )
 
+def test_walk_media():
+    with tempfile.TemporaryDirectory() as tmp:
+        expect = set()
+        for sub in [ 'a', 'a/b', 'c', '.hidden', '.git', 'c/.git' ]:
+            os.makedirs( os.path.join( tmp, sub ), exist_ok = True )
+            for name in [ 'clip.mp4', 'CLIP.MKV', 'notes.txt', '.dot.mp4' ]:
+                path = os.path.join( tmp, sub, name )
+                open( path, 'w' ).close()
+                if not sub.startswith( '.' ) and '.git' not in sub and name[ 0 ] != '.' and not name.endswith( '.txt' ):
+                    expect.add( path )
+
+        found = set( fsutil.walk_media( tmp, [ '.mp4', '.mkv' ], workers = 4 ) )
+        print( sorted( found ) )
+        assert found == expect
+
+        # hidden entries on request, exclusions still apply
+        found = set( fsutil.walk_media( tmp, [ '.mp4' ], hidden = True ) )
+        assert os.path.join( tmp, '.hidden', '.dot.mp4' ) in found
+        assert not any( '.git' in f for f in found )
+
+        # Fixed discover() no longer descends hidden directories
+        assert not any( '.hidden' in f for f in fsutil.discover( tmp, [ '.mp4' ] ) )
+
 def main():
     test_filewalker()
+    test_walk_media()
 
 if __name__ == '__main__':
     main()
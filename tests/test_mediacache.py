@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+import tempfile
+
+# Add the project root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from v4l2tricks.mediacache import MediaCache
+
+def make( path, data = b'0' ):
+    os.makedirs( os.path.dirname( path ), exist_ok = True )
+    with open( path, 'wb' ) as f:
+        f.write( data )
+
+def test_fingerprint():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = MediaCache( os.path.join( tmp, 'cache' ) )
+        # Same basename, different files
+        a = os.path.join( tmp, 'a', 'intro.mp4' )
+        b = os.path.join( tmp, 'b', 'intro.mp4' )
+        make( a )
+        make( b )
+        assert cache.entry( a ) != cache.entry( b )
+
+        # An edit moves the file to a fresh entry
+        before = cache.entry( a )
+        make( a, b'edited' )
+        assert cache.entry( a ) != before
+
+def test_eviction():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = MediaCache( os.path.join( tmp, 'cache' ), budget = None )
+        media = [ os.path.join( tmp, 'media', '{}.mp4'.format( i ) ) for i in range( 4 ) ]
+        for i, path in enumerate( media ):
+            make( path, bytes( [ i ] ) )
+            make( os.path.join( cache.entry( path ), 'icon.jpg' ), b'x' * 1000 )
+            cache.commit( path )
+            # Accessed in order, a little apart: a deterministic LRU order
+            cache.lookup( path, 'icon.jpg' )
+            time.sleep( 0.01 )
+        assert cache.size == 4000
+
+        # Touch the oldest, the second oldest goes first
+        cache.lookup( media[0], 'icon.jpg' )
+        cache.budget = 2500
+        cache.clean_async().join()
+        print( 'entries={} size={}'.format( len( cache ), cache.size ) )
+        assert cache.size <= 2500
+        assert cache.lookup( media[0], 'icon.jpg' ) is not None
+        assert cache.lookup( media[1], 'icon.jpg' ) is None
+        assert cache.lookup( media[3], 'icon.jpg' ) is not None
+
+        # Other state sharing the root survives a clear
+        make( os.path.join( cache.root, 'scans', 'snapshot.json' ) )
+        cache.clean_async( clear = True ).join()
+        assert len( cache ) == 0
+        assert sorted( os.listdir( cache.root ) ) == [ 'index.json', 'scans' ]
+
+        # A clear asked for during a (slow) evict runs after it
+        make( os.path.join( cache.entry( media[0] ), 'icon.jpg' ), b'x' * 1000 )
+        cache.commit( media[0] )
+        evict       = cache.evict
+        cache.evict = lambda : ( time.sleep( 0.3 ), evict() )[ 1 ]
+        evicting    = cache.clean_async()
+        assert cache.clean_async() is evicting
+        clearing    = cache.clean_async( clear = True )
+        assert clearing is not evicting
+        removed     = []
+        assert cache.clean_async( clear = True, callback = removed.append ) is clearing
+        clearing.join()
+        assert not evicting.is_alive() and len( cache ) == 0
+        # The duplicate clear still hears back
+        assert removed == [ 1 ]
+
+def main():
+    test_fingerprint()
+    test_eviction()
+
+if __name__ == '__main__':
+    main()
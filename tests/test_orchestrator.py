@@ -0,0 +1,135 @@
+import os
+import sys
+import time
+import threading
+import subprocess
+
+# Add the project root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from v4l2tricks import orchestrator
+from v4l2tricks.process import Limits
+
+class Busy( object ):
+    '''
+    Stands in for a StreamProcess: a child spinning for <seconds>
+    '''
+    def __init__( self, seconds = 5.0, limits = None ):
+        self.limits  = limits
+        self.stopped = False
+        self._proc   = subprocess.Popen( [ sys.executable, '-c',
+                                           'import time\nend = time.time() + {}\nwhile time.time() < end: pass'.format( seconds ) ],
+                                         preexec_fn = limits.preexec if limits is not None else None )
+    @property
+    def pid( self ):
+        return self._proc.pid
+
+    @property
+    def alive( self ):
+        return self._proc.poll() is None
+
+    def stop( self ):
+        self.stopped = True
+        if self.alive:
+            self._proc.kill()
+        self._proc.wait()
+
+def test_limits_args():
+    args  = [ 'ffmpeg', '-i', 'a.mp4', '-i', 'b.png', '-map', '[s0]', 'out' ]
+    assert Limits().args( args ) == args
+    limited = Limits( threads = 2 ).args( args )
+    print( ' '.join( limited ) )
+    assert limited[ :5 ] == [ 'ffmpeg', '-filter_threads', '2', '-filter_complex_threads', '2' ]
+    assert limited.count( '-threads' ) == 2
+    assert limited[ limited.index( 'a.mp4' ) - 3: limited.index( 'a.mp4' ) ] == [ '-threads', '2', '-i' ]
+
+def test_admission():
+    cpu  = sorted( os.sched_getaffinity( 0 ) )[ 0 ]
+    orch = orchestrator.Orchestrator( cpus = [ cpu ], max_load = 1.0, measure = False,
+                                      budget = orchestrator.Budget( 0.6, nice = 5 ) )
+    first = orch.start( Busy, 5.0, name = 'first' )
+    assert os.sched_getaffinity( first.pid ) == set( [ cpu ] )
+    assert os.getpriority( os.PRIO_PROCESS, first.pid ) >= 5
+    assert first.limits.threads == 1
+
+    # What is left, at a lower priority
+    second = orch.start( Busy, 5.0 )
+    slot   = orch._slots[ 'stream2' ]
+    assert slot.degraded and abs( slot.budget.cores - 0.4 ) < 1e-6
+    assert slot.budget.nice == orchestrator.degraded_nice
+
+    # Nothing left
+    try:
+        orch.start( Busy, 5.0 )
+        assert False, 'Not refused'
+    except orchestrator.Saturated as e:
+        print( e )
+    assert orch.refused == 1 and len( orch ) == 2
+
+    orch.sample()
+    time.sleep( 0.3 )
+    sample = orch.sample()
+    print( orch.summary( sample ) )
+    assert sample[ 'host' ][ 'committed' ] == 1.0
+    assert sample[ 'streams' ][ 'first' ][ 'used' ] is not None
+
+    # A stopped stream gives its budget back
+    orch.stop( 'first' )
+    assert first.stopped and 'first' not in orch
+    third = orch.start( Busy, 5.0, name = 'third', budget = orchestrator.Budget( 0.5 ) )
+    assert not orch._slots[ 'third' ].degraded
+    orch.stop_all()
+    assert second.stopped and third.stopped and len( orch ) == 0
+
+def test_placement():
+    orch = orchestrator.Orchestrator( cpus = [ 0, 1, 2, 3 ], reserve = 1, measure = False )
+    assert orch.cpus == [ 1, 2, 3 ] and orch.reserved == [ 0 ]
+    class Stream( object ):
+        alive = True
+    for cpus in ( [ 1 ], [ 2 ] ):
+        orch._slots[ str( cpus ) ] = orchestrator.Slot( str( cpus ), Stream(), orchestrator.Budget( 1.0 ), Limits( cpus ), False )
+    assert orch.place( 1.0 ) == [ 3 ]
+    assert orch.place( 2.0 ) == [ 1, 3 ]
+    assert abs( orch.free() - ( 3 * orchestrator.max_load - 2.0 ) ) < 1e-6
+
+def test_slow_start():
+    cpu  = sorted( os.sched_getaffinity( 0 ) )[ 0 ]
+    orch = orchestrator.Orchestrator( cpus = [ cpu ], max_load = 1.0, measure = False,
+                                      budget = orchestrator.Budget( 0.5 ) )
+    def slow( seconds, limits = None ):
+        time.sleep( 0.5 ) # Probing, spawning
+        return Busy( seconds, limits )
+
+    started = []
+    t = threading.Thread( target = lambda : started.append( orch.start( slow, 5.0, name = 'slow' ) ) )
+    t.start()
+    time.sleep( 0.1 )
+
+    # Not blocked meanwhile, the budget is held
+    t0 = time.time()
+    assert 'slow' not in orch.sample()[ 'streams' ]
+    assert time.time() - t0 < 0.3
+    assert abs( orch.committed() - 0.5 ) < 1e-6
+
+    # Stopped while starting: stopped once it is up
+    orch.stop( 'slow' )
+    t.join()
+    assert started[ 0 ].stopped and len( orch ) == 0
+
+    # A failed start gives the budget back
+    def broken( limits = None ):
+        raise OSError( 'no ffmpeg' )
+    try:
+        orch.start( broken )
+        assert False, 'Started'
+    except OSError as e:
+        pass
+    assert len( orch ) == 0 and orch.committed() == 0
+
+def main():
+    test_limits_args()
+    test_admission()
+    test_placement()
+    test_slow_start()
+
+if __name__ == '__main__':
+    main()
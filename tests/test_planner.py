@@ -0,0 +1,70 @@
+import os
+import sys
+
+import ffmpeg
+
+# Add the project root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from v4l2tricks import planner
+
+info = { 'width'      : 1280,
+         'height'     : 720,
+         'pix_fmt'    : 'yuv420p',
+         'frame_rate' : 30.0,
+         'streams'    : [ 'video', 'audio', 'subtitle' ] }
+
+def test_identity():
+    p = planner.plan( info )
+    print( p.explain() )
+    assert p.identity
+    assert p.filters == []
+    assert ( p.width, p.height ) == ( 1280, 720 )
+    assert 'an' in p.output_args and 'sn' in p.output_args and 'dn' in p.output_args
+    assert '1 audio, 1 subtitle' in p.explain()
+
+    args = p.apply( ffmpeg.input( 'in.mp4' )[ 'v:0' ] ).output( 'out', f='v4l2', **p.output_args ).compile()
+    assert 'scale' not in ' '.join( args )
+    assert args[ args.index( '-map' ) + 1 ] == '0:v:0'
+
+def test_odd_size():
+    p = planner.plan( dict( info, width = 853, height = 481 ) )
+    print( p.explain() )
+    assert [ f[0] for f in p.filters ] == [ 'crop' ]
+    assert ( p.width, p.height ) == ( 852, 480 )
+
+    # 4:2:2 keeps odd heights
+    p = planner.plan( dict( info, width = 853, height = 481 ), pix_fmt = 'yuyv422' )
+    assert ( p.width, p.height ) == ( 852, 481 )
+    assert p.conversions == 1
+
+def test_scale():
+    down = planner.plan( info, width = 640 )
+    print( down.explain() )
+    assert ( down.width, down.height ) == ( 640, 360 )
+    name, args, kwargs = down.filters[0]
+    assert name == 'scale' and kwargs[ 'flags' ] == planner.downscale_flags
+    assert down.conversions == 0
+
+    up = planner.plan( info, width = 1920, pix_fmt = 'yuyv422' )
+    assert up.filters[0][2][ 'flags' ] == planner.upscale_flags
+    assert up.conversions == 1
+    assert 'in the same scale' in up.explain()
+
+    box = planner.plan( info, 640, 480, fps = 25, letterbox = True )
+    assert [ f[0] for f in box.filters ] == [ 'scale', 'pad', 'setsar', 'fps' ]
+    same = planner.plan( info, 1280, 720, fps = 30, letterbox = True )
+    assert same.identity
+
+def test_unknown():
+    p = planner.plan( None, 640, 480, fps = 25, letterbox = True )
+    assert [ f[0] for f in p.filters ] == [ 'scale', 'pad', 'setsar', 'fps' ]
+    assert p.conversions == 1
+
+def main():
+    test_identity()
+    test_odd_size()
+    test_scale()
+    test_unknown()
+
+if __name__ == '__main__':
+    main()
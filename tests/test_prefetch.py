@@ -0,0 +1,75 @@
+import os
+import sys
+import tempfile
+
+# Add the project root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from v4l2tricks import prefetch
+from v4l2tricks.ffmpeg_if import WarmPool
+
+def test_prefetch():
+    probed = []
+    probe_info = prefetch.probe_info
+    prefetch.probe_info = lambda fname : probed.append( fname )
+    try:
+        run_prefetch( probed )
+    finally:
+        prefetch.probe_info = probe_info
+
+def run_prefetch( probed ):
+    class Pool( object ):
+        prepared = []
+        def prepare( self, fnames ):
+            self.prepared.extend( fnames )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fname = os.path.join( tmp, 'next.mp4' )
+        with open( fname, 'wb' ) as f:
+            f.write( os.urandom( 3 * 1024 * 1024 ) )
+        prefetch.warm_page_cache( fname, head = 1024 * 1024, tail = 1024 * 1024 )
+
+        pool = Pool()
+        prefetcher = prefetch.Prefetcher( pool, head = 1024 * 1024, tail = 1024 * 1024 )
+        prefetcher.prefetch( fname )
+        assert prefetcher.ready( fname, timeout = 5.0 )
+        assert probed == [ fname ]
+        assert pool.prepared == [ fname ]
+
+        # Missing files are reported, not fatal
+        missing = os.path.join( tmp, 'gone.mp4' )
+        prefetcher.prefetch( missing )
+        assert prefetcher.ready( missing, timeout = 5.0 )
+        assert prefetcher.prepared == 2
+
+        # A closed pool (its stream stopped) starts no more decoders
+        started = []
+        class Decoder( object ):
+            stopped = False
+            def stop( self ):
+                self.stopped = True
+        warm = WarmPool( lambda fname : started.append( Decoder() ) or started[ -1 ] )
+        prefetcher.pool = warm
+        prefetcher.prefetch( fname )
+        assert prefetcher.ready( fname, timeout = 5.0 ) and len( started ) == 1
+        warm.close()
+        assert started[ 0 ].stopped
+        prefetcher.prefetch( fname )
+        assert prefetcher.ready( fname, timeout = 5.0 )
+        assert len( started ) == 1 and prefetcher.pool is None
+
+        # ready() consumes an item, and only the last few prepared are
+        # remembered when nobody asks
+        assert not prefetcher.ready( fname, timeout = 0 )
+        names = [ os.path.join( tmp, 'gone_{}.mp4'.format( i ) ) for i in range( prefetch.prepared_keep + 4 ) ]
+        for name in names:
+            prefetcher.prefetch( name )
+        assert prefetcher.ready( names[ -1 ], timeout = 5.0 )
+        assert not prefetcher.ready( names[ 0 ], timeout = 0 )
+        assert prefetcher.ready( names[ 4 ], timeout = 0 )
+        prefetcher.stop()
+
+def main():
+    test_prefetch()
+
+if __name__ == '__main__':
+    main()
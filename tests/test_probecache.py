@@ -0,0 +1,45 @@
+import os
+import sys
+import time
+import tempfile
+
+# Add the project root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from v4l2tricks.probecache import ProbeCache
+
+info = { 'width'      : 320,
+         'height'     : 240,
+         'pix_fmt'    : 'yuv420p',
+         'frame_rate' : 25.0,
+         'duration'   : 30.0,
+         'codec'      : 'h264',
+         'num_frames' : 750 }
+
+def test_probecache():
+    with tempfile.TemporaryDirectory() as tmp:
+        media = os.path.join( tmp, 'clip.mp4' )
+        with open( media, 'wb' ) as f:
+            f.write( b'0' * 16 )
+
+        store = os.path.join( tmp, 'probe.json' )
+        cache = ProbeCache( store )
+        assert cache.get( media ) is None
+        cache.put( media, info )
+        assert cache.get( media ) == info
+        cache.flush()
+
+        # Persisted across instances
+        cache = ProbeCache( store )
+        assert cache.get( media ) == info
+        print( 'hits={} misses={}'.format( cache.hits, cache.misses ) )
+
+        # Editing the file invalidates the entry
+        with open( media, 'ab' ) as f:
+            f.write( b'1' )
+        assert cache.get( media ) is None
+
+def main():
+    test_probecache()
+
+if __name__ == '__main__':
+    main()
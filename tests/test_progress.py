@@ -0,0 +1,71 @@
+import os
+import sys
+
+# Add the project root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from v4l2tricks import progress
+from v4l2tricks.progress import StreamMetrics
+
+block = '''frame={frame}
+fps=29.97
+stream_0_0_q=-0.0
+bitrate=N/A
+total_size=N/A
+out_time_us={us}
+out_time_ms={us}
+out_time=00:00:01.000000
+dup_frames=0
+drop_frames={drop}
+speed={speed}x
+progress={progress}'''
+
+class Clock( object ):
+    # Stands in for the time module so samples get known timestamps
+    def __init__( self, now ):
+        self.now = now
+
+    def time( self ):
+        return self.now
+
+def feed( metrics, **kw ):
+    for line in block.format( **kw ).splitlines():
+        metrics.feed( line )
+
+def test_progress():
+    clock, saved  = Clock( 1000.0 ), progress.time
+    progress.time = clock
+    try:
+        check_progress( clock )
+    finally:
+        progress.time = saved
+
+def check_progress( clock ):
+    metrics = StreamMetrics( window = 10.0 )
+    seen = []
+    metrics.subscribe( seen.append )
+
+    feed( metrics, frame = 30, us = 1000000, drop = 0, speed = '1.0', progress = 'continue' )
+    latest = metrics.snapshot()
+    assert latest[ 'frame' ] == 30
+    assert latest[ 'out_time' ] == 1.0
+    assert latest[ 'bitrate' ] is None
+    assert latest[ 'speed' ] == 1.0
+
+    # Half a second of output in a second of wall time: behind
+    clock.now += 1.0
+    feed( metrics, frame = 45, us = 1500000, drop = 2, speed = '0.5', progress = 'end' )
+    window = metrics.window()
+    print( window )
+    print( metrics.summary() )
+    assert abs( window[ 'speed' ] - 0.5 ) < 0.05
+    assert window[ 'drop_frames' ] == 2
+    assert metrics.behind_realtime
+    assert metrics.ended
+    assert len( seen ) == 2
+    assert metrics.poll( timeout = 0.01 ) is None
+
+def main():
+    test_progress()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import os
+import sys
+import tempfile
+
+# Add the project root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from v4l2tricks import proxy
+from v4l2tricks.probecache import cache_dir
+
+hd  = { 'width' : 1280, 'height' : 720,  'pix_fmt' : 'yuv420p', 'frame_rate' : 30.0, 'codec' : 'h264',
+        'streams' : [ 'video', 'audio' ] }
+uhd = dict( hd, width = 3840, height = 2160 )
+
+def test_needs_proxy():
+    assert not proxy.needs_proxy( hd )
+    assert not proxy.needs_proxy( None )
+    assert proxy.needs_proxy( uhd )
+    assert proxy.needs_proxy( dict( hd, codec = 'hevc' ) )
+
+    assert proxy.fit( uhd ) == ( 1280, 720 )
+    assert proxy.fit( dict( hd, width = 1440, height = 1080 ) ) == ( 960, 720 )
+    assert proxy.fit( dict( hd, width = 853, height = 481 ) ) == ( 852, 480 )
+
+    args = proxy.transcode_args( 'in.mkv', 'out.mp4', uhd )
+    print( ' '.join( args ) )
+    graph = args[ args.index( '-filter_complex' ) + 1 ]
+    assert graph.startswith( '[0:v:0]scale=1280:720:flags={}'.format( proxy.proxy_scale_flags ) )
+    assert '-an' in args and args[ args.index( '-tune' ) + 1 ] == 'fastdecode'
+
+def test_resolve():
+    probed = []
+    probe_info = proxy.probe_info
+    proxy.probe_info = lambda fname : probed.append( fname ) or hd
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            run_resolve( tmp, probed )
+    finally:
+        proxy.probe_info = probe_info
+
+def run_resolve( tmp, probed ):
+    media = os.path.join( tmp, 'movie.mkv' )
+    with open( media, 'wb' ) as f:
+        f.write( b'\0' * 1024 )
+
+    cache = proxy.ProxyCache( root = os.path.join( tmp, 'proxies' ) )
+    assert cache.resolve( media ) == media
+
+    # Made elsewhere: found, streamed in place of the media
+    made = os.path.join( cache.entry( media ), cache.name )
+    with open( made, 'wb' ) as f:
+        f.write( b'\0' * 512 )
+    cache.commit( media )
+    assert cache.resolve( media ) == made
+    assert cache.size == 512
+
+    # Any size made (e.g. by mkproxies -W -H): the smallest one that is
+    # at least the device's size
+    for size in ( ( 1920, 1080 ), ( 640, 360 ) ):
+        with open( os.path.join( cache.entry( media ), proxy.proxy_name.format( *size ) ), 'wb' ) as f:
+            f.write( b'\0' )
+    assert sorted( cache.proxies( media ) ) == [ ( 640, 360 ), ( 1280, 720 ), ( 1920, 1080 ) ]
+    assert cache.resolve( media, 640, 360 ).endswith( 'proxy_640x360.mp4' )
+    assert cache.resolve( media, 1600, 900 ).endswith( 'proxy_1920x1080.mp4' )
+    assert cache.resolve( media, 2560, 1440 ) == media
+    os.remove( made )
+    assert cache.resolve( media ).endswith( 'proxy_1920x1080.mp4' )
+
+    # Edited media does not use the old proxy
+    with open( media, 'ab' ) as f:
+        f.write( b'\0' )
+    os.utime( media, ( 0, 0 ) )
+    assert cache.resolve( media ) == media
+
+    # Already at device size, nothing to make
+    cache.request( media )
+    assert cache.ready( media, timeout = 5.0 )
+    assert probed == [ media ]
+    assert cache.skipped == 1 and cache.made == 0
+    cache.stop()
+
+def test_proxy_dir():
+    # Clearing the preview cache must not take the proxies with it
+    assert not os.path.abspath( proxy.proxy_dir ).startswith( os.path.abspath( cache_dir ) + os.sep )
+
+def main():
+    test_needs_proxy()
+    test_resolve()
+    test_proxy_dir()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import os
+import sys
+import subprocess
+import tempfile
+from threading import Event
+
+# Add the project root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from v4l2tricks.reactor import reactor, Reactor
+
+script = '''
+import sys
+for i in range( 100 ):
+    sys.stderr.write( 'frame=%d\\r' % i )
+sys.stderr.write( 'last line without newline' )
+sys.stdout.write( 'x' * 200000 )
+'''
+
+def test_reactor():
+    io = reactor()
+    procs = []
+    lines = {}
+    data  = {}
+    done  = []
+    for n in range( 4 ):
+        proc = subprocess.Popen( [ sys.executable, '-c', script ],
+                                 stdout = subprocess.PIPE,
+                                 stderr = subprocess.PIPE )
+        lines[ n ] = []
+        data[ n ]  = []
+        err_closed = Event()
+        out_closed = Event()
+        io.register( proc.stderr, lines[ n ].append, lines = True, on_close = err_closed.set )
+        io.register( proc.stdout, data[ n ].append, lines = False, on_close = out_closed.set )
+        procs.append( proc )
+        done.extend( [ err_closed, out_closed ] )
+
+    for proc in procs:
+        proc.wait()
+    for closed in done:
+        assert closed.wait( 5 )
+
+    for n in range( 4 ):
+        print( '{}: {} lines, {} chunks'.format( n, len( lines[ n ] ), len( data[ n ] ) ) )
+        assert lines[ n ][ 0 ] == 'frame=0'
+        assert lines[ n ][ -1 ] == 'last line without newline'
+        assert len( lines[ n ] ) == 101
+        assert sum( len( d ) for d in data[ n ] ) == 200000
+
+def test_reactor_errors():
+    loop = Reactor()
+    # epoll refuses regular files: the error reaches the caller and the
+    # loop keeps running
+    with tempfile.TemporaryFile() as f:
+        try:
+            loop.register( f, None )
+            assert False, 'regular file registered'
+        except OSError as e:
+            print( e )
+
+    # A failing on_close does not take the loop down either
+    def on_close():
+        raise ValueError( 'on_close' )
+    for i in range( 2 ):
+        closed = Event()
+        r, w   = os.pipe()
+        loop.register( r, lambda line : closed.set(), on_close = on_close )
+        os.write( w, b'unterminated' )
+        os.close( w )
+        assert closed.wait( 5 )
+        os.close( r )
+    assert loop._thread.is_alive()
+
+def main():
+    test_reactor()
+    test_reactor_errors()
+
+if __name__ == '__main__':
+    main()
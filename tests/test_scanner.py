@@ -0,0 +1,62 @@
+import os
+import sys
+import tempfile
+
+# Add the project root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from v4l2tricks.scanner import IncrementalScanner
+
+def make( path, data = b'0' ):
+    os.makedirs( os.path.dirname( path ), exist_ok = True )
+    with open( path, 'wb' ) as f:
+        f.write( data )
+
+def bump( path ):
+    # Some filesystems have coarse mtimes, move it forward explicitly
+    st = os.stat( path )
+    os.utime( path, ns = ( st.st_atime_ns, st.st_mtime_ns + 10**9 ) )
+
+def test_rescan():
+    with tempfile.TemporaryDirectory() as tmp:
+        lib   = os.path.join( tmp, 'lib' )
+        store = os.path.join( tmp, 'snapshot.json' )
+        for i in range( 3 ):
+            make( os.path.join( lib, 'd{}'.format( i ), 'clip.mp4' ) )
+        make( os.path.join( lib, 'd0', 'notes.txt' ) )
+        make( os.path.join( lib, '.hidden', 'clip.mp4' ) )
+
+        diff = IncrementalScanner( lib, [ '.mp4' ], store = store ).scan()
+        print( 'First scan: {}'.format( diff ) )
+        assert len( diff.added ) == 3
+        assert not diff.removed and not diff.modified
+
+        # Nothing changed, no directory is listed again
+        scanner = IncrementalScanner( lib, [ '.mp4' ], store = store )
+        diff = scanner.scan()
+        assert diff == ( [], [], [] )
+        assert scanner.listed == 0
+        assert len( scanner.files ) == 3
+
+        # One added, one removed, one rewritten
+        added    = os.path.join( lib, 'd1', 'new.mp4' )
+        removed  = os.path.join( lib, 'd2', 'clip.mp4' )
+        modified = os.path.join( lib, 'd0', 'clip.mp4' )
+        make( added )
+        bump( os.path.dirname( added ) )
+        os.remove( removed )
+        bump( os.path.dirname( removed ) )
+        make( modified, b'longer' )
+
+        scanner = IncrementalScanner( lib, [ '.mp4' ], store = store, deep = True )
+        diff = scanner.scan()
+        print( 'Rescan: {}'.format( diff ) )
+        assert scanner.listed == 2
+        assert diff.added    == [ added ]
+        assert diff.removed  == [ removed ]
+        assert diff.modified == [ modified ]
+
+def main():
+    test_rescan()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+import os
+import sys
+import numpy as np
+
+# Add the project root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from v4l2tricks.scope import RegionScaler
+
+def test_crop_rgb():
+    src = np.arange( 8 * 6 * 3, dtype = np.uint32 ).astype( np.uint8 ).reshape( 6, 8, 3 )
+    scaler = RegionScaler( 8, 6, 4, 2, 'rgb24' )
+    scaler.set_region( 2, 1, 4, 2 )
+    out = scaler.apply( src ).reshape( 2, 4, 3 )
+    assert np.array_equal( out, src[ 1:3, 2:6 ] )
+
+    # Moved, same size, no reallocation
+    before = scaler.apply( src )
+    scaler.set_region( 4, 4, 4, 2 )
+    after = scaler.apply( src )
+    assert after is before
+    assert np.array_equal( after.reshape( 2, 4, 3 ), src[ 4:6, 4:8 ] )
+
+    # Downscaled: every other pixel
+    scaler = RegionScaler( 8, 6, 4, 3, 'rgb24' )
+    assert np.array_equal( scaler.apply( src ).reshape( 3, 4, 3 ), src[ ::2, ::2 ] )
+
+def test_crop_yuyv():
+    # Y = x, U = 100 + pair, V = 200 + pair
+    w, h = 8, 2
+    src = np.zeros( ( h, w * 2 ), dtype = np.uint8 )
+    src[ :, 0::2 ] = np.arange( w )
+    src[ :, 1::4 ] = 100 + np.arange( w // 2 )
+    src[ :, 3::4 ] = 200 + np.arange( w // 2 )
+
+    scaler = RegionScaler( w, h, 4, 2, 'yuyv422' )
+    scaler.set_region( 3, 0, 4, 2 ) # Odd offset snaps to 2
+    assert scaler.region == ( 2, 0, 4, 2 )
+    row = scaler.apply( src )[0]
+    assert list( row ) == [ 2, 101, 3, 201, 4, 102, 5, 202 ]
+
+    # Mirrored, chroma of each output pair still comes from one source pair
+    scaler = RegionScaler( w, h, 4, 2, 'yuyv422', mirror = True )
+    scaler.set_region( 2, 0, 4, 2 )
+    row = scaler.apply( src )[0]
+    assert list( row[ 0::2 ] ) == [ 5, 4, 3, 2 ]
+    assert row[1] == 102 and row[3] == 202
+
+def main():
+    test_crop_rgb()
+    test_crop_yuyv()
+
+if __name__ == '__main__':
+    main()
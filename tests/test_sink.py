@@ -0,0 +1,149 @@
+import os
+import sys
+import time
+import struct
+import tempfile
+from threading import Thread
+
+# Add the project root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from v4l2tricks import sink, pixfmt
+
+w, h = 64, 48
+
+def test_ioctl_numbers():
+    # Values from linux/videodev2.h on 64 bit hosts
+    if struct.calcsize( 'P' ) == 8:
+        assert sink.VIDIOC_S_FMT    == 0xc0d05605
+        assert sink.VIDIOC_QUERYBUF == 0xc0585609
+        assert sink.VIDIOC_QBUF     == 0xc058560f
+        assert sink.VIDIOC_DQBUF    == 0xc0585611
+    assert sink.VIDIOC_REQBUFS  == 0xc0145608
+    assert sink.VIDIOC_STREAMON == 0x40045612
+    assert pixfmt.fourcc( 'yuyv422' ) == 0x56595559
+
+def test_buffer_fields():
+    fields = struct.unpack( sink.buffer_fmt, sink.pack_buffer( 3, 0, 777 ) )
+    assert fields[ 0 ] == 3
+    assert fields[ sink.buffer_m_offset - 1 ] == sink.MEMORY_MMAP
+    assert fields[ sink.buffer_m_offset ] == 0
+    assert fields[ sink.buffer_length ] == 777
+
+    # As QUERYBUF hands them back: m.offset and length where the kernel puts them
+    fields = list( fields )
+    fields[ sink.buffer_m_offset ] = 4096
+    packed = struct.pack( sink.buffer_fmt, *fields )
+    if struct.calcsize( 'P' ) == 8:
+        assert struct.unpack_from( '@L', packed, 64 )[ 0 ] == 4096
+        assert struct.unpack_from( '@I', packed, 72 )[ 0 ] == 777
+    fields = struct.unpack( sink.buffer_fmt, packed )
+    assert ( fields[ sink.buffer_m_offset ], fields[ sink.buffer_length ] ) == ( 4096, 777 )
+
+def test_file_writer():
+    size = pixfmt.frame_size( w, h, 'yuv420p' )
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join( tmp, 'out.yuv' )
+        with sink.open_writer( path, w, h, 'yuv420p' ) as writer:
+            writer.write( bytes( size ) )
+            writer.write( memoryview( bytearray( size ) ) )
+            try:
+                import numpy as np
+                writer.write( np.zeros( ( h * 3 // 2, w ), dtype = np.uint8 ) )
+                # Non contiguous views are copied
+                writer.write( np.zeros( ( h * 3 // 2, w * 2 ), dtype = np.uint8 )[ :, ::2 ] )
+                frames = 4
+            except ImportError as e:
+                frames = 2
+            try:
+                writer.write( bytes( size - 1 ) )
+                assert False, 'short frame accepted'
+            except ValueError as e:
+                pass
+            assert writer.frames == frames
+        assert os.path.getsize( path ) == frames * size
+
+def test_fifo_writer():
+    size = pixfmt.frame_size( w, h, 'yuyv422' )
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join( tmp, 'out.fifo' )
+        os.mkfifo( path )
+        received = []
+        def reader():
+            with open( path, 'rb' ) as f:
+                while True:
+                    data = f.read( size )
+                    if not data:
+                        break
+                    received.append( len( data ) )
+        t = Thread( target = reader )
+        t.start()
+        with sink.FileWriter( path, w, h, 'yuyv422' ) as writer:
+            for i in range( 10 ):
+                writer.write( bytes( [ i ] ) * size )
+        t.join()
+        print( 'received {} frames'.format( len( received ) ) )
+        assert sum( received ) == 10 * size
+
+def test_as_sink():
+    assert isinstance( sink.as_sink( '/dev/video20' ), sink.DeviceSink )
+    assert sink.as_sink( '/dev/video20' ).fmt == 'v4l2'
+    out = sink.as_sink( 'out.yuv', 'rawvideo' )
+    assert isinstance( out, sink.FileSink ) and out.fmt == 'rawvideo'
+    emulated = sink.EmulatorSink()
+    assert sink.as_sink( emulated ) is emulated
+
+def test_emulator_sink():
+    size     = pixfmt.frame_size( w, h, 'yuv420p' )
+    emulated = sink.EmulatorSink( report = 0.1 )
+    for run in range( 2 ):
+        writer = sink.open_writer( emulated, w, h, 'yuv420p' )
+        path   = emulated.target
+        assert os.path.exists( path )
+        for i in range( 20 ):
+            writer.write( bytes( size ) )
+            # One frame late by half a second
+            time.sleep( 0.5 if i == 10 else 0.03 )
+        writer.close()
+        stats = emulated.stats
+        print( emulated.summary() )
+        assert stats[ 'frames' ] == 20
+        assert stats[ 'bytes' ] == 20 * size
+        # The late frame, a loaded machine may add one or two
+        assert 1 <= stats[ 'stalls' ] <= 3
+        assert stats[ 'max_ms' ] >= 400
+        assert stats[ 'jitter_ms' ] > 0
+        # The FIFO and its directory go with the writer
+        assert not os.path.exists( os.path.dirname( path ) )
+
+    # Closed before anything was written
+    emulated.open( w, h, 'yuv420p' )
+    emulated.close()
+    assert emulated.stats[ 'frames' ] == 0
+
+def test_emulator_sink_rate():
+    # A client taking 50 fps from a writer that bursts: the FIFO backs up
+    # and frames come out at the client's pace
+    size     = pixfmt.frame_size( w, h, 'yuv420p' )
+    emulated = sink.EmulatorSink( rate = 50, report = 0.1 )
+    writer   = sink.open_writer( emulated, w, h, 'yuv420p' )
+    for i in range( 30 ):
+        writer.write( bytes( size ) )
+    writer.close()
+    stats = emulated.stats
+    print( emulated.summary() )
+    assert stats[ 'frames' ] == 30
+    assert 25.0 <= stats[ 'fps' ] <= 55.0
+    assert stats[ 'interval_ms' ] >= 18.0
+    assert stats[ 'stalls' ] <= 2
+
+def main():
+    test_ioctl_numbers()
+    test_buffer_fields()
+    test_file_writer()
+    test_fifo_writer()
+    test_as_sink()
+    test_emulator_sink()
+    test_emulator_sink_rate()
+
+if __name__ == '__main__':
+    main()
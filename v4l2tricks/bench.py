@@ -0,0 +1,420 @@
+# -*- coding: utf-8 -*-
+"""Bench - streaming benchmarks against generated sources
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import resource
+import subprocess
+from threading   import Lock
+from collections import OrderedDict, namedtuple
+
+from .               import fsutil
+from .supported      import MediaContainers
+from .sink           import EmulatorSink, FileSink
+from .ffmpeg_if      import ( StreamProcess,
+                              OverlayStreamProcess,
+                              DesktopStreamProcess,
+                              generate_thumbnail,
+                              generate_previews,
+                              preview_times,
+                              probe_duration,
+                              create_test_src,
+                              spawn_hooks )
+
+# Compared metrics: ( lower is better, change below which it is noise )
+#   first_frame  s from launching to the first frame in the sink
+#   fps          frames per second once the first frame is out
+#   jitter_ms    deviation of the interval between frames at the reader
+#   stalls       intervals over two frame periods at the reader
+#   wall         s for the whole case
+#   cpu          s user + system, Python and every child
+#   peak_rss     KiB, largest resident set (Python or any child)
+#   spawns       ffmpeg / ffprobe processes started (see ffmpeg_if.spawn_hooks)
+bench_metrics = OrderedDict( [ ( 'first_frame', ( True,  0.05 ) ),
+                               ( 'fps',         ( False, 1.0  ) ),
+                               ( 'jitter_ms',   ( True,  2.0  ) ),
+                               ( 'stalls',      ( True,  0    ) ),
+                               ( 'wall',        ( True,  0.05 ) ),
+                               ( 'cpu',         ( True,  0.05 ) ),
+                               ( 'peak_rss',    ( True,  4096 ) ),
+                               ( 'spawns',      ( True,  0    ) ) ] )
+
+default_tolerance = 0.15 # Relative change flagged as a regression
+
+Regression = namedtuple( 'Regression', [ 'case', 'metric', 'baseline', 'current', 'change' ] )
+
+other_types = [ '.txt', '.jpg', '.nfo', '.srt', '.part' ]
+
+
+def make_tree( root, files, per_dir = 50, fanout = 8 ):
+    '''
+    <files> empty files, <per_dir> per directory, directories nested
+    <fanout> wide; a quarter of them media
+    '''
+    media_types = sorted( MediaContainers().extensions() )
+    made = 0
+    dirs = [ root ]
+    while made < files:
+        parent = dirs[ len( dirs ) // fanout if len( dirs ) > fanout else 0 ]
+        path   = os.path.join( parent, 'd{0:05d}'.format( len( dirs ) ) )
+        os.makedirs( path )
+        dirs.append( path )
+        for i in range( min( per_dir, files - made ) ):
+            ext = media_types[ i % len( media_types ) ] if i % 4 == 0 else other_types[ i % len( other_types ) ]
+            open( os.path.join( path, 'f{0:04d}{1}'.format( i, ext ) ), 'w' ).close()
+            made += 1
+    return len( dirs )
+
+
+class Fixture( object ):
+    '''
+    Fixture
+
+    Inputs shared by the cases, made once in <workdir>: a lavfi testsrc
+    clip (create_test_src), an overlay image and a tree of empty files.
+    Streams write to an emulated device read at <reader_rate> (sink
+    'fifo', see EmulatorSink) or to a rawvideo file (sink 'file').
+    '''
+    def __init__( self, workdir, duration = 5, size = '1280x720', rate = 30, files = 20000, sink = 'fifo', display = None, reader_rate = None ):
+        super( Fixture, self ).__init__()
+        self.workdir     = workdir
+        self.duration    = duration
+        self.size        = size
+        self.rate        = rate
+        self.files       = files
+        self.sink        = sink
+        self.display     = display
+        self.reader_rate = reader_rate
+        self.source      = os.path.join( workdir, 'testsrc_{}_{}_{}s.mp4'.format( size, rate, duration ) )
+        self.overlay     = os.path.join( workdir, 'overlay.png' )
+        self.tree        = os.path.join( workdir, 'tree_{}'.format( files ) )
+
+    def prepare( self, cases ):
+        '''
+        Make what <cases> need and is not there yet
+        '''
+        if not os.path.isdir( self.workdir ):
+            fsutil.mkdir_p( self.workdir )
+        if any( cases_needs( name ) == 'media' for name in cases ):
+            if not os.path.exists( self.source ):
+                create_test_src( self.source, duration = self.duration, size = self.size, rate = self.rate )
+            if not os.path.exists( self.overlay ):
+                generate_thumbnail( self.source, self.overlay, time = 0.1, width = 64 )
+        if any( cases_needs( name ) == 'tree' for name in cases ):
+            if not os.path.isdir( self.tree ):
+                make_tree( self.tree, self.files )
+
+    def args( self ):
+        return [ '--duration', str( self.duration ),
+                 '--size',     self.size,
+                 '--rate',     str( self.rate ),
+                 '--files',    str( self.files ),
+                 '--sink',     self.sink ] + \
+               ( [ '--display', self.display ] if self.display else [] ) + \
+               ( [ '--reader-rate', str( self.reader_rate ) ] if self.reader_rate else [] )
+
+
+def _output( fx, name ):
+    if fx.sink == 'fifo':
+        return EmulatorSink( os.path.join( fx.workdir, name + '.fifo' ), rate = fx.reader_rate )
+    return FileSink( os.path.join( fx.workdir, name + '.raw' ) )
+
+def _stream_case( fx, name, make, limit = None ):
+    '''
+    Run the stream <make>( sink ) returns until it ends, or stop it
+    after <limit> seconds; time to first frame, sustained fps and what
+    the reader of an emulated device saw
+    '''
+    out   = _output( fx, name )
+    seen  = []
+    track = lambda snapshot : seen.append( snapshot ) if ( snapshot.get( 'frame' ) or 0 ) > 0 else None
+    t0    = time.time()
+    try:
+        stream = make( out )
+        try:
+            stream.metrics.subscribe( track )
+            if not seen:
+                track( stream.metrics.snapshot() ) # In before the subscription
+            try:
+                stream.wait( limit if limit is not None else fx.duration * 4 + 10 )
+            except subprocess.TimeoutExpired as e:
+                if limit is None:
+                    raise
+        finally:
+            stream.stop()
+    finally:
+        stats = out.stats
+        out.close()
+        if os.path.lexists( out.target ):
+            os.remove( out.target )
+
+    result = { 'frames' : None, 'fps' : None, 'first_frame' : None, 'bytes' : stats.get( 'bytes' ) }
+    for key in ( 'jitter_ms', 'stalls' ):
+        result[ key ] = stats.get( key )
+    if stats.get( 'first' ) is not None:
+        result[ 'first_frame' ] = stats[ 'first' ] - t0
+    elif seen:
+        result[ 'first_frame' ] = seen[0][ 'time' ] - t0
+    if seen:
+        first, last = seen[0], seen[-1]
+        result[ 'frames' ] = last[ 'frame' ]
+        if last[ 'time' ] > first[ 'time' ]:
+            result[ 'fps' ] = ( last[ 'frame' ] - first[ 'frame' ] ) / ( last[ 'time' ] - first[ 'time' ] )
+    return result
+
+def case_stream( fx ):
+    return _stream_case( fx, 'stream', lambda out : StreamProcess( fx.source, out, sink = True, verbose = False ) )
+
+def case_overlay( fx ):
+    return _stream_case( fx, 'overlay', lambda out : OverlayStreamProcess( fx.source, fx.overlay, out, sink = True, verbose = False ) )
+
+def case_desktop( fx ):
+    if not fx.display:
+        return None
+    return _stream_case( fx,
+                         'desktop',
+                         lambda out : DesktopStreamProcess( 0, 0, 640, 480, fx.display, out, verbose = False ),
+                         limit = fx.duration )
+
+def case_thumbnail( fx ):
+    out   = os.path.join( fx.workdir, 'thumbnail.jpg' )
+    error = generate_thumbnail( fx.source, out, time = fx.duration * 0.1, stderr = True )
+    if error:
+        raise RuntimeError( error )
+    return {}
+
+def case_gif( fx ):
+    # What the GUI's create_gif does, without the GUI
+    out = os.path.join( fx.workdir, 'preview.gif' )
+    generate_previews( fx.source, out, preview_times( probe_duration( fx.source ), 4 ), frames = False )
+    return {}
+
+def case_find( fx ):
+    return { 'items' : len( fsutil.find( fx.tree, MediaContainers().extensions() ) ) }
+
+def case_walk_media( fx ):
+    return { 'items' : sum( 1 for f in fsutil.walk_media( fx.tree, MediaContainers().extensions() ) ) }
+
+# name -> ( case, what it needs from the fixture )
+cases = OrderedDict( [ ( 'stream',     ( case_stream,     'media' ) ),
+                       ( 'overlay',    ( case_overlay,    'media' ) ),
+                       ( 'desktop',    ( case_desktop,    'display' ) ),
+                       ( 'thumbnail',  ( case_thumbnail,  'media' ) ),
+                       ( 'gif',        ( case_gif,        'media' ) ),
+                       ( 'find',       ( case_find,       'tree' ) ),
+                       ( 'walk_media', ( case_walk_media, 'tree' ) ) ] )
+
+def cases_needs( name ):
+    return cases[ name ][1]
+
+
+def count_spawns():
+    '''
+    Count the ffmpeg and ffprobe runs started from here on (helpers such
+    as an emulator's reader are not counted), returns a one item list
+    holding the count and the hook, to remove from spawn_hooks when done
+    '''
+    spawns = [ 0 ]
+    lock   = Lock()
+    def spawned( args ):
+        with lock:
+            spawns[0] += 1
+    spawn_hooks.append( spawned )
+    return spawns, spawned
+
+def measure( name, fx ):
+    '''
+    Run case <name> in this process and measure it, meant for a fresh
+    interpreter (see run_case) so resource usage is the case's own
+    '''
+    spawns, hook = count_spawns()
+    t0           = time.time()
+    result       = OrderedDict( [ ( 'status', 'ok' ) ] )
+    try:
+        extra = cases[ name ][0]( fx )
+        if extra is None:
+            result[ 'status' ] = 'skipped'
+        else:
+            result.update( extra )
+    except Exception as e:
+        result[ 'status' ] = 'failed'
+        result[ 'error' ]  = str( e )
+    finally:
+        spawn_hooks.remove( hook )
+    result[ 'wall' ] = time.time() - t0
+
+    own      = resource.getrusage( resource.RUSAGE_SELF )
+    children = resource.getrusage( resource.RUSAGE_CHILDREN )
+    result[ 'cpu' ]      = own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+    result[ 'peak_rss' ] = max( own.ru_maxrss, children.ru_maxrss )
+    result[ 'spawns' ]   = spawns[0]
+    return result
+
+def run_case( name, fx, timeout = 300 ):
+    '''
+    Run case <name> in a child interpreter, returns its measurements
+    '''
+    root = os.path.abspath( os.path.join( os.path.dirname( __file__ ), '..' ) )
+    env  = dict( os.environ )
+    env[ 'PYTHONPATH' ] = os.pathsep.join( p for p in ( root, env.get( 'PYTHONPATH' ) ) if p )
+    args = [ sys.executable, '-m', 'v4l2tricks.bench', name, fx.workdir ] + fx.args()
+    try:
+        out = subprocess.run( args, env = env, stdout = subprocess.PIPE, timeout = timeout ).stdout
+        return json.loads( out.decode( 'utf-8', 'replace' ).strip().splitlines()[-1], object_pairs_hook = OrderedDict )
+    except ( subprocess.TimeoutExpired, ValueError, IndexError ) as e:
+        return OrderedDict( [ ( 'status', 'failed' ), ( 'error', 'No result from the case: {}'.format( e ) ) ] )
+
+
+def start_xvfb( size = '1280x720', first = 99 ):
+    '''
+    A private X server for the desktop case: ( process, display ), or
+    ( None, None ) when Xvfb is not installed
+    '''
+    if shutil.which( 'Xvfb' ) is None:
+        return None, None
+    number = first
+    while os.path.exists( '/tmp/.X11-unix/X{}'.format( number ) ) or os.path.exists( '/tmp/.X{}-lock'.format( number ) ):
+        number += 1
+    display = ':{}'.format( number )
+    proc    = subprocess.Popen( [ 'Xvfb', display, '-screen', '0', '{}x24'.format( size ), '-nolisten', 'tcp' ],
+                                stdout = subprocess.DEVNULL,
+                                stderr = subprocess.DEVNULL )
+    deadline = time.time() + 5.0
+    while not os.path.exists( '/tmp/.X11-unix/X{}'.format( number ) ):
+        if proc.poll() is not None or time.time() > deadline:
+            proc.kill()
+            proc.wait()
+            return None, None
+        time.sleep( 0.05 )
+    return proc, display
+
+def ffmpeg_version():
+    try:
+        out = subprocess.run( [ 'ffmpeg', '-version' ], stdout = subprocess.PIPE, stderr = subprocess.DEVNULL ).stdout
+        return out.decode( 'utf-8', 'replace' ).splitlines()[0]
+    except ( OSError, IndexError ) as e:
+        return None
+
+def run_suite( fx, names = None, verbose = True ):
+    '''
+    Prepare the fixture and run every case of <names> (all by default),
+    returns the results as saved by save()
+    '''
+    names = list( names or cases.keys() )
+    fx.prepare( names )
+
+    xvfb = None
+    if 'desktop' in names and not fx.display:
+        xvfb, fx.display = start_xvfb( fx.size )
+        if xvfb is None and verbose:
+            print( 'Xvfb not found, the desktop case is skipped' )
+
+    results = OrderedDict()
+    try:
+        for name in names:
+            if verbose: print( 'Running {}...'.format( name ) )
+            results[ name ] = run_case( name, fx )
+            if verbose: print( format_case( name, results[ name ] ) )
+    finally:
+        if xvfb is not None:
+            xvfb.kill()
+            xvfb.wait()
+            fx.display = None
+
+    return OrderedDict( [ ( 'host',    platform.node() ),
+                          ( 'python',  platform.python_version() ),
+                          ( 'ffmpeg',  ffmpeg_version() ),
+                          ( 'time',    time.strftime( '%Y-%m-%dT%H:%M:%S' ) ),
+                          ( 'params',  OrderedDict( [ ( 'duration',    fx.duration ),
+                                                      ( 'size',        fx.size ),
+                                                      ( 'rate',        fx.rate ),
+                                                      ( 'files',       fx.files ),
+                                                      ( 'sink',        fx.sink ),
+                                                      ( 'reader_rate', fx.reader_rate ) ] ) ),
+                          ( 'cases',   results ) ] )
+
+
+def save( results, path ):
+    with open( path, 'w' ) as f:
+        json.dump( results, f, indent = 2 )
+
+def load( path ):
+    with open( path, 'r' ) as f:
+        return json.load( f, object_pairs_hook = OrderedDict )
+
+def compare( baseline, current, tolerance = default_tolerance ):
+    '''
+    Regressions of <current> against <baseline>: a metric is flagged
+    when it got worse by more than <tolerance> (relative) and more than
+    its noise floor (see bench_metrics).  Cases that did not run in both
+    are not compared.
+    '''
+    regressions = []
+    for name, now in current[ 'cases' ].items():
+        base = baseline.get( 'cases', {} ).get( name )
+        if base is None or base.get( 'status' ) != 'ok' or now.get( 'status' ) != 'ok':
+            continue
+        for metric, ( lower, noise ) in bench_metrics.items():
+            b, n = base.get( metric ), now.get( metric )
+            if b is None or n is None:
+                continue
+            worse = n - b if lower else b - n
+            if worse > noise and worse > abs( b ) * tolerance:
+                change = ( n - b ) / b if b else float( 'inf' )
+                regressions.append( Regression( name, metric, b, n, change ) )
+    return regressions
+
+def format_case( name, result ):
+    '''
+    One line per case, e.g. for the console
+    '''
+    if result.get( 'status' ) != 'ok':
+        return '{0:<12} {1}{2}'.format( name, result.get( 'status' ),
+                                        ': ' + result[ 'error' ] if result.get( 'error' ) else '' )
+    fmt = lambda key, spec, unit = '' : format( result[ key ], spec ) + unit if result.get( key ) is not None else 'N/A'
+    return '{0:<12} first_frame={1} fps={2} jitter={3} stalls={4} wall={5} cpu={6} peak_rss={7} spawns={8}'.format(
+        name,
+        fmt( 'first_frame', '.3f', 's' ),
+        fmt( 'fps', '.1f' ),
+        fmt( 'jitter_ms', '.1f', 'ms' ),
+        fmt( 'stalls', 'd' ),
+        fmt( 'wall', '.3f', 's' ),
+        fmt( 'cpu', '.3f', 's' ),
+        fmt( 'peak_rss', 'd', 'KiB' ),
+        fmt( 'spawns', 'd' ) )
+
+def format_regression( r ):
+    return '{0:<12} {1:<12} {2:.4g} -> {3:.4g} ({4:+.1%})'.format( r.case, r.metric, r.baseline, r.current, r.change )
+
+
+def main():
+    '''
+    Child side of run_case: measure one case, print it as JSON last
+    '''
+    import argparse
+    parser = argparse.ArgumentParser( description='Run one benchmark case' )
+    parser.add_argument( 'case', choices = list( cases.keys() ) )
+    parser.add_argument( 'workdir' )
+    parser.add_argument( '--duration', type = float, default = 5 )
+    parser.add_argument( '--size', default = '1280x720' )
+    parser.add_argument( '--rate', type = int, default = 30 )
+    parser.add_argument( '--files', type = int, default = 20000 )
+    parser.add_argument( '--sink', choices = [ 'fifo', 'file' ], default = 'fifo' )
+    parser.add_argument( '--display', default = None )
+    parser.add_argument( '--reader-rate', type = float, default = None )
+
+    # Parse the arguments
+    args = parser.parse_args()
+    fx = Fixture( args.workdir, args.duration, args.size, args.rate, args.files, args.sink, args.display, args.reader_rate )
+    result = measure( args.case, fx )
+    sys.stdout.flush()
+    print( json.dumps( result ) )
+
+
+# Standard biolerplate to call the main() function to begin the program
+if __name__ == '__main__':
+    main()
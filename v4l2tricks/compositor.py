@@ -0,0 +1,405 @@
+# -*- coding: utf-8 -*-
+"""Compositor - overlay layers blended into raw frames with NumPy
+"""
+import time
+import hashlib
+from threading import Thread, Lock
+from collections import OrderedDict, namedtuple
+
+import ffmpeg
+
+try:
+    import numpy as np
+except ImportError as e:
+    np = None
+
+from .ffmpeg_if import FrameTap, probe_info
+from .planner   import _aligned
+from .pixfmt    import subsampling
+from .sink      import open_writer
+
+# RGB -> Y'CbCr, BT.601 limited range (ffmpeg's default for these formats)
+yuv_matrix = ( (  65.481, 128.553,  24.966 ),
+               ( -37.797, -74.203, 112.0   ),
+               ( 112.0,   -93.786, -18.214 ) )
+yuv_offset = ( 16.0, 128.0, 128.0 )
+
+# Packed RGB formats: the RGBA channels of each output channel, 3 is
+# the alpha (written as opaque, so it composites like a colour)
+rgb_channels = {
+    'rgb24' : ( 0, 1, 2 ),
+    'bgr24' : ( 2, 1, 0 ),
+    'rgba'  : ( 0, 1, 2, 3 ),
+    'bgra'  : ( 2, 1, 0, 3 ),
+    'bgr0'  : ( 2, 1, 0, 3 ),
+}
+
+yuv_formats = ( 'gray', 'yuv420p', 'nv12', 'yuyv422', 'uyvy422' )
+
+
+def load_image( path ):
+    '''
+    RGBA array ( height, width, 4 ) of the image at <path>, decoded by
+    ffmpeg (any format it reads, the first frame of a video)
+    '''
+    info = probe_info( path )
+    out, err = (
+        ffmpeg
+        .input( path )
+        .output( 'pipe:', format='rawvideo', pix_fmt='rgba', vframes=1 )
+        .run( capture_stdout = True, capture_stderr = True )
+    )
+    return np.frombuffer( out, dtype = np.uint8 ).reshape( info[ 'height' ], info[ 'width' ], 4 )
+
+def as_rgba( image ):
+    '''
+    <image> (a path or an array, gray, RGB or RGBA) as an RGBA array
+    '''
+    if isinstance( image, str ):
+        return load_image( image )
+    image = np.asarray( image, dtype = np.uint8 )
+    if image.ndim == 2:
+        image = image[ :, :, None ].repeat( 3, axis = 2 )
+    if image.shape[ 2 ] == 3:
+        alpha = np.full( image.shape[ :2 ] + ( 1, ), 255, dtype = np.uint8 )
+        image = np.concatenate( ( image, alpha ), axis = 2 )
+    return image
+
+def planes( frame, width, height, pix_fmt ):
+    '''
+    Views of the planes of <frame> (shaped as pixfmt.shape): Y, U, V
+    for yuv420p, Y and interleaved UV for nv12, the frame itself for
+    packed formats
+    '''
+    if pix_fmt == 'yuv420p':
+        flat   = frame.reshape( -1 )
+        luma   = width * height
+        chroma = ( width // 2 ) * ( height // 2 )
+        return [ flat[ :luma ].reshape( height, width ),
+                 flat[ luma:luma + chroma ].reshape( height // 2, width // 2 ),
+                 flat[ luma + chroma:luma + 2 * chroma ].reshape( height // 2, width // 2 ) ]
+    if pix_fmt == 'nv12':
+        flat = frame.reshape( -1 )
+        luma = width * height
+        return [ flat[ :luma ].reshape( height, width ),
+                 flat[ luma: ].reshape( height // 2, width // 2, 2 ) ]
+    return [ frame ]
+
+
+# One plane of a converted layer: subsampling ( x, y ) of the plane,
+# premultiplied values and 255 - alpha (uint16, in the plane's layout)
+# and two scratch buffers of the same shape for the blend
+Plane = namedtuple( 'Plane', 'sx sy values inverse scratch carry' )
+
+class Converted( object ):
+    '''
+    Converted
+
+    A layer in the output pix_fmt, made once (see convert): premultiplied
+    planes cropped to where alpha is not 0, <ox>, <oy> the offset of the
+    crop in the image, placed on multiples of <sx>, <sy> (the chroma
+    subsampling)
+    '''
+    def __init__( self, planes, width, height, ox, oy, sx = 1, sy = 1 ):
+        super( Converted, self ).__init__()
+        self.planes = planes
+        self.width  = width
+        self.height = height
+        self.ox     = ox
+        self.oy     = oy
+        self.sx     = sx
+        self.sy     = sy
+
+def _plane( sx, sy, values, alpha ):
+    '''
+    Plane of <values> (float, any shape) at integer <alpha> (broadcast):
+    floor( v * a / 255 ), so blending never goes over 255 (see blend)
+    '''
+    values  = np.floor( values * alpha / 255.0 ).astype( np.uint16 )
+    inverse = ( 255 - alpha ).astype( np.uint16 )
+    return Plane( sx, sy, values, inverse, np.empty( values.shape, np.uint16 ), np.empty( values.shape, np.uint16 ) )
+
+def _blocks( array, sx, sy ):
+    '''
+    Mean of every <sx>x<sy> block of the first two axes
+    '''
+    h, w = array.shape[ :2 ]
+    return array.reshape( ( h // sy, sy, w // sx, sx ) + array.shape[ 2: ] ).mean( axis = ( 1, 3 ) )
+
+def convert( image, pix_fmt, opacity = 1.0 ):
+    '''
+    Converted <image> (RGBA) for frames of <pix_fmt>, at <opacity>
+    '''
+    alpha = np.rint( image[ :, :, 3 ].astype( np.float64 ) * opacity ).astype( np.int32 )
+
+    # Only where something shows, aligned to the chroma subsampling
+    sx, sy = subsampling.get( pix_fmt, ( 1, 1 ) )
+    rows = np.flatnonzero( alpha.any( axis = 1 ) )
+    cols = np.flatnonzero( alpha.any( axis = 0 ) )
+    if len( rows ) == 0:
+        return Converted( [], 0, 0, 0, 0 )
+    y0, x0 = rows[ 0 ] - rows[ 0 ] % sy, cols[ 0 ] - cols[ 0 ] % sx
+    y1, x1 = rows[ -1 ] + 1, cols[ -1 ] + 1
+    y1, x1 = y1 + ( -y1 ) % sy, x1 + ( -x1 ) % sx
+    h, w   = y1 - y0, x1 - x0
+
+    # Padded with transparent pixels up to the subsampling
+    rgb = np.zeros( ( h, w, 3 ), dtype = np.float64 )
+    a   = np.zeros( ( h, w ), dtype = np.int32 )
+    src = image[ y0:y1, x0:x1 ]
+    rgb[ :src.shape[ 0 ], :src.shape[ 1 ] ] = src[ :, :, :3 ]
+    a[ :src.shape[ 0 ], :src.shape[ 1 ] ]   = alpha[ y0:y1, x0:x1 ]
+
+    if pix_fmt in rgb_channels:
+        full   = np.concatenate( ( rgb, np.full( ( h, w, 1 ), 255.0 ) ), axis = 2 )
+        values = full[ :, :, list( rgb_channels[ pix_fmt ] ) ]
+        return Converted( [ _plane( 1, 1, values, a[ :, :, None ] ) ], w, h, x0, y0, sx, sy )
+
+    if pix_fmt not in yuv_formats:
+        raise ValueError( 'Unsupported pix_fmt for compositing: {}'.format( pix_fmt ) )
+
+    yuv = np.dot( rgb, np.array( yuv_matrix ).T ) / 255.0 + np.array( yuv_offset )
+    if pix_fmt == 'gray':
+        return Converted( [ _plane( 1, 1, yuv[ :, :, 0 ], a ) ], w, h, x0, y0, sx, sy )
+
+    # Chroma: premultiplied per pixel then averaged, with the block's
+    # mean alpha rounded, so the floor still bounds the blend
+    ca     = np.rint( _blocks( a.astype( np.float64 ), sx, sy ) ).astype( np.int32 )
+    cuv    = _blocks( yuv[ :, :, 1: ] * a[ :, :, None ], sx, sy ) / np.maximum( ca, 1 )[ :, :, None ]
+    luma   = _plane( 1, 1, yuv[ :, :, 0 ], a )
+    if pix_fmt == 'yuv420p':
+        return Converted( [ luma, _plane( sx, sy, cuv[ :, :, 0 ], ca ), _plane( sx, sy, cuv[ :, :, 1 ], ca ) ], w, h, x0, y0, sx, sy )
+    if pix_fmt == 'nv12':
+        return Converted( [ luma, _plane( sx, sy, cuv, ca[ :, :, None ] ) ], w, h, x0, y0, sx, sy )
+
+    # 4:2:2 packed: per pixel ( Y, U or V ), U on even columns
+    chroma = np.empty( ( h, w ), dtype = np.float64 )
+    chroma[ :, 0::2 ], chroma[ :, 1::2 ] = cuv[ :, :, 0 ], cuv[ :, :, 1 ]
+    calpha = ca.repeat( 2, axis = 1 )
+    if pix_fmt == 'yuyv422':
+        values = np.stack( ( yuv[ :, :, 0 ], chroma ), axis = 2 )
+        alphas = np.stack( ( a, calpha ), axis = 2 )
+    else:
+        values = np.stack( ( chroma, yuv[ :, :, 0 ] ), axis = 2 )
+        alphas = np.stack( ( calpha, a ), axis = 2 )
+    return Converted( [ _plane( 1, 1, values, alphas ) ], w, h, x0, y0, sx, sy )
+
+def blend( dst, plane, rows, cols ):
+    '''
+    dst = values + dst * inverse / 255 over the <rows>, <cols> slices of
+    the plane, in place, in the plane's scratch buffers (no allocation)
+    '''
+    values, inverse = plane.values[ rows, cols ], plane.inverse[ rows, cols ]
+    scratch, carry  = plane.scratch[ rows, cols ], plane.carry[ rows, cols ]
+    np.multiply( dst, inverse, out = scratch )
+    # x / 255 rounded, exact for x <= 255 * 255
+    scratch += 128
+    np.right_shift( scratch, 8, out = carry )
+    scratch += carry
+    scratch >>= 8
+    scratch += values
+    np.copyto( dst, scratch, casting = 'unsafe' )
+
+
+# A placed layer: its name, what it shows, where and how opaque
+Layer = namedtuple( 'Layer', 'name key converted x y opacity' )
+
+class Compositor( object ):
+    '''
+    Compositor
+
+    Blends layers into frames of <width>x<height> <pix_fmt> in place.
+    Each image is converted once to premultiplied alpha in the frame's
+    layout (see convert) and cached, per opacity, for as long as a layer
+    shows it; composite() then only touches the region each layer
+    covers, a few vectorized operations per plane.  add(), move(),
+    set_opacity() and remove() may be called from another thread while
+    frames are composited (they never wait for one), layers are drawn in
+    the order they were added.  Positions are rounded down to the chroma
+    subsampling.
+    '''
+    def __init__( self, width, height, pix_fmt = 'yuv420p' ):
+        super( Compositor, self ).__init__()
+        if np is None:
+            raise ImportError( 'Compositor requires numpy' )
+        self.width   = width
+        self.height  = height
+        self.pix_fmt = pix_fmt
+        self._lock   = Lock()
+        self._layers = OrderedDict()
+        self._order  = () # Snapshot read by composite()
+        self._images = {} # key -> RGBA array
+        self._cache  = {} # ( key, opacity ) -> Converted
+        self.frames  = 0
+        self.seconds = 0.0
+
+    def _key( self, image ):
+        if isinstance( image, str ):
+            return image
+        image = np.ascontiguousarray( image )
+        return hashlib.sha1( image.tobytes() + str( image.shape ).encode( 'ascii' ) ).hexdigest()
+
+    def _converted( self, key, image, opacity ):
+        converted = self._cache.get( ( key, opacity ) )
+        if converted is None:
+            rgba = self._images.get( key )
+            if rgba is None:
+                rgba = self._images[ key ] = as_rgba( image )
+            converted = self._cache[ ( key, opacity ) ] = convert( rgba, self.pix_fmt, opacity )
+        return converted
+
+    def _publish( self ):
+        self._order = tuple( self._layers.values() )
+        # Only what a layer still shows is kept, e.g. not every step of a fade
+        live = set( ( layer.key, layer.opacity ) for layer in self._order )
+        for cached in [ cached for cached in self._cache if cached not in live ]:
+            del self._cache[ cached ]
+        keys = set( key for key, opacity in live )
+        for key in [ key for key in self._images if key not in keys ]:
+            del self._images[ key ]
+
+    def add( self, name, image, x = 0, y = 0, opacity = 1.0 ):
+        '''
+        Show <image> (a path or an array) as layer <name> at <x>, <y>,
+        replacing a layer of the same name
+        '''
+        key = self._key( image )
+        with self._lock:
+            converted = self._converted( key, image, opacity )
+            self._layers[ name ] = Layer( name, key, converted, int( x ), int( y ), opacity )
+            self._publish()
+        return name
+
+    def move( self, name, x, y ):
+        with self._lock:
+            self._layers[ name ] = self._layers[ name ]._replace( x = int( x ), y = int( y ) )
+            self._publish()
+
+    def set_opacity( self, name, opacity ):
+        with self._lock:
+            layer     = self._layers[ name ]
+            converted = self._converted( layer.key, None, opacity )
+            self._layers[ name ] = layer._replace( converted = converted, opacity = opacity )
+            self._publish()
+
+    def remove( self, name ):
+        with self._lock:
+            self._layers.pop( name, None )
+            self._publish()
+
+    def clear( self ):
+        with self._lock:
+            self._layers.clear()
+            self._publish()
+
+    def names( self ):
+        return [ layer.name for layer in self._order ]
+
+    def __contains__( self, name ):
+        return name in self._layers
+
+    def __len__( self ):
+        return len( self._order )
+
+    def composite( self, frame ):
+        '''
+        Blend every layer into <frame> (pixfmt.shape array), returns it
+        '''
+        t0     = time.perf_counter()
+        views  = None
+        for layer in self._order:
+            c = layer.converted
+            if not c.planes:
+                continue
+            x = layer.x - layer.x % c.sx + c.ox
+            y = layer.y - layer.y % c.sy + c.oy
+            x0, y0 = max( x, 0 ), max( y, 0 )
+            x1, y1 = min( x + c.width, self.width ), min( y + c.height, self.height )
+            if x0 >= x1 or y0 >= y1:
+                continue
+            if views is None:
+                views = planes( frame, self.width, self.height, self.pix_fmt )
+            for plane, view in zip( c.planes, views ):
+                px, py = plane.sx, plane.sy
+                dst    = view[ y0 // py:y1 // py, x0 // px:x1 // px ]
+                blend( dst, plane,
+                       slice( ( y0 - y ) // py, ( y1 - y ) // py ),
+                       slice( ( x0 - x ) // px, ( x1 - x ) // px ) )
+        self.frames  += 1
+        self.seconds += time.perf_counter() - t0
+        return frame
+
+    @property
+    def cost( self ):
+        '''
+        Mean seconds per composite()
+        '''
+        return self.seconds / self.frames if self.frames else None
+
+
+class CompositeStream( object ):
+    '''
+    CompositeStream
+
+    FrameTap -> Compositor -> frame writer (V4l2Writer on a device, see
+    sink.open_writer) on a thread: decoded frames get the compositor's
+    layers and go straight to <device>.  self.compositor changes the
+    layers while streaming, nothing is restarted.  <layers> are
+    ( name, image, x, y[, opacity] ) to start with.
+    '''
+    def __init__( self, fname, device = '/dev/video20', layers = (), width = None, height = None, pix_fmt = 'yuv420p',
+                  realtime = True, verbose = True ):
+        super( CompositeStream, self ).__init__()
+        if width is None or height is None:
+            info          = probe_info( fname )
+            width, height = _aligned( width or info[ 'width' ], height or info[ 'height' ], pix_fmt )
+        self.compositor = Compositor( width, height, pix_fmt )
+        for layer in layers:
+            self.compositor.add( *layer )
+        self.writer   = open_writer( device, width, height, pix_fmt )
+        try:
+            self.tap  = FrameTap( fname, width, height, pix_fmt, realtime = realtime, verbose = verbose )
+        except Exception as e:
+            self.writer.close()
+            raise
+        self.metrics  = self.tap.metrics
+        self.frames   = 0
+        self.error    = None
+        self._stopped = False
+        self._thread  = Thread( target = self.run, name = 'CompositeStream' )
+        self._thread.daemon = True
+        self._thread.start()
+
+    def run( self ):
+        try:
+            for frame in self.tap:
+                if self._stopped:
+                    break
+                self.writer.write( self.compositor.composite( frame ) )
+                self.frames += 1
+        except ( OSError, ValueError ) as e:
+            # ValueError: stop() closed the tap under a read
+            if not self._stopped:
+                self.error = e
+                print( 'Compositing stopped: {}'.format( e ) )
+
+    @property
+    def alive( self ):
+        return self._thread.is_alive()
+
+    @property
+    def readline( self ):
+        return self.tap.readline
+
+    @property
+    def outputs( self ):
+        return [ self.writer.sink ] if self.writer.sink is not None else []
+
+    def wait( self, timeout = None ):
+        self._thread.join( timeout )
+
+    def stop( self ):
+        self._stopped = True
+        self.tap.stop()
+        self._thread.join()
+        self.writer.close()
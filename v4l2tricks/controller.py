@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""Controller - event driven stream lifecycle
+"""
+import time
+from collections import deque
+from threading import Thread, Condition
+
+# States
+IDLE      = 'idle'
+STARTING  = 'starting'
+STREAMING = 'streaming'
+STOPPING  = 'stopping'
+EXITED    = 'exited'
+
+
+class StreamController( object ):
+    '''
+    StreamController
+
+    Owns one stream at a time, made by <launch>() (a StreamProcess or
+    anything with wait(), stop() and metrics).  start(), stop() and
+    switch() only record the request and wake the controller, run()
+    sleeps on a condition until there is a request or the stream exits,
+    so an idle controller costs nothing and a request is acted on at
+    once.  With <restart> a stream that ends on its own is started again
+    until stop(): at once if it ran for <stable> seconds, else after a
+    delay doubling from <backoff> up to <max_backoff>.  After
+    <max_failures> short runs in a row the controller gives up, goes
+    IDLE and keeps the reason in error.
+
+    Latencies (s) are kept per kind:
+        start       request -> ffmpeg launched
+        first_frame request -> first progress block with frames out
+        stop        request -> ffmpeg gone
+        switch      request -> old stream gone and new one launched
+    '''
+    def __init__( self, launch, restart = True, report = 2.0, verbose = True, history = 50,
+                  backoff = 1.0, max_backoff = 30.0, stable = 10.0, max_failures = 5 ):
+        super( StreamController, self ).__init__()
+        self._launch       = launch
+        self._restart      = restart
+        self._backoff      = backoff
+        self._max_backoff  = max_backoff
+        self._stable       = stable
+        self._max_failures = max_failures
+        self._failures     = 0    # Short runs in a row
+        self._started      = 0.0  # When the current stream was launched
+        self._report       = report
+        self._verbose      = verbose
+        self._cond         = Condition()
+        self._want         = False
+        self._requests     = 0    # Bumped by every request
+        self._requested    = 0.0  # Time of the latest request
+        self._ended        = False
+        self._exit         = False
+        self._thread       = None
+        self.state         = IDLE
+        self.stream        = None
+        self.error         = None
+        self.latencies     = { kind : deque( maxlen = history ) for kind in ( 'start', 'first_frame', 'stop', 'switch' ) }
+        self.on_state      = None # Callback( state ), called from the controller thread
+
+    # Requests, from any thread
+    def start( self ):
+        with self._cond:
+            if self._want:
+                return
+            self._request( True )
+
+    def stop( self ):
+        with self._cond:
+            if not self._want:
+                return
+            self._request( False )
+
+    def switch( self ):
+        '''
+        Replace the stream by a new one from <launch>() (e.g. another file)
+        '''
+        with self._cond:
+            self._request( True )
+
+    def _request( self, want ):
+        self._want      = want
+        self._requests += 1
+        self._requested = time.time()
+        self._cond.notify_all()
+
+    def exit( self, timeout = None ):
+        with self._cond:
+            self._exit = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join( timeout )
+
+    @property
+    def streaming( self ):
+        return self._want
+
+    # Controller
+    def spawn( self ):
+        '''
+        run() on a daemon thread
+        '''
+        self._thread = Thread( target = self.run, name = 'StreamController' )
+        self._thread.daemon = True
+        self._thread.start()
+        return self._thread
+
+    def run( self ):
+        seen = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for( lambda : self._exit or self._ended or self._requests != seen )
+                if self._exit:
+                    break
+                changed   = self._requests != seen
+                ended     = self._ended
+                seen      = self._requests
+                want      = self._want
+                requested = self._requested
+                self._ended = False
+
+            if changed:
+                switching = self.stream is not None and want
+                if self.stream is not None:
+                    self._stop_stream()
+                    if not want:
+                        self._record( 'stop', requested )
+                if want:
+                    self._failures = 0
+                    self._start_stream( requested )
+                    self._record( 'switch' if switching else 'start', requested )
+            elif ended:
+                # The stream exited by itself (end of file, error)
+                self._stop_stream()
+                delay = self._restart_delay()
+                with self._cond:
+                    if delay is not None and delay > 0:
+                        # Any request (or exit) cuts the wait short and wins
+                        self._cond.wait_for( lambda : self._exit or self._requests != seen, delay )
+                    again = self._want and self._restart and self._requests == seen and delay is not None
+                    if not again and self._requests == seen:
+                        self._want = False
+                if again and not self._exit:
+                    self._start_stream( time.time() )
+
+        self._stop_stream()
+        self._set_state( EXITED )
+
+    def _restart_delay( self ):
+        '''
+        Seconds to wait before a restart, None to give up
+        '''
+        if time.time() - self._started >= self._stable:
+            self._failures = 0
+            return 0.0
+        self._failures += 1
+        if self._failures > self._max_failures:
+            self.error = RuntimeError( 'Stream exited {} times within {}s of starting'.format( self._failures, self._stable ) )
+            print( 'Not restarting: {}'.format( self.error ) )
+            self._failures = 0
+            return None
+        return min( self._backoff * 2 ** ( self._failures - 1 ), self._max_backoff )
+
+    def _set_state( self, state ):
+        self.state = state
+        if self.on_state is not None:
+            self.on_state( state )
+
+    def _record( self, kind, since ):
+        latency = time.time() - since
+        self.latencies[ kind ].append( latency )
+        if self._verbose: print( '{} latency {:.3f}s'.format( kind, latency ) )
+
+    def _start_stream( self, requested ):
+        self._set_state( STARTING )
+        try:
+            stream = self._launch()
+        except Exception as e:
+            print( 'Could not start stream: {}'.format( e ) )
+            self.error = e
+            with self._cond:
+                self._want = False
+            self._set_state( IDLE )
+            return
+
+        self.error    = None
+        self.stream   = stream
+        self._started = time.time()
+        metrics     = getattr( stream, 'metrics', None )
+        if metrics is not None:
+            metrics.subscribe( self._progress( metrics, requested ) )
+
+        watcher = Thread( target = self._watch, args = ( stream, ), name = 'StreamWatcher' )
+        watcher.daemon = True
+        watcher.start()
+        self._set_state( STREAMING )
+
+    def _progress( self, metrics, requested ):
+        last  = [ time.time(), False ]
+        def update( snapshot ):
+            if not last[1] and ( snapshot.get( 'frame' ) or 0 ) > 0:
+                last[1] = True
+                self._record( 'first_frame', requested )
+            if self._verbose and time.time() - last[0] >= self._report:
+                last[0] = time.time()
+                print( metrics.summary() )
+        return update
+
+    def _watch( self, stream ):
+        # Blocks in waitpid, nothing polls
+        stream.wait()
+        with self._cond:
+            if stream is self.stream:
+                self._ended = True
+                self._cond.notify_all()
+
+    def _stop_stream( self ):
+        stream, self.stream = self.stream, None
+        if stream is None:
+            return
+        self._set_state( STOPPING )
+        stream.stop()
+        lines = getattr( stream, 'lines', None )
+        if lines is not None and self._verbose:
+            for line in lines():
+                print( line )
+        self._set_state( IDLE )
+
+    def summary( self ):
+        '''
+        Latencies as one line, e.g. for the console
+        '''
+        parts = []
+        for kind in ( 'start', 'first_frame', 'switch', 'stop' ):
+            values = self.latencies[ kind ]
+            if values:
+                parts.append( '{}={:.3f}s (max {:.3f}s, n={})'.format(
+                    kind, sum( values ) / len( values ), max( values ), len( values ) ) )
+        return ' '.join( parts ) if parts else 'no streams yet'
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""Emulator - headless stand-in for a v4l2loopback reader
+"""
+import sys
+import json
+import math
+import time
+
+# An interval longer than this many frame periods counts as a stall
+stall_factor = 2.0
+
+
+class ReaderStats( object ):
+    '''
+    ReaderStats
+
+    What a client of the device would see: frames received, the
+    interval between them (mean, jitter as its standard deviation,
+    max) and stalls, intervals over <stall> frame periods.  The frame
+    period is 1 / <rate>, or the mean interval so far when reading as
+    fast as frames come.  Running sums only, nothing grows per frame.
+    '''
+    def __init__( self, rate = None, stall = stall_factor ):
+        super( ReaderStats, self ).__init__()
+        self.rate      = rate
+        self.stall     = stall
+        self.frames    = 0
+        self.bytes     = 0
+        self.stalls    = 0
+        self.first     = None # time.time() of the first frame
+        self.started   = None # time.monotonic() of the first frame
+        self._last     = None
+        self._count    = 0    # Intervals
+        self._mean     = 0.0
+        self._m2       = 0.0
+        self._max      = 0.0
+
+    def frame( self, size, now = None ):
+        now = time.monotonic() if now is None else now
+        if self._last is None:
+            self.first   = time.time()
+            self.started = now
+        else:
+            interval = now - self._last
+            period   = 1.0 / self.rate if self.rate else self._mean
+            if self._count >= 2 and interval > period * self.stall:
+                self.stalls += 1
+            # Welford
+            self._count += 1
+            delta        = interval - self._mean
+            self._mean  += delta / self._count
+            self._m2    += delta * ( interval - self._mean )
+            self._max    = max( self._max, interval )
+        self._last   = now
+        self.frames += 1
+        self.bytes  += size
+
+    def as_dict( self ):
+        jitter  = math.sqrt( self._m2 / self._count ) if self._count > 1 else None
+        elapsed = self._last - self.started if self._count else 0.0
+        return { 'frames'      : self.frames,
+                 'bytes'       : self.bytes,
+                 'first'       : self.first,
+                 'fps'         : self._count / elapsed if elapsed > 0 else None,
+                 'interval_ms' : self._mean * 1000.0 if self._count else None,
+                 'jitter_ms'   : jitter * 1000.0 if jitter is not None else None,
+                 'max_ms'      : self._max * 1000.0 if self._count else None,
+                 'stalls'      : self.stalls }
+
+
+def consume( path, frame_size, rate = None, stall = stall_factor, report = 1.0, on_report = None ):
+    '''
+    Read rawvideo frames of <frame_size> bytes from <path> (a FIFO or a
+    file) until EOF, <rate> frames per second at most (None: as fast as
+    they come), <on_report>( stats ) every <report> seconds and at the
+    end.  Returns the final stats (see ReaderStats).
+    '''
+    stats = ReaderStats( rate, stall )
+    frame = bytearray( frame_size )
+    view  = memoryview( frame )
+    last  = time.monotonic()
+    with open( path, 'rb', buffering = 0 ) as f:
+        while True:
+            got = 0
+            while got < frame_size:
+                n = f.readinto( view[ got: ] )
+                if not n:
+                    break
+                got += n
+            if got < frame_size:
+                break # EOF, a partial frame is not a frame
+            stats.frame( frame_size )
+
+            now = time.monotonic()
+            if rate:
+                # Take the next frame when a client at <rate> would
+                wake = stats.started + stats.frames / float( rate )
+                if wake > now:
+                    time.sleep( wake - now )
+            if on_report is not None and now - last >= report:
+                last = now
+                on_report( stats.as_dict() )
+
+    result = stats.as_dict()
+    if on_report is not None:
+        on_report( result )
+    return result
+
+
+def main():
+    '''
+    Reader process of EmulatorSink: stats as one JSON line per report
+    '''
+    import argparse
+    parser = argparse.ArgumentParser( description='Consume rawvideo like a v4l2loopback client' )
+    parser.add_argument( 'path', help = 'FIFO or file to read' )
+    parser.add_argument( 'frame_size', type = int, help = 'Bytes per frame' )
+    parser.add_argument( '-r', '--rate', type = float, default = None,
+                         help = 'Frames per second to read at (default: as fast as they come)' )
+    parser.add_argument( '-s', '--stall', type = float, default = stall_factor,
+                         help = 'Frame periods making a stall (default: {})'.format( stall_factor ) )
+    parser.add_argument( '--report', type = float, default = 1.0,
+                         help = 'Seconds between reports (default: 1)' )
+
+    # Parse the arguments
+    args = parser.parse_args()
+
+    def report( stats ):
+        sys.stdout.write( json.dumps( stats ) + '\n' )
+        sys.stdout.flush()
+    consume( args.path, args.frame_size, args.rate, args.stall, args.report, report )
+
+
+# Standard biolerplate to call the main() function to begin the program
+if __name__ == '__main__':
+    main()
@@ -4,10 +4,41 @@
 """
 import os
 import sys
+import time
 import ffmpeg
-from threading import Thread
+import subprocess
+from threading import Thread, Lock, Condition
+from collections import OrderedDict, namedtuple
 
-buffersize = 1024
+try:
+    import numpy as np
+except ImportError as e:
+    np = None
+
+from .probecache import ProbeCache
+from .pixfmt     import frame_size, shape
+from .reactor    import reactor
+from .progress   import StreamMetrics
+from .sink       import as_sink
+from .planner    import plan, _aligned
+from .process    import Limits
+
+# Shared, persistent ffprobe results (see probe_info)
+probe_cache = ProbeCache()
+
+# Callbacks( args ) told of each ffmpeg / ffprobe started here, e.g. to
+# count them (see bench.count_spawns)
+spawn_hooks = []
+
+# Input options used when the stream parameters are already known
+fast_probesize       = 128 * 1024
+fast_analyzeduration = 100000 # microseconds
+
+# Batched thumbnails: inputs per ffmpeg run and wall time aimed for per run
+thumbnail_batch      = 8
+thumbnail_batch_max  = 64
+thumbnail_batch_time = 4.0
+_thumbnail_k         = thumbnail_batch # Where the last generate_thumbnails left K
 
 
 try:
@@ -16,29 +47,6 @@ except ImportError as e:
     # Python 2.x
     from Queue import Queue, Empty
 
-def queue_stdout( process, queue ):
-    print( 'queuing stdout' )
-    while process.poll() is None:
-        buf = process.stdout.read( buffersize )
-        queue.put( buf )
-    print('closing stdout' )
-    process.stdout.close()
-
-def queue_stderr( process, queue ):
-    print( 'queuing stderr' )
-    while process.poll() is None:
-        try:
-            queue.put( process.stderr.next() )
-        except StopIteration as e:
-            print( 'stop iteration' )
-            pass
-    print('closing stdout' )
-    process.stdout.close()
-
-def process_communicate( process, queue ):
-    out, err = process.communicate()
-
-
 class StreamProcess( object ):
     '''
     StreamProcess
@@ -46,66 +54,141 @@ class StreamProcess( object ):
     https://github.com/kkroening/ffmpeg-python/issues/156#issuecomment-449553709
 
     Should '-hwaccel vdpau' be set?
+
+    <device> is a path, written with -f <fmt>, or a Sink (see sink.py),
+    e.g. an EmulatorSink to run without v4l2loopback.
+
+    <limits> (process.Limits) pins ffmpeg to cpus, sets its nice/ionice
+    and caps its threads, see orchestrator.Orchestrator.
     '''
-    def __init__( self, fname, device = '/dev/video20', sink = False, verbose = True ):
+    output = None # Sink, see open_output
+    limits = None # Limits, see launch
+
+    def __init__( self, fname, device = '/dev/video20', sink = False, verbose = True, fast_open = True, loop = False, fmt = 'v4l2', limits = None ):
         super( StreamProcess, self ).__init__()
         self._stdout_q = Queue()
         self._stderr_q = Queue()
         self._verbose = verbose
+        self.limits   = limits
         if verbose: print( 'Attempting to Stream: {} to {}'.format( fname, device ) )
-        width, height, num_frames = probe( fname )
-        if verbose: print( '{0}: w={1}, h={2}'.format( fname, width, height ) )
+        info   = probe_info( fname )
+        if verbose: print( '{0}: w={1}, h={2}'.format( fname, info[ 'width' ], info[ 'height' ] ) )
 
-        # Create ffmpeg interface process
-        stream = ffmpeg.input(
-            fname,
-            re=None,
-            hide_banner=None,
-            loglevel='error'
-        ).output(
-            device,
-            vf = 'scale={}:-1'.format( width ),#, height),
-            pix_fmt='yuv420p',
-            #pix_fmt='yuyv422',
-            f='v4l2'
-        )
-        if verbose: print( stream.compile() )
+        # Only the filters the source actually needs for the device
+        self.plan = plan( info, pix_fmt = 'yuv420p' )
+        if verbose: print( self.plan.explain() )
+        output = self.open_output( device, self.plan.width, self.plan.height, self.plan.pix_fmt, fmt )
 
+        try:
+            # Parameters are known, so ffmpeg can skip most of its own probing
+            input_args = fast_open_args( info ) if fast_open else {}
 
-        process = (
-            stream.run_async( pipe_stdout      = not sink,#False,#True,
-                              pipe_stdin       = not sink,#False,#True,
-                              quiet            = True,
-                              overwrite_output = True,
+            # Loop inside ffmpeg, the device is never closed between passes
+            if loop:
+                input_args[ 'stream_loop' ] = -1
+
+            # Create ffmpeg interface process
+            stream = ffmpeg.input(
+                fname,
+                re=None,
+                hide_banner=None,
+                loglevel='error',
+                **input_args
+            )[ 'v:0' ]
+            stream = self.plan.apply( stream ).output(
+                output.target,
+                f=output.fmt,
+                **self.plan.output_args
             )
+            if verbose: print( stream.compile() )
+
+
+            self.launch( stream,
+                         pipe_stdout      = not sink,
+                         pipe_stdin       = not sink,
+                         quiet            = True,
+                         overwrite_output = True )
+            if not sink:
+                print( 'threading io')
+                self.thread_io()
+            else:
+                print( 'sink' )
+                self.process_sink()
+        except BaseException as e:
+            # The sink (an emulator's reader, a FIFO) would outlive us
+            self.close_outputs()
+            raise
+
+
+    def open_output( self, device, width, height, pix_fmt, fmt = 'v4l2' ):
+        '''
+        <device> as a Sink (see sink.as_sink), opened for the frames
+        ffmpeg will write, and kept as self.output to close on stop()
+        '''
+        self.output = as_sink( device, fmt )
+        self.output.open( width, height, pix_fmt )
+        return self.output
+
+    def launch( self, stream, pipe_stdout = False, pipe_stdin = False, quiet = False, overwrite_output = False ):
+        '''
+        Same as stream.run_async(), plus ffmpeg's -progress written to a
+        dedicated pipe and parsed into self.metrics (see StreamMetrics),
+        and self.limits applied
+        '''
+        self.metrics = StreamMetrics()
+        progress_r, progress_w = os.pipe()
+        args = (
+            stream
+            .global_args( '-progress', 'pipe:{}'.format( progress_w ), '-nostats' )
+            .compile( overwrite_output = overwrite_output )
         )
-        self._proc = process
-        if not sink:
-            print( 'threading io')
-            self.thread_io()
-        else:
-            print( 'sink' )
-            self.process_sink()
+        limits = self.limits
+        if limits is not None:
+            args = limits.args( args )
+        try:
+            self._proc = subprocess.Popen( args,
+                                           stdin      = subprocess.PIPE if pipe_stdin else None,
+                                           stdout     = subprocess.PIPE if pipe_stdout or quiet else None,
+                                           stderr     = subprocess.PIPE if quiet else None,
+                                           pass_fds   = ( progress_w, ),
+                                           preexec_fn = limits.preexec if limits is not None else None )
+        except OSError as e:
+            os.close( progress_r )
+            self.close_outputs()
+            raise
+        finally:
+            os.close( progress_w )
+        _spawned( args )
 
+        self._progress = os.fdopen( progress_r, 'rb', buffering = 0 )
+        self._progress_channel = reactor().register( self._progress,
+                                                     self.metrics.feed,
+                                                     lines    = True,
+                                                     on_close = self.metrics.finish )
+        return self._proc
 
     def process_sink( self ):
-        self._stdout_t = Thread( target=process_communicate, args = (self._proc, None))
-        self._stdout_t.deamon = True
-        self._stdout_t.start()
-        self._stderr_t = None
+        '''
+        Output is not wanted, only drain the pipes so ffmpeg never blocks
+        '''
+        self.watch_io( None, None )
 
     def thread_io( self ):
-        self._stdout_t = Thread( target=queue_stdout, args=( self._proc, self._stdout_q ) )
-
-        self._stderr_t = Thread( target=queue_stderr, args=( self._proc, self._stderr_q ) )
-        # Threads must die with the program
-        self._stdout_t.deamon = True
-        self._stderr_t.deamon = True
-
-        # Start the threads
-        self._stdout_t.start()
-        self._stderr_t.start()
+        '''
+        Queue stdout chunks and stderr lines (see readline)
+        '''
+        self.watch_io( self._stdout_q.put, self._stderr_q.put )
 
+    def watch_io( self, on_stdout, on_stderr ):
+        '''
+        Hand stdout/stderr to the shared reactor, no threads per process
+        '''
+        io = reactor()
+        self._channels = []
+        if self._proc.stdout is not None:
+            self._channels.append( io.register( self._proc.stdout, on_stdout, lines = False ) )
+        if self._proc.stderr is not None:
+            self._channels.append( io.register( self._proc.stderr, on_stderr, lines = True ) )
 
     @property
     def readline( self ):
@@ -116,52 +199,185 @@ class StreamProcess( object ):
             return None
         return line
 
+    def lines( self ):
+        '''
+        stderr lines queued so far, without waiting
+        '''
+        lines = []
+        while True:
+            try:
+                lines.append( self._stderr_q.get_nowait() )
+            except Empty:
+                return lines
+
+    def wait( self, timeout = None ):
+        '''
+        Block until ffmpeg exits, returns its exit code
+        '''
+        return self._proc.wait( timeout )
+
     @property
     def alive( self ):
         alive = self._proc.poll() == None
         return alive
 
+    @property
+    def pid( self ):
+        return self._proc.pid
+
     def stop( self ):
         self._proc.kill()
-        self._stdout_t.join()
-        if self._stderr_t is not None:
-            self._stderr_t.join()
-            self._proc.stderr.close()
-        self._proc.stdout.close()
-        
-        
+        self._proc.wait()
+        io = reactor()
+        for channel in self._channels + [ self._progress_channel ]:
+            io.unregister( channel )
+        self._channels = []
+        self._progress.close()
+        for pipe in ( self._proc.stdin, self._proc.stdout, self._proc.stderr ):
+            if pipe is None:
+                continue
+            try:
+                pipe.close()
+            except ( BrokenPipeError, ValueError ) as e:
+                pass
+        self.close_outputs()
+
+    @property
+    def outputs( self ):
+        '''
+        Every Sink the stream writes to
+        '''
+        return [ self.output ] if self.output is not None else []
+
+    def close_outputs( self ):
+        for output in self.outputs:
+            output.close()
+
+
+# One output of a fan-out: None keeps the source's width/height (one
+# of them None follows the aspect ratio)
+Target = namedtuple( 'Target', 'device width height pix_fmt' )
+Target.__new__.__defaults__ = ( None, None, 'yuv420p' )
+
+def fanout_graph( stream, outputs ):
+    '''
+    ffmpeg-python graph writing the decoded <stream> to every
+    ( sink, plan ) of <outputs>.  Outputs with the same plan share its
+    filters, the decoded frames are split once per distinct plan
+    '''
+    groups = OrderedDict()
+    for output, p in outputs:
+        groups.setdefault( ( str( p ), p.width, p.height, p.pix_fmt ), [] ).append( ( output, p ) )
+
+    branches = stream.split() if len( groups ) > 1 else None
+    outs     = []
+    for i, members in enumerate( groups.values() ):
+        planned = members[ 0 ][ 1 ].apply( branches[ i ] if branches is not None else stream )
+        copies  = planned.split() if len( members ) > 1 else None
+        for j, ( output, p ) in enumerate( members ):
+            outs.append( ( copies[ j ] if copies is not None else planned ).output(
+                output.target, f=output.fmt, **p.output_args ) )
+    return ffmpeg.merge_outputs( *outs ) if len( outs ) > 1 else outs[ 0 ]
+
+
+class FanoutStreamProcess( StreamProcess ):
+    '''
+    FanoutStreamProcess
+
+    One ffmpeg decoding <fname> once for several devices: <targets> are
+    devices/Sinks or Targets, each with its own size and pixel format
+    (planned per output, see planner.plan).  The decoded frames are
+    split in the filtergraph, every device gets its own v4l2 output.
+    self.output is the first sink, self.outputs all of them.
+    '''
+    def __init__( self, fname, targets, sink = False, verbose = True, fast_open = True, loop = False, fmt = 'v4l2', limits = None ):
+        self._stdout_q = Queue()
+        self._stderr_q = Queue()
+        self._verbose  = verbose
+        self.limits    = limits
+        self._outputs  = []
+        info = probe_info( fname )
+        if verbose: print( 'Fanning out {} ({}x{}) to {} outputs'.format( fname, info[ 'width' ], info[ 'height' ], len( targets ) ) )
+
+        self.plans = []
+        outputs    = []
+        try:
+            # Opened one by one: a later failure closes the earlier ones
+            for target in targets:
+                if not isinstance( target, Target ):
+                    target = Target( target )
+                p      = plan( info, target.width, target.height, target.pix_fmt )
+                output = as_sink( target.device, fmt )
+                output.open( p.width, p.height, p.pix_fmt )
+                if verbose: print( '{}: {}x{} {} [{}]'.format( output, p.width, p.height, p.pix_fmt, p ) )
+                self._outputs.append( output )
+                self.plans.append( p )
+                outputs.append( ( output, p ) )
+            self.output = self._outputs[ 0 ] if self._outputs else None
+            self.plan   = self.plans[ 0 ] if self.plans else None
+
+            input_args = fast_open_args( info ) if fast_open else {}
+            if loop:
+                input_args[ 'stream_loop' ] = -1
+            decoded = ffmpeg.input( fname, re=None, hide_banner=None, loglevel='error', **input_args )[ 'v:0' ]
+            stream  = fanout_graph( decoded, outputs )
+            if verbose: print( stream.compile() )
+
+            self.launch( stream,
+                         pipe_stdout      = not sink,
+                         pipe_stdin       = not sink,
+                         quiet            = True,
+                         overwrite_output = True )
+            if not sink:
+                self.thread_io()
+            else:
+                self.process_sink()
+        except BaseException as e:
+            self.close_outputs()
+            raise
+
+    @property
+    def outputs( self ):
+        return list( self._outputs )
 
 
 class OverlayStreamProcess( StreamProcess ):
-    def __init__( self, fname, overlay, device = '/dev/video20', sink = False,  verbose = True ):
+    def __init__( self, fname, overlay, device = '/dev/video20', sink = False,  verbose = True, fmt = 'v4l2', limits = None ):
         self._stdout_q = Queue()
         self._stderr_q = Queue()
         self._verbose = verbose
+        self.limits   = limits
 
-        # Create ffmpeg interface process
-        print( 'Building up sources' )
-        base = ffmpeg.input( fname, re=None )
-        logo = ffmpeg.input( overlay )
-        print( 'Combining inputs' )
-        stream  = (
-            ffmpeg
-            .filter( [base, logo], 'overlay', 10, 10 )
-            .output( device, f='v4l2' )
-            )
-        if verbose: print( stream.compile() )
+        # The overlay keeps the base's size and outputs yuv420p
+        info      = dict( probe_info( fname ), pix_fmt = 'yuv420p' )
+        self.plan = plan( info, pix_fmt = 'yuv420p' )
+        if verbose: print( self.plan.explain() )
+        output = self.open_output( device, self.plan.width, self.plan.height, self.plan.pix_fmt, fmt )
 
-        process = (
-            stream.run_async( pipe_stdout      = not sink,
-                              pipe_stdin       = not sink,
-                              quiet            = False,
-                              overwrite_output = True,
-            )
-        )
-        self._proc = process
-        if not sink:
-            self.thread_io()
-        else:
-            self.process_sink()
+        try:
+            # Create ffmpeg interface process
+            print( 'Building up sources' )
+            base = ffmpeg.input( fname, re=None )[ 'v:0' ]
+            logo = ffmpeg.input( overlay )[ 'v:0' ]
+            print( 'Combining inputs' )
+            stream  = (
+                self.plan.apply( ffmpeg.filter( [base, logo], 'overlay', 10, 10 ) )
+                .output( output.target, f=output.fmt, **self.plan.output_args )
+                )
+            if verbose: print( stream.compile() )
+
+            self.launch( stream,
+                         pipe_stdout      = not sink,
+                         pipe_stdin       = not sink,
+                         quiet            = False,
+                         overwrite_output = True )
+            if not sink:
+                self.thread_io()
+            else:
+                self.process_sink()
+        except BaseException as e:
+            self.close_outputs()
+            raise
 
 
 class DesktopStreamProcess( StreamProcess ):
@@ -172,7 +388,9 @@ class DesktopStreamProcess( StreamProcess ):
                   h       = 480,
                   display = ':0',
                   device  = '/dev/video20',
-                  verbose = True ):
+                  verbose = True,
+                  fmt     = 'v4l2',
+                  limits  = None ):
         '''
         Resolutions tested:
         640x480
@@ -186,33 +404,36 @@ class DesktopStreamProcess( StreamProcess ):
         self._stdout_q = Queue()
         self._stderr_q = Queue()
         self._verbose = verbose
+        self.limits   = limits
+        output = self.open_output( device, int( w ), int( h ), 'yuyv422', fmt )
 
-        # Create ffmpeg interface process
-        stream = (
-        ffmpeg
-        .input( '{0}.0+{1},{2}'.format( display, x, y ),
-                s='{0}x{1}'.format( w, h ),
-                #f='x11grab' ).hflip()
-                f='x11grab',
-                hide_banner=None,
-                loglevel='error' )
-        .output( device,
-                 #vf = 'format=pix_fmts=yuv420p',
-                 #pix_fmt='yuv420p',
-                 pix_fmt='yuyv422',
-                 f='v4l2'  )
-        )
-        if verbose: print( stream.compile() )
-
-        process = (
-            stream.run_async( pipe_stdout      = False,
-                              pipe_stdin       = False,
-                              quiet            = True,
-                              overwrite_output = True,
+        try:
+            # Create ffmpeg interface process
+            stream = (
+            ffmpeg
+            .input( '{0}.0+{1},{2}'.format( display, x, y ),
+                    s='{0}x{1}'.format( w, h ),
+                    #f='x11grab' ).hflip()
+                    f='x11grab',
+                    hide_banner=None,
+                    loglevel='error' )
+            .output( output.target,
+                     #vf = 'format=pix_fmts=yuv420p',
+                     #pix_fmt='yuv420p',
+                     pix_fmt='yuyv422',
+                     f=output.fmt  )
             )
-        )
-        self._proc = process
-        self.process_sink()
+            if verbose: print( stream.compile() )
+
+            self.launch( stream,
+                         pipe_stdout      = False,
+                         pipe_stdin       = False,
+                         quiet            = True,
+                         overwrite_output = True )
+            self.process_sink()
+        except BaseException as e:
+            self.close_outputs()
+            raise
 
 class DesktopScopeProcess( StreamProcess ):
     def __init__( self,
@@ -236,32 +457,525 @@ class DesktopScopeProcess( StreamProcess ):
         self._stdout_q = Queue()
         self._stderr_q = Queue()
         self._verbose = verbose
+        output = self.open_output( device, int( w ), int( h ), 'yuyv422' )
 
-        # Create ffmpeg interface process
+        try:
+            # Create ffmpeg interface process
+            stream = (
+            ffmpeg
+            .input( '{0}.0+{1},{2}'.format( display, x, y ),
+                    s='{0}x{1}'.format( w, h ),
+                    f='x11grab',
+                    hide_banner=None,
+                    loglevel='error').hflip()
+            .output( output.target,
+                     pix_fmt='yuyv422',
+                     f=output.fmt  )
+            )
+            if verbose: print( stream.compile() )
+
+            self.launch( stream,
+                         pipe_stdout      = True,
+                         pipe_stdin       = True,
+                         quiet            = False,
+                         overwrite_output = False )
+            self.process_sink()
+        except BaseException as e:
+            self.close_outputs()
+            raise
+
+        
+def _readinto_full( f, view ):
+    '''
+    Fill <view> from <f>, returns the number of bytes read (short on EOF)
+    '''
+    total = 0
+    size  = len( view )
+    while total < size:
+        n = f.readinto( view[ total: ] )
+        if not n:
+            break
+        total += n
+    return total
+
+
+class DecodeProcess( object ):
+    '''
+    DecodeProcess
+
+    Decode <fname> to rawvideo on stdout, normalised to a fixed
+    width x height, pix_fmt and frame rate (letterboxed to keep the
+    aspect ratio), video only.
+
+    ffmpeg -i in -an -sn -dn -vf scale=w:h:force_original_aspect_ratio=decrease,
+      pad=w:h:(ow-iw)/2:(oh-ih)/2,setsar=1,fps=fps -pix_fmt fmt -f rawvideo pipe:
+
+    Filters the source does not need (same size, same rate) are left
+    out, see planner.plan.  Frames are the planned size: width x height
+    rounded down to the pix_fmt's subsampling.
+    '''
+    def __init__( self, fname, width, height, pix_fmt = 'yuv420p', fps = 30, loop = False ):
+        super( DecodeProcess, self ).__init__()
+        self.fname = fname
+        try:
+            info = probe_info( fname )
+        except Exception as e:
+            info = None # ffmpeg reports it
+        self.plan       = plan( info, width, height, pix_fmt, fps, letterbox = True )
+        self.frame_size = frame_size( self.plan.width, self.plan.height, pix_fmt )
+        input_args = { 'stream_loop' : -1 } if loop else {}
         stream = (
+            self.plan.apply( ffmpeg.input( fname, hide_banner=None, loglevel='error', **input_args )[ 'v:0' ] )
+            .output( 'pipe:', format='rawvideo', **self.plan.output_args )
+        )
+        self._proc = stream.run_async( pipe_stdout = True )
+        _spawned( stream.compile() )
+
+    def readinto( self, view ):
+        '''
+        Read one frame into <view>, False once the source is exhausted
+        '''
+        return _readinto_full( self._proc.stdout, view ) == self.frame_size
+
+    def stop( self ):
+        if self._proc.poll() is None:
+            self._proc.kill()
+        self._proc.stdout.close()
+        self._proc.wait()
+
+
+def _rawvideo_writer( device, width, height, pix_fmt, fps, fmt = 'v4l2' ):
+    '''
+    ffmpeg -f rawvideo -pix_fmt fmt -s wxh -framerate fps -re -i pipe: -f v4l2 device
+    '''
+    return (
         ffmpeg
-        .input( '{0}.0+{1},{2}'.format( display, x, y ),
-                s='{0}x{1}'.format( w, h ),
-                f='x11grab',
+        .input( 'pipe:',
+                format='rawvideo',
+                pix_fmt=pix_fmt,
+                s='{}x{}'.format( width, height ),
+                framerate=fps,
+                re=None,
                 hide_banner=None,
-                loglevel='error').hflip()
-        .output( device,
-                 pix_fmt='yuyv422',
-                 f='v4l2'  )
-        )
+                loglevel='error' )
+        .output( device, pix_fmt=pix_fmt, f=fmt )
+    )
+
+
+class PlayoutProcess( StreamProcess ):
+    '''
+    PlayoutProcess
+
+    Gapless playout of a list of sources: a single long lived ffmpeg
+    writer holds the device open, and each source is decoded by its
+    own DecodeProcess, normalised to the writer's format, and fed to
+    the writer's stdin.  The next source's decoder is started as soon
+    as the current one starts, so item changes do not respawn the
+    writer and the device never sees a close/reopen.
+
+    ffmpeg -f rawvideo -pix_fmt fmt -s wxh -framerate fps -re -i pipe: -f v4l2 /dev/video20
+
+    A single source with <loop> is looped with -stream_loop by its
+    decoder.  Per item transition latency (last frame of the previous
+    item to first frame of the next) is kept in <transitions>.
+    '''
+    def __init__( self,
+                  sources,
+                  device  = '/dev/video20',
+                  width   = None,
+                  height  = None,
+                  pix_fmt = 'yuv420p',
+                  fps     = None,
+                  loop    = False,
+                  verbose = True,
+                  fmt     = 'v4l2' ):
+        self._stdout_q   = Queue()
+        self._stderr_q   = Queue()
+        self._verbose    = verbose
+        self._sources    = list( sources )
+        self._loop       = loop
+        self._running    = True
+        self._decoder    = None
+        self._next       = None
+        self.transitions = []
+
+        # Normalise everything to the first source's format unless told otherwise
+        if width is None or height is None or fps is None:
+            info   = probe_info( self._sources[0] )
+            width  = width  or info[ 'width' ]
+            height = height or info[ 'height' ]
+            fps    = fps    or info[ 'frame_rate' ] or 30
+        # What the decoders will produce (see DecodeProcess)
+        width, height = _aligned( width, height, pix_fmt )
+        self.width   = width
+        self.height  = height
+        self.pix_fmt = pix_fmt
+        self.fps     = fps
+        if verbose: print( 'Playout: {}x{} {} @ {} fps to {}'.format( width, height, pix_fmt, fps, device ) )
+
+        # Create ffmpeg interface process
+        output = self.open_output( device, width, height, pix_fmt, fmt )
+        stream = _rawvideo_writer( output.target, width, height, pix_fmt, fps, output.fmt )
         if verbose: print( stream.compile() )
 
-        process = (
-            stream.run_async( pipe_stdout      = True,
-                              pipe_stdin       = True,
-                              quiet            = False,
-                              overwrite_output = False,
-            )
-        )
-        self._proc = process
-        self.process_sink()
+        self.launch( stream,
+                     pipe_stdin       = True,
+                     quiet            = True,
+                     overwrite_output = True )
+        self.thread_io()
+
+        self._feed_t = Thread( target = self.feed )
+        self._feed_t.daemon = True
+        self._feed_t.start()
+
+    def decoder( self, fname ):
+        return DecodeProcess( fname,
+                              self.width,
+                              self.height,
+                              self.pix_fmt,
+                              self.fps,
+                              loop = self._loop and len( self._sources ) == 1 )
+
+    def playlist( self ):
+        '''
+        Sources in play order, endless when looping a list
+        '''
+        while True:
+            for fname in self._sources:
+                yield fname
+            if not self._loop or len( self._sources ) == 1:
+                break
+
+    def feed( self ):
+        frame = bytearray( frame_size( self.width, self.height, self.pix_fmt ) )
+        view  = memoryview( frame )
+        items = self.playlist()
+        fname = next( items, None )
+        self._next = self.decoder( fname ) if fname is not None else None
+        last  = None
+        try:
+            while self._running and self._next is not None:
+                self._decoder = self._next
+                fname = next( items, None )
+                self._next = self.decoder( fname ) if fname is not None else None
+                if self._verbose: print( 'Playing: {}'.format( self._decoder.fname ) )
+
+                first = True
+                while self._running and self._decoder.readinto( view ):
+                    if first:
+                        first = False
+                        if last is not None:
+                            latency = time.time() - last
+                            self.transitions.append( ( self._decoder.fname, latency ) )
+                            if self._verbose: print( 'Transition to {}: {:.3f}s'.format( self._decoder.fname, latency ) )
+                    self._proc.stdin.write( view )
+                    last = time.time()
+                self._decoder.stop()
+        except ( BrokenPipeError, ValueError ) as e:
+            # Writer went away (stop() or ffmpeg exited)
+            pass
+        finally:
+            for dec in ( self._decoder, self._next ):
+                if dec is not None:
+                    dec.stop()
+            try:
+                self._proc.stdin.close()
+            except ( BrokenPipeError, ValueError ) as e:
+                pass
+
+    @property
+    def alive( self ):
+        return self._feed_t.is_alive() or self._proc.poll() is None
+
+    def stop( self ):
+        self._running = False
+        self._proc.kill()
+        self._feed_t.join()
+        super( PlayoutProcess, self ).stop()
+
+
+class WarmPool( object ):
+    '''
+    WarmPool
+
+    Decoders started ahead of time for media likely to be played next.
+    A DecodeProcess opens its input, initialises the codec and decodes
+    until its stdout pipe is full, then waits: its first frame is ready
+    the moment it is taken.  At most <size> are kept, the least recently
+    prepared is stopped first.  Once close()d, prepare() starts nothing.
+    '''
+    def __init__( self, factory, size = 2 ):
+        super( WarmPool, self ).__init__()
+        self._factory = factory # fname -> DecodeProcess
+        self._lock    = Lock()
+        self._warm    = OrderedDict()
+        self.closed   = False
+        self.size     = size
+        self.hits     = 0
+        self.misses   = 0
+
+    def prepare( self, fnames ):
+        '''
+        Warm up decoders for <fnames> (most wanted first)
+        '''
+        for fname in list( fnames )[ :self.size ]:
+            with self._lock:
+                if self.closed:
+                    return
+                if fname in self._warm:
+                    self._warm.move_to_end( fname )
+                    continue
+            decoder = self._factory( fname )
+            with self._lock:
+                if self.closed:
+                    # Closed while it started
+                    doomed = [ decoder ]
+                else:
+                    self._warm[ fname ] = decoder
+                    doomed = []
+                while len( self._warm ) > self.size:
+                    doomed.append( self._warm.popitem( last = False )[1] )
+            for dec in doomed:
+                dec.stop()
+
+    def take( self, fname ):
+        '''
+        Decoder for <fname>, warm if prepared, returns ( decoder, warm )
+        '''
+        with self._lock:
+            decoder = self._warm.pop( fname, None )
+        if decoder is not None:
+            self.hits += 1
+            return decoder, True
+        self.misses += 1
+        return self._factory( fname ), False
+
+    def __contains__( self, fname ):
+        with self._lock:
+            return fname in self._warm
+
+    def clear( self ):
+        with self._lock:
+            doomed = list( self._warm.values() )
+            self._warm.clear()
+        for dec in doomed:
+            dec.stop()
+
+    def close( self ):
+        '''
+        clear() for good, e.g. when the stream using the pool stops
+        '''
+        with self._lock:
+            self.closed = True
+        self.clear()
+
+
+class SwitchProcess( StreamProcess ):
+    '''
+    SwitchProcess
+
+    Operator driven switching: one long lived ffmpeg writer holds the
+    device open (as PlayoutProcess does) and switch( fname ) hands it a
+    new source between two frames.  Sources come from a WarmPool of
+    <pool_size> pre-started decoders, prepare() what is queued so a
+    switch does not pay process start up, probing and codec set up.
+
+    Switch latency (switch() called to first frame of the new source
+    written) is kept in <switches> as ( fname, latency, warm ).  A
+    source that ends leaves the device on its last frame until the next
+    switch.
+    '''
+    def __init__( self,
+                  device    = '/dev/video20',
+                  width     = 1280,
+                  height    = 720,
+                  pix_fmt   = 'yuv420p',
+                  fps       = 30,
+                  pool_size = 2,
+                  verbose   = True ):
+        self._stdout_q = Queue()
+        self._stderr_q = Queue()
+        self._verbose  = verbose
+        self._cond     = Condition()
+        self._pending  = None # ( decoder, warm, time requested )
+        self._running  = True
+        # What the decoders will produce (see DecodeProcess)
+        width, height  = _aligned( width, height, pix_fmt )
+        self.width     = width
+        self.height    = height
+        self.pix_fmt   = pix_fmt
+        self.fps       = fps
+        self.switches  = []
+        self.pool      = WarmPool( self.decoder, pool_size )
+
+        output = self.open_output( device, width, height, pix_fmt )
+        stream = _rawvideo_writer( output.target, width, height, pix_fmt, fps, output.fmt )
+        if verbose: print( stream.compile() )
+        self.launch( stream,
+                     pipe_stdin       = True,
+                     quiet            = True,
+                     overwrite_output = True )
+        self.thread_io()
+
+        self._feed_t = Thread( target = self.feed )
+        self._feed_t.daemon = True
+        self._feed_t.start()
+
+    def decoder( self, fname ):
+        return DecodeProcess( fname, self.width, self.height, self.pix_fmt, self.fps )
+
+    def prepare( self, fnames ):
+        self.pool.prepare( fnames )
+
+    def switch( self, fname ):
+        t0 = time.time()
+        decoder, warm = self.pool.take( fname )
+        with self._cond:
+            old, self._pending = self._pending, ( decoder, warm, t0 )
+            self._cond.notify_all()
+        if old is not None:
+            old[0].stop() # Superseded before it played
+
+    def feed( self ):
+        frame   = bytearray( frame_size( self.width, self.height, self.pix_fmt ) )
+        view    = memoryview( frame )
+        current = None
+        try:
+            while self._running:
+                with self._cond:
+                    if current is None:
+                        # Nothing to play, sleep until there is
+                        self._cond.wait_for( lambda : self._pending is not None or not self._running )
+                    pending, self._pending = self._pending, None
+                if not self._running:
+                    break
+                if pending is not None:
+                    if current is not None:
+                        current.stop()
+                    current, warm, t0 = pending
+                    if self._verbose: print( 'Switching to {} ({})'.format( current.fname, 'warm' if warm else 'cold' ) )
+                    if not current.readinto( view ):
+                        current.stop()
+                        current = None
+                        continue
+                    self._proc.stdin.write( view )
+                    latency = time.time() - t0
+                    self.switches.append( ( current.fname, latency, warm ) )
+                    if self._verbose: print( 'Switch latency {:.3f}s'.format( latency ) )
+                    continue
+                if not current.readinto( view ):
+                    current.stop()
+                    current = None
+                    continue
+                self._proc.stdin.write( view )
+        except ( BrokenPipeError, ValueError ) as e:
+            # Writer went away (stop() or ffmpeg exited)
+            pass
+        finally:
+            if current is not None:
+                current.stop()
+            try:
+                self._proc.stdin.close()
+            except ( BrokenPipeError, ValueError ) as e:
+                pass
+
+    @property
+    def alive( self ):
+        return self._proc.poll() is None
+
+    def stop( self ):
+        self._running = False
+        with self._cond:
+            pending, self._pending = self._pending, None
+            self._cond.notify_all()
+        if pending is not None:
+            pending[0].stop()
+        self._proc.kill()
+        self._feed_t.join()
+        self.pool.close()
+        super( SwitchProcess, self ).stop()
+
+
+class FrameTap( StreamProcess ):
+    '''
+    FrameTap
+
+    Decoded frames straight into NumPy:
+
+    ffmpeg -i in [-vf scale=w:h] -an -sn -dn -f rawvideo -pix_fmt fmt pipe:
+
+    stdout is read with readinto() into a ring of <ring> preallocated
+    arrays, iterating yields those arrays (shape from pixfmt.shape), so
+    there is no allocation per frame.  A yielded frame is overwritten
+    <ring> frames later, copy it to keep it longer.
+
+    <input_args> are passed to the input, e.g. { 'f' : 'lavfi' } to tap
+    a generated source; width/height are then required.
+    '''
+    def __init__( self,
+                  fname,
+                  width      = None,
+                  height     = None,
+                  pix_fmt    = 'rgb24',
+                  ring       = 4,
+                  input_args = None,
+                  realtime   = False,
+                  verbose    = False ):
+        if np is None:
+            raise ImportError( 'FrameTap requires numpy' )
+        self._stdout_q = Queue()
+        self._stderr_q = Queue()
+        self._verbose  = verbose
+        self._channels = []
+
+        input_args = dict( input_args or {} )
+        if width is None or height is None:
+            info   = probe_info( fname )
+            width  = width  or info[ 'width' ]
+            height = height or info[ 'height' ]
+            scale  = ( width, height ) != ( info[ 'width' ], info[ 'height' ] )
+        else:
+            scale  = input_args.get( 'f' ) not in ( 'lavfi', 'x11grab' )
+        if realtime:
+            input_args[ 're' ] = None
+
+        self.width      = width
+        self.height     = height
+        self.pix_fmt    = pix_fmt
+        self.frame_size = frame_size( width, height, pix_fmt )
+        self.frames     = 0
+
+        # Create ffmpeg interface process
+        stream = ffmpeg.input( fname, hide_banner=None, loglevel='error', **input_args ).video
+        if scale:
+            stream = stream.filter( 'scale', width, height )
+        stream = stream.output( 'pipe:', format='rawvideo', pix_fmt=pix_fmt, an=None, sn=None, dn=None )
+        if verbose: print( stream.compile() )
+
+        self.launch( stream, pipe_stdout = True )
+
+        # Ring of frame buffers and their flat writable views
+        self._ring  = [ np.empty( shape( width, height, pix_fmt ), dtype = np.uint8 ) for i in range( ring ) ]
+        self._views = [ memoryview( frame ).cast( 'B' ) for frame in self._ring ]
+
+    def read( self ):
+        '''
+        Next frame (an array from the ring), None at the end of the input
+        '''
+        index = self.frames % len( self._ring )
+        if _readinto_full( self._proc.stdout, self._views[ index ] ) != self.frame_size:
+            return None
+        self.frames += 1
+        return self._ring[ index ]
+
+    def __iter__( self ):
+        while True:
+            frame = self.read()
+            if frame is None:
+                break
+            yield frame
+
 
-        
 def jpgs2gif( pattern, out='out.gif', framerate = 2 ): #scale='360x240', ):
     '''
     ffmpeg -f image2 -framerate 10 -i thumb/%001d.jpg -vf scale=480x240  out.gif
@@ -285,19 +999,241 @@ def generate_thumbnail(in_filename, out_filename, time=0.1, width=360, stdout =
     Directly from ffmpeg-python examples
     https://github.com/kkroening/ffmpeg-python/blob/master/examples/get_video_thumbnail.py
     '''
+    stream = (
+        ffmpeg
+        .input(in_filename, ss=time, hide_banner=None, loglevel='error')
+        .filter('scale', width, -1)
+        .output(out_filename, vframes=1)
+        .overwrite_output()
+    )
+    _spawned( stream.compile() )
     try:
-        (
-            ffmpeg
-            .input(in_filename, ss=time, hide_banner=None, loglevel='error')
-            .filter('scale', width, -1)
-            .output(out_filename, vframes=1)
-            .overwrite_output()
-            .run(capture_stdout=stdout, capture_stderr=stderr)
-        )
+        stream.run(capture_stdout=stdout, capture_stderr=stderr)
     except ffmpeg.Error as e:
         print( 'borked' )
         return (str( e ) )#e.stderr.decode(), file=sys.stderr)
 
+def _thumbnail_batch( jobs, width ):
+    '''
+    One ffmpeg run, one input and one mapped output per job:
+
+    ffmpeg -ss t0 -i in0 -ss t1 -i in1 ...
+      -filter_complex "[0:v]scale=360:-1[s0];[1:v]scale=360:-1[s1];..."
+      -map [s0] -vframes 1 out0.jpg -map [s1] -vframes 1 out1.jpg ...
+    '''
+    outputs = [
+        ffmpeg
+        .input( in_filename, ss=ts )
+        .video
+        .filter( 'scale', width, -1 )
+        .output( out_filename, vframes=1 )
+        for in_filename, out_filename, ts in jobs
+    ]
+    stream = (
+        ffmpeg
+        .merge_outputs( *outputs )
+        .global_args( '-hide_banner', '-loglevel', 'error' )
+        .overwrite_output()
+    )
+    _spawned( stream.compile() )
+    stream.run( capture_stdout = True, capture_stderr = True )
+
+def generate_thumbnails( jobs, width = 360, batch = None, callback = None ):
+    '''
+    Thumbnail many files with as few ffmpeg runs as possible.
+
+    <jobs> is an iterable of (in_filename, out_filename, time).  Up to K
+    jobs share one ffmpeg process; K starts at <batch>, where the
+    previous call left it when None (so callers feeding chunks still
+    let it grow), and doubles while runs stay under
+    thumbnail_batch_time, it halves when a run is slow or fails.  A
+    failed run is bisected so that one bad file does not cost the rest
+    of the batch.  Outputs are removed first: a file left by an earlier
+    run is not taken for this one's.
+
+    <callback>( in_filename, out_filename, error ) is called for every
+    job as it completes, error is None on success.
+
+    Returns { out_filename : error } for the jobs that failed.
+    '''
+    global _thumbnail_k
+    pending  = list( jobs )
+    failures = {}
+    size     = batch if batch is not None else _thumbnail_k
+
+    def done( job, error ):
+        if error is not None:
+            failures[ job[1] ] = error
+        if callback is not None:
+            callback( job[0], job[1], error )
+
+    def run( chunk ):
+        '''
+        Returns True if the whole chunk succeeded in a single run
+        '''
+        for job in chunk:
+            try:
+                os.remove( job[1] )
+            except OSError as e:
+                pass
+        try:
+            _thumbnail_batch( chunk, width )
+            ok = True
+        except ffmpeg.Error as e:
+            ok    = False
+            error = e.stderr.decode( errors='replace' ).strip() if e.stderr else str( e )
+
+        if not ok and len( chunk ) > 1:
+            # Bisect to find the culprit(s)
+            half = len( chunk ) // 2
+            run( chunk[ :half ] )
+            run( chunk[ half: ] )
+            return False
+
+        for job in chunk:
+            if not ok:
+                done( job, error )
+            elif not os.path.exists( job[1] ):
+                # e.g. seeking past the end yields no frame and no file
+                done( job, 'no frame at {}'.format( job[2] ) )
+            else:
+                done( job, None )
+        return ok
+
+    while pending:
+        chunk   = pending[ :size ]
+        pending = pending[ size: ]
+        t0 = time.time()
+        ok = run( chunk )
+        elapsed = time.time() - t0
+
+        if not ok or elapsed > thumbnail_batch_time:
+            size = max( 1, size // 2 )
+        elif len( chunk ) == size:
+            size = min( thumbnail_batch_max, size * 2 )
+        _thumbnail_k = size
+
+    return failures
+
+def preview_times( duration, increments = 4 ):
+    '''
+    Timestamps (ascending) of the <increments> preview frames of a clip
+    '''
+    timestamp = lambda duration, step: ( ( duration/step ) - ( 0.5 * ( duration * 1.0/increments ) ) )
+    return [ timestamp( duration, step ) for step in range( increments, 0, -1 ) ]
+
+def _jpeg_end( data, pos ):
+    '''
+    Offset just past the EOI of the JPEG whose SOI ends at <pos>, -1 if
+    it is cut short.  Header segments are skipped by their length (their
+    values, e.g. quantization tables, may hold FF D9), entropy coded
+    data up to the next marker that is not stuffing (FF 00) or a restart
+    (FF D0-D7).
+    '''
+    size = len( data )
+    while pos + 1 < size:
+        if data[ pos ] != 0xff:
+            # Not a marker where one should be: fall back to the first EOI
+            end = data.find( b'\xff\xd9', pos )
+            return end + 2 if end >= 0 else -1
+        marker = data[ pos + 1 ]
+        if marker == 0xff:
+            pos += 1 # Fill byte
+            continue
+        if marker == 0xd9:
+            return pos + 2
+        if marker == 0x01 or 0xd0 <= marker <= 0xd7:
+            pos += 2 # No length
+            continue
+        if pos + 3 >= size:
+            return -1
+        pos += 2 + ( ( data[ pos + 2 ] << 8 ) | data[ pos + 3 ] )
+        if marker == 0xda:
+            # Scan data, up to the next real marker
+            while True:
+                pos = data.find( b'\xff', pos )
+                if pos < 0 or pos + 1 >= size:
+                    return -1
+                following = data[ pos + 1 ]
+                if following == 0x00 or 0xd0 <= following <= 0xd7:
+                    pos += 2
+                    continue
+                break
+    return -1
+
+def split_jpegs( data ):
+    '''
+    Split an image2pipe/mjpeg byte stream into individual JPEG images
+    '''
+    frames = []
+    start  = data.find( b'\xff\xd8' )
+    while start >= 0:
+        end = _jpeg_end( data, start + 2 )
+        if end < 0:
+            break
+        frames.append( data[ start : end ] )
+        start = data.find( b'\xff\xd8', end )
+    return frames
+
+def generate_previews( in_filename, out_filename = 'out.gif', times = ( 0.1, ), width = 360, framerate = 2, frames = True ):
+    '''
+    Grab one frame at each of <times> and join them into an animated
+    preview in a single ffmpeg run:
+
+    ffmpeg -ss t0 -i in -ss t1 -i in ... -filter_complex
+      "[0]trim=end_frame=1,setpts=PTS-STARTPTS,scale=360:-1[p0];...
+       [p0][p1]...concat=n=N,setpts=N/(2*TB),split[gif][jpg]"
+      -map [gif] out.gif -map [jpg] -f image2pipe -c:v mjpeg pipe:
+
+    Each input is seeked on the input side and limited to one second
+    (-t 1), so only the frames around the timestamps get decoded.  With <frames> the preview frames come
+    back as a list of JPEG images (bytes), nothing intermediate touches
+    the disk.  Set <out_filename> to None to only get the frames.
+    '''
+    if out_filename is not None and not out_filename.endswith( '.gif' ):
+        out_filename += '.gif'
+
+    clips = [
+        ffmpeg
+        .input( in_filename, ss=ts, t=1 )
+        .video
+        .filter( 'trim', end_frame=1 )
+        .filter( 'setpts', 'PTS-STARTPTS' )
+        .filter( 'scale', width, -1 )
+        .filter( 'setsar', 1 )
+        for ts in times
+    ]
+    joined = (
+        ffmpeg
+        .concat( *clips, v=1, a=0 )
+        .filter( 'setpts', 'N/({}*TB)'.format( framerate ) )
+    )
+
+    outputs = []
+    if out_filename is not None and frames:
+        split   = joined.split()
+        outputs.append( split[0].output( out_filename, r=framerate ) )
+        outputs.append( split[1].output( 'pipe:', format='image2pipe', vcodec='mjpeg', r=framerate ) )
+    elif out_filename is not None:
+        outputs.append( joined.output( out_filename, r=framerate ) )
+    else:
+        outputs.append( joined.output( 'pipe:', format='image2pipe', vcodec='mjpeg', r=framerate ) )
+
+    stream = (
+        ffmpeg
+        .merge_outputs( *outputs )
+        .global_args( '-hide_banner', '-loglevel', 'error' )
+        .overwrite_output()
+    )
+    _spawned( stream.compile() )
+    try:
+        out, err = stream.run( capture_stdout = frames, capture_stderr = True )
+    except ffmpeg.Error as e:
+        print( 'borked' )
+        print( e.stderr.decode( errors='replace' ) if e.stderr else str( e ) )
+        return []
+    return split_jpegs( out ) if frames else []
+
 def generate_gif(in_filename, out_filename='out.gif', time=0.1, duration = 2.5, width=360, stdout = False, stderr = False):
     '''
     ffmpeg -ss 61.0 -t 2.5 -i input.mp4 -filter_complex "[0:v] palettegen" palette.png
@@ -332,21 +1268,80 @@ def generate_gif(in_filename, out_filename='out.gif', time=0.1, duration = 2.5,
         return (str( e ) ) #e.stderr.decode(), file=sys.stderr)
 
     
+def _frame_rate( rate ):
+    '''
+    '30000/1001' -> 29.97
+    '''
+    try:
+        num, _, den = str( rate ).partition( '/' )
+        num = float( num )
+        den = float( den ) if den else 1.0
+        return num / den if den else 0.0
+    except ValueError as e:
+        return 0.0
+
+def stream_info( probe ):
+    '''
+    Reduce ffprobe output to the first video stream's parameters
+    '''
+    video_info = next(s for s in probe['streams'] if s['codec_type'] == 'video')
+    frame_rate = _frame_rate( video_info.get( 'avg_frame_rate', '0/0' ) )
+    if frame_rate == 0.0:
+        frame_rate = _frame_rate( video_info.get( 'r_frame_rate', '0/0' ) )
+
+    duration = video_info.get( 'duration', probe.get( 'format', {} ).get( 'duration' ) )
+    duration = float( duration ) if duration is not None else 0.0
+
+    # Not every container records the frame count (mkv, webm, ...)
+    num_frames = video_info.get( 'nb_frames' )
+    if num_frames is not None:
+        num_frames = int( num_frames )
+    else:
+        num_frames = int( round( duration * frame_rate ) )
+
+    return { 'width'      : int( video_info[ 'width' ] ),
+             'height'     : int( video_info[ 'height' ] ),
+             'pix_fmt'    : video_info.get( 'pix_fmt' ),
+             'frame_rate' : frame_rate,
+             'duration'   : duration,
+             'codec'      : video_info.get( 'codec_name' ),
+             'num_frames' : num_frames,
+             'streams'    : [ s.get( 'codec_type' ) for s in probe[ 'streams' ] ] }
+
+def _spawned( args ):
+    for hook in spawn_hooks:
+        hook( args )
+
+def probe_info( fname, cache = True ):
+    '''
+    Stream information of <fname>, ffprobe only runs on a cache miss
+    '''
+    info = probe_cache.get( fname ) if cache else None
+    if info is None:
+        _spawned( [ 'ffprobe', fname ] )
+        info = stream_info( ffmpeg.probe( fname ) )
+        if cache:
+            probe_cache.put( fname, info )
+    return info
+
+def fast_open_args( info ):
+    '''
+    Input options to shorten ffmpeg's own probing when <info> is known
+    '''
+    if info is None or info.get( 'pix_fmt' ) is None:
+        return {}
+    return { 'probesize'       : fast_probesize,
+             'analyzeduration' : fast_analyzeduration }
+
 def probe_duration( fname ):
     '''
     Retrieve the media files duration
     '''
-    probe = ffmpeg.probe(fname)
-    video_info = next(s for s in probe['streams'] if s['codec_type'] == 'video')
-    return( float(video_info['duration']) )
-    
+    return probe_info( fname )[ 'duration' ]
+
 def probe( fname ):
-    probe = ffmpeg.probe(fname)
-    video_info = next(s for s in probe['streams'] if s['codec_type'] == 'video')
-    width = int(video_info['width'])
-    height = int(video_info['height'])
-    num_frames = int(video_info['nb_frames'])
-    return width, height, num_frames
+    info = probe_info( fname )
+    return info[ 'width' ], info[ 'height' ], info[ 'num_frames' ]
 
 def deep_probe( fname ):
     probe = ffmpeg.probe( fname )
@@ -387,15 +1382,18 @@ def create_sine_src(path='./sinewav.mp4', freq = 1000, duration = 5 ):
         )
     out, err = process.communicate()
 
-def create_test_src(path='./testsrc.mp4', duration = 30):
+def create_test_src(path='./testsrc.mp4', duration = 30, size = None, rate = None):
     '''
-    ffmpeg -f lavfi -i testsrc -t 30 -pix_fmt yuv420p testsrc.m4p
+    ffmpeg -f lavfi -i testsrc[=size=wxh:rate=r] -t 30 -pix_fmt yuv420p testsrc.m4p
     '''
+    options = [ '{}={}'.format( k, v ) for k, v in ( ( 'size', size ), ( 'rate', rate ) ) if v is not None ]
+    src     = 'testsrc=' + ':'.join( options ) if options else 'testsrc'
     process = (
         ffmpeg
-        .input( 'testsrc', f='lavfi', t= duration  )
+        .input( src, f='lavfi', t= duration  )
         .output( path,
                  pix_fmt='yuv420p' )
+        .overwrite_output()
         .run_async( pipe_stdout = True, pipe_stdin = False)
         )
     out, err = process.communicate()
@@ -3,6 +3,12 @@
 """
 
 import os
+import errno
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Directories listed concurrently by walk_media, stat latency dominates
+# on network and USB storage so more than the number of cores pays off
+walk_workers = 16
 
 def mkdir_p( path ):
     '''
@@ -16,13 +22,21 @@ def mkdir_p( path ):
         else:
             raise
 
+def stat_key( path ):
+    '''
+    Identity of the file at <path> as far as caches are concerned:
+    (realpath, size, mtime in ns).  Any edit changes the key.
+    '''
+    st = os.stat( path )
+    return os.path.realpath( path ), st.st_size, st.st_mtime_ns
+
 def discover( path, patterns, excludes =['.git', '.svn'] ):
      is_xcl = lambda x, xcl : any( e in x for e in xcl )
      is_ext = lambda f, ext : any( f.endswith( e ) for e in ext )
      matches = []
      for root, dirs, files in os.walk( path ):#, topdown=True ):
           files= [ f for f in files if not f.startswith( '.' ) ]
-          dirs = [ d for d in dirs  if not d.startswith( '.' ) ]
+          dirs[:] = [ d for d in dirs  if not d.startswith( '.' ) ]
           if is_xcl( root, excludes ):
                # Skip excluded directories
                continue
@@ -45,6 +59,61 @@ def find( path, patterns ):
                  matches.append( match )
      return matches
 
+def _scan_dir( path, suffixes, excludes, hidden ):
+    '''
+    One directory level: (matching files, subdirectories to descend)
+    '''
+    matches = []
+    subdirs = []
+    try:
+        with os.scandir( path ) as it:
+            for node in it:
+                name = node.name
+                if not hidden and name.startswith( '.' ):
+                    continue
+                try:
+                    is_dir = node.is_dir( follow_symlinks = False )
+                except OSError as e:
+                    continue
+                if is_dir:
+                    if name not in excludes:
+                        subdirs.append( node.path )
+                elif os.path.splitext( name )[1].lower() in suffixes:
+                    matches.append( node.path )
+    except OSError as e:
+        pass
+    return matches, subdirs
+
+def walk_media( path, patterns, excludes = ( '.git', '.svn' ), hidden = False, workers = None ):
+    '''
+    Yield files under <path> whose extension is one of <patterns>
+
+    Directories are listed with os.scandir on a thread pool and matches
+    are yielded as each directory completes, in no particular order.
+    Hidden entries are skipped unless <hidden>, directories named in
+    <excludes> are not descended.  Symlinked directories are not followed.
+    '''
+    suffixes = frozenset( p.lower() for p in patterns )
+    excludes = frozenset( excludes )
+    workers  = walk_workers if workers is None else workers
+
+    pool    = ThreadPoolExecutor( max_workers = max( 1, workers ) )
+    pending = { pool.submit( _scan_dir, path, suffixes, excludes, hidden ) }
+    try:
+        while pending:
+            done, pending = wait( pending, return_when = FIRST_COMPLETED )
+            for future in done:
+                matches, subdirs = future.result()
+                for subdir in subdirs:
+                    pending.add( pool.submit( _scan_dir, subdir, suffixes, excludes, hidden ) )
+                for match in matches:
+                    yield match
+    finally:
+        # The caller may stop early, drop whatever has not started
+        for future in pending:
+            future.cancel()
+        pool.shutdown( wait = False )
+
 # Attempt to get a list of a filesystem subtree from a string
 def list_dir( path = None ):
     dirlist = []
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""Media cache - content addressed, size bounded store of derived files
+"""
+import os
+import re
+import json
+import time
+import shutil
+import atexit
+import hashlib
+from threading import Lock, Thread, current_thread
+
+from . import fsutil
+from .probecache import cache_dir
+
+# Bytes read from each end of the file for a partial content hash
+hash_span = 64 * 1024
+
+# Entry directory names, as made by fingerprint()
+key_re = re.compile( r'[0-9a-f]{24}$' )
+
+
+def fingerprint( media, partial_hash = False ):
+    '''
+    Key of <media>: hash of its path, size and mtime, plus optionally
+    its first and last <hash_span> bytes (catches edits that keep size
+    and mtime; a touch still moves the file to a fresh key)
+    '''
+    path, size, mtime = fsutil.stat_key( media )
+    digest = hashlib.sha1( '{}\0{}\0{}'.format( path, size, mtime ).encode( 'utf-8', 'surrogateescape' ) )
+    if partial_hash:
+        with open( media, 'rb' ) as f:
+            digest.update( f.read( hash_span ) )
+            if size > hash_span:
+                f.seek( max( hash_span, size - hash_span ) )
+                digest.update( f.read( hash_span ) )
+    return digest.hexdigest()[ :24 ]
+
+
+class MediaCache( object ):
+    '''
+    MediaCache
+
+    One directory per media fingerprint under <root>, so two files with
+    the same name never share previews and an edited file gets fresh
+    ones.  The index (root/index.json) tracks each entry's size and last
+    access; evict() removes least recently used entries until the cache
+    fits in <budget> bytes.  Eviction and clearing can run on a
+    background thread.  Anything else under <root> is left alone, so the
+    cache can share it with other state.
+    '''
+    def __init__( self, root = cache_dir, budget = 512 * 1024 * 1024, partial_hash = False, flush_interval = 2.0 ):
+        super( MediaCache, self ).__init__()
+        self.root            = root
+        self.budget          = budget
+        self._partial_hash   = partial_hash
+        self._flush_interval = flush_interval
+        self._index_path     = os.path.join( root, 'index.json' )
+        self._lock           = Lock()
+        self._entries        = None
+        self._dirty          = False
+        self._saved          = 0.0
+        self._cleaner        = None
+        self._callbacks      = []
+        self._clearing       = False
+        atexit.register( self.flush )
+
+    def _load( self ):
+        if self._entries is not None:
+            return
+        self._entries = {}
+        try:
+            with open( self._index_path, 'r' ) as f:
+                self._entries = json.load( f )
+        except ( OSError, ValueError ) as e:
+            pass
+
+    def key( self, media ):
+        return fingerprint( media, self._partial_hash )
+
+    def entry( self, media ):
+        '''
+        Directory for the files derived from <media> (created if needed)
+        '''
+        key  = self.key( media )
+        path = os.path.join( self.root, key )
+        if not os.path.isdir( path ):
+            fsutil.mkdir_p( path )
+        with self._lock:
+            self._load()
+            entry = self._entries.setdefault( key, { 'media' : media, 'size' : 0 } )
+            entry[ 'atime' ] = time.time()
+            self._dirty = True
+        self._maybe_flush()
+        return path
+
+    def lookup( self, media, name ):
+        '''
+        Path of <name> in the entry of <media>, None if not cached yet
+        '''
+        key  = self.key( media )
+        path = os.path.join( self.root, key, name )
+        if not os.path.exists( path ):
+            return None
+        with self._lock:
+            self._load()
+            entry = self._entries.get( key )
+            if entry is not None:
+                entry[ 'atime' ] = time.time()
+                self._dirty = True
+        self._maybe_flush()
+        return path
+
+    def commit( self, media ):
+        '''
+        Account for the files just written for <media>, then evict in
+        the background if the cache is over budget
+        '''
+        key  = self.key( media )
+        path = os.path.join( self.root, key )
+        size = self._du( path )
+        with self._lock:
+            self._load()
+            entry = self._entries.setdefault( key, { 'media' : media } )
+            entry[ 'size' ]  = size
+            entry[ 'atime' ] = time.time()
+            self._dirty = True
+            over = self.budget is not None and self._total() > self.budget
+        self._maybe_flush()
+        if over:
+            self.clean_async()
+
+    @staticmethod
+    def _du( path ):
+        total = 0
+        try:
+            with os.scandir( path ) as it:
+                for node in it:
+                    if node.is_file( follow_symlinks = False ):
+                        total += node.stat( follow_symlinks = False ).st_size
+        except OSError as e:
+            pass
+        return total
+
+    def _total( self ):
+        return sum( entry.get( 'size', 0 ) for entry in self._entries.values() )
+
+    @property
+    def size( self ):
+        with self._lock:
+            self._load()
+            return self._total()
+
+    def _stale( self, key, entry ):
+        '''
+        Entry of a file that is gone or has changed since
+        '''
+        try:
+            return self.key( entry[ 'media' ] ) != key
+        except OSError as e:
+            return True
+
+    def evict( self, budget = None ):
+        '''
+        Drop stale entries, then least recently used ones until the
+        cache fits in <budget> (defaults to self.budget)
+        '''
+        budget = self.budget if budget is None else budget
+        with self._lock:
+            self._load()
+            entries = list( self._entries.items() )
+
+        doomed = [ key for key, entry in entries if self._stale( key, entry ) ]
+        live   = sorted( ( ( entry.get( 'atime', 0 ), key, entry.get( 'size', 0 ) )
+                           for key, entry in entries if key not in doomed ) )
+        total  = sum( size for atime, key, size in live )
+        for atime, key, size in live:
+            if budget is None or total <= budget:
+                break
+            doomed.append( key )
+            total -= size
+
+        for key in doomed:
+            shutil.rmtree( os.path.join( self.root, key ), ignore_errors = True )
+            with self._lock:
+                self._entries.pop( key, None )
+                self._dirty = True
+        self.flush()
+        return len( doomed )
+
+    def clear( self ):
+        '''
+        Remove every entry, including entry directories the index does
+        not know about (e.g. left by an older index); other directories
+        under root are not the cache's and are kept
+        '''
+        removed = 0
+        with self._lock:
+            self._load()
+            keys = set( self._entries )
+        try:
+            with os.scandir( self.root ) as it:
+                dirs = [ node.path for node in it
+                         if node.is_dir( follow_symlinks = False )
+                         and ( node.name in keys or key_re.match( node.name ) ) ]
+        except OSError as e:
+            dirs = []
+        for path in dirs:
+            shutil.rmtree( path, ignore_errors = True )
+            removed += 1
+        with self._lock:
+            self._entries = {}
+            self._dirty   = True
+        self.flush()
+        return removed
+
+    def clean_async( self, clear = False, callback = None ):
+        '''
+        evict() (or clear()) on a background thread, <callback>( removed )
+        is called from that thread when done.  A clear asked for while an
+        evict runs is queued behind it; anything else joins the running
+        thread, and its <callback> is called when that one is done
+        '''
+        with self._lock:
+            previous = self._cleaner
+            if previous is not None:
+                if not clear or self._clearing:
+                    if callback is not None:
+                        self._callbacks.append( callback )
+                    return previous
+            callbacks = [ callback ] if callback is not None else []
+            def run():
+                removed = 0
+                try:
+                    if previous is not None:
+                        previous.join()
+                    removed = self.clear() if clear else self.evict()
+                finally:
+                    # Once no longer the current cleaner nobody adds to
+                    # <callbacks>
+                    with self._lock:
+                        if self._cleaner is current_thread():
+                            self._cleaner = None
+                    for pending in callbacks:
+                        pending( removed )
+            self._clearing  = clear
+            self._callbacks = callbacks
+            self._cleaner   = Thread( target = run, name = 'MediaCacheCleaner' )
+            self._cleaner.daemon = True
+            self._cleaner.start()
+            return self._cleaner
+
+    def _maybe_flush( self ):
+        if time.time() - self._saved >= self._flush_interval:
+            self.flush()
+
+    def flush( self ):
+        with self._lock:
+            if not self._dirty:
+                return
+            data        = json.dumps( self._entries )
+            self._dirty = False
+            self._saved = time.time()
+
+        tmp = '{}.{}.tmp'.format( self._index_path, os.getpid() )
+        try:
+            if not os.path.isdir( self.root ):
+                fsutil.mkdir_p( self.root )
+            with open( tmp, 'w' ) as f:
+                f.write( data )
+            os.replace( tmp, self._index_path )
+        except OSError as e:
+            print( 'Could not save cache index {}: {}'.format( self._index_path, e ) )
+
+    def __len__( self ):
+        with self._lock:
+            self._load()
+            return len( self._entries )
@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+"""Orchestrator - every stream of the host under one CPU budget
+"""
+import os
+import math
+import time
+from threading import Lock
+from collections import OrderedDict, namedtuple
+
+from . import stream as streams
+from .process import Limits, IOPRIO_CLASS_BE, IOPRIO_CLASS_IDLE
+
+# Streams are admitted until this share of the pooled cpus is committed
+# (or measured busy)
+max_load = 0.85
+
+# Admission measures the host over at least this many seconds, back to
+# back starts would otherwise see each other's spawn as load
+sample_interval = 1.0
+
+# Less than this many cores left: a new stream is refused, not degraded
+min_cores = 0.25
+
+# What a degraded stream runs at: below every stream with its full budget
+degraded_nice   = 15
+degraded_ionice = ( IOPRIO_CLASS_IDLE, 0 )
+
+clock_ticks = os.sysconf( 'SC_CLK_TCK' )
+
+# Per stream: <cores> it may use (fractions share cpus), nice, ionice
+# ( class, level ) and ffmpeg threads (None: the cores rounded up)
+Budget = namedtuple( 'Budget', 'cores nice ionice threads' )
+Budget.__new__.__defaults__ = ( 1.0, 5, ( IOPRIO_CLASS_BE, 4 ), None )
+
+
+class Saturated( Exception ):
+    '''
+    No room left on the host for another stream
+    '''
+    pass
+
+
+def cpu_times():
+    '''
+    ( busy, total ) clock ticks of every cpu since boot, from /proc/stat
+    '''
+    times = {}
+    with open( '/proc/stat', 'r' ) as f:
+        for line in f:
+            if not line.startswith( 'cpu' ) or line.startswith( 'cpu ' ):
+                continue
+            fields = line.split()
+            values = [ int( v ) for v in fields[ 1:9 ] ]
+            idle   = values[ 3 ] + values[ 4 ] # idle + iowait
+            total  = sum( values )
+            times[ int( fields[ 0 ][ 3: ] ) ] = ( total - idle, total )
+    return times
+
+def process_time( pid ):
+    '''
+    user + system seconds of <pid>, all its threads, None once gone
+    '''
+    try:
+        with open( '/proc/{}/stat'.format( pid ), 'r' ) as f:
+            data = f.read()
+    except OSError as e:
+        return None
+    # The command name may hold spaces, the fields start after its ')'
+    fields = data[ data.rindex( ')' ) + 2: ].split()
+    return ( int( fields[ 11 ] ) + int( fields[ 12 ] ) ) / float( clock_ticks )
+
+
+class Slot( object ):
+    '''
+    Slot
+
+    One orchestrated stream: its <budget> (after admission), the <cpus>
+    it is pinned to and the Limits it was started with.  <stream> is
+    None while it starts, the budget is held all the same
+    '''
+    def __init__( self, name, stream, budget, limits, degraded ):
+        super( Slot, self ).__init__()
+        self.name     = name
+        self.stream   = stream
+        self.budget   = budget
+        self.limits   = limits
+        self.cpus     = limits.cpus
+        self.degraded = degraded
+        self.started  = time.time()
+        self._last    = None # ( monotonic, cpu seconds )
+
+    @property
+    def pid( self ):
+        return self.stream.pid if self.stream is not None else None
+
+    @property
+    def alive( self ):
+        return self.stream is None or self.stream.alive
+
+    def used( self ):
+        '''
+        Cores used since the last call (None on the first)
+        '''
+        if self.stream is None:
+            return None
+        now, cpu = time.monotonic(), process_time( self.pid )
+        last, self._last = self._last, ( now, cpu )
+        if last is None or cpu is None or last[ 1 ] is None or now <= last[ 0 ]:
+            return None
+        return ( cpu - last[ 1 ] ) / ( now - last[ 0 ] )
+
+
+class Orchestrator( object ):
+    '''
+    Orchestrator
+
+    Starts and owns the host's streams.  Each gets a Budget (cores,
+    nice, ionice, ffmpeg threads) and is pinned to the least loaded of
+    the pooled <cpus> (all this process may use, minus the first
+    <reserve> left to the host; by default one when there are more than
+    two).  A stream is admitted while the committed cores, and the
+    measured load with <measure>, stay under <max_load> of the pool;
+    past that it is degraded to what is left, at a lower priority
+    (<degrade>), or refused with Saturated.  sample() reports host and
+    per stream utilization.
+    '''
+    def __init__( self, cpus = None, reserve = None, max_load = max_load, budget = None, degrade = True,
+                  measure = True, verbose = False ):
+        super( Orchestrator, self ).__init__()
+        cpus = sorted( cpus if cpus is not None else os.sched_getaffinity( 0 ) )
+        if reserve is None:
+            reserve = 1 if len( cpus ) > 2 else 0
+        self.cpus      = cpus[ reserve: ] or cpus
+        self.reserved  = cpus[ :len( cpus ) - len( self.cpus ) ]
+        self.max_load  = max_load
+        self.budget    = budget or Budget()
+        self.degrade   = degrade
+        self.measure   = measure
+        self._verbose  = verbose
+        self._lock     = Lock()
+        self._slots    = OrderedDict()
+        self._count    = 0
+        self._host     = None # cpu_times() of the last sample
+        self._sampled  = 0.0  # and its time.monotonic()
+        self._busy     = {}   # cpu -> busy fraction between the last samples
+        self.refused   = 0
+        self.degraded  = 0
+
+    @property
+    def capacity( self ):
+        return len( self.cpus ) * self.max_load
+
+    def committed( self ):
+        return sum( slot.budget.cores for slot in self._slots.values() )
+
+    def _load( self ):
+        '''
+        Committed cores per cpu, a stream's cores spread over its cpus
+        '''
+        load = dict( ( cpu, 0.0 ) for cpu in self.cpus )
+        for slot in self._slots.values():
+            for cpu in slot.cpus:
+                load[ cpu ] = load.get( cpu, 0.0 ) + slot.budget.cores / len( slot.cpus )
+        return load
+
+    def _sample_host( self, interval = 0.0 ):
+        if self._host is not None and time.monotonic() - self._sampled < interval:
+            return
+        times = cpu_times()
+        self._sampled = time.monotonic()
+        if self._host is not None:
+            busy = {}
+            for cpu, ( used, total ) in times.items():
+                used0, total0 = self._host.get( cpu, ( used, total ) )
+                busy[ cpu ] = ( used - used0 ) / float( total - total0 ) if total > total0 else 0.0
+            self._busy = busy
+        self._host = times
+
+    def free( self ):
+        '''
+        Cores a new stream may still take
+        '''
+        free = self.capacity - self.committed()
+        if self.measure:
+            busy = sum( self._busy.get( cpu, 0.0 ) for cpu in self.cpus )
+            free = min( free, self.capacity - busy )
+        return max( 0.0, free )
+
+    def admit( self, budget ):
+        '''
+        <budget> as is when it fits, degraded to the free cores, else
+        Saturated.  Returns ( budget, degraded )
+        '''
+        free = self.free()
+        if budget.cores <= free + 1e-9:
+            return budget, False
+        if self.degrade and free >= min_cores:
+            return Budget( free,
+                           max( budget.nice if budget.nice is not None else 0, degraded_nice ),
+                           degraded_ionice,
+                           max( 1, int( free ) ) ), True
+        raise Saturated( '{:.2f} cores wanted, {:.2f} free of {:.2f} ({} streams)'.format(
+            budget.cores, free, self.capacity, len( self._slots ) ) )
+
+    def place( self, cores ):
+        '''
+        The ceil( <cores> ) least loaded cpus, committed and measured
+        '''
+        count = min( len( self.cpus ), max( 1, int( math.ceil( cores - 1e-9 ) ) ) )
+        load  = self._load()
+        ranked = sorted( self.cpus, key = lambda cpu : ( load.get( cpu, 0.0 ) + self._busy.get( cpu, 0.0 ), cpu ) )
+        return sorted( ranked[ :count ] )
+
+    def start( self, factory, *args, **kwargs ):
+        '''
+        Admit, place and start factory( *args, limits = Limits, **kwargs )
+        (e.g. stream.stream_media).  <name> and <budget> keywords are
+        the orchestrator's, the name defaults to stream<N>
+        '''
+        name   = kwargs.pop( 'name', None )
+        budget = kwargs.pop( 'budget', None ) or self.budget
+        with self._lock:
+            self._reap()
+            if self.measure:
+                self._sample_host( sample_interval )
+            if name is not None and name in self._slots:
+                raise ValueError( 'A stream named {} is running'.format( name ) )
+            try:
+                budget, degraded = self.admit( budget )
+            except Saturated as e:
+                self.refused += 1
+                raise
+            cpus   = self.place( budget.cores )
+            limits = Limits( cpus, budget.nice, budget.ionice, budget.threads or max( 1, int( math.ceil( budget.cores ) ) ) )
+            self._count += 1
+            name = name or 'stream{}'.format( self._count )
+            if self._verbose: print( '{}: {:.2f} cores{}, {}'.format( name, budget.cores, ' (degraded)' if degraded else '', limits ) )
+            # Reserved: the next admission counts it while it starts
+            slot = Slot( name, None, budget, limits, degraded )
+            self._slots[ name ] = slot
+
+        # Probing and spawning take a while, sample() and stop() go on
+        try:
+            stream = factory( *args, limits = limits, **kwargs )
+        except BaseException as e:
+            with self._lock:
+                if self._slots.get( name ) is slot:
+                    del self._slots[ name ]
+            raise
+        with self._lock:
+            slot.stream = stream
+            wanted      = self._slots.get( name ) is slot
+            if wanted and degraded:
+                self.degraded += 1
+        if not wanted:
+            # Stopped while it started
+            stream.stop()
+        return stream
+
+    def stream_media( self, fname, dev = '/dev/video20', verbose = True, **kwargs ):
+        return self.start( streams.stream_media, fname, dev, verbose, **kwargs )
+
+    def fanout_stream( self, fname, targets, verbose = True, **kwargs ):
+        return self.start( streams.fanout_stream, fname, targets, verbose, **kwargs )
+
+    def overlay_stream( self, fname, overlay, dev = '/dev/video20', verbose = True, **kwargs ):
+        return self.start( streams.overlay_stream, fname, overlay, dev, verbose, **kwargs )
+
+    def desktop_stream( self, x = 0, y = 0, w = 640, h = 480, display = ':0', dev = '/dev/video20', verbose = True, **kwargs ):
+        return self.start( streams.desktop_stream, x, y, w, h, display, dev, verbose, **kwargs )
+
+    def _reap( self ):
+        for name, slot in list( self._slots.items() ):
+            if not slot.alive:
+                slot.stream.stop()
+                del self._slots[ name ]
+
+    def reap( self ):
+        '''
+        Forget the streams that ended, their budget is free again
+        '''
+        with self._lock:
+            self._reap()
+
+    def stop( self, name ):
+        with self._lock:
+            slot   = self._slots.pop( name, None )
+            # None while starting: start() stops it once it has it
+            stream = slot.stream if slot is not None else None
+        if stream is not None:
+            stream.stop()
+
+    def stop_all( self ):
+        with self._lock:
+            streams = [ slot.stream for slot in self._slots.values() if slot.stream is not None ]
+            self._slots.clear()
+        for stream in streams:
+            stream.stop()
+
+    def __contains__( self, name ):
+        return name in self._slots
+
+    def __len__( self ):
+        return len( self._slots )
+
+    def sample( self ):
+        '''
+        Utilization since the previous sample: the host (busy share of
+        each pooled cpu, cores committed and free) and every stream
+        (cores used against its budget, ffmpeg's fps and speed)
+        '''
+        with self._lock:
+            self._reap()
+            self._sample_host()
+            slots = [ slot for slot in self._slots.values() if slot.stream is not None ]
+            host  = { 'cpus'      : list( self.cpus ),
+                      'reserved'  : list( self.reserved ),
+                      'per_cpu'   : dict( ( cpu, self._busy.get( cpu ) ) for cpu in self.cpus ),
+                      'busy'      : ( sum( self._busy.get( cpu, 0.0 ) for cpu in self.cpus ) / len( self.cpus )
+                                      if self._busy else None ),
+                      'committed' : self.committed(),
+                      'capacity'  : self.capacity,
+                      'free'      : self.free(),
+                      'streams'   : len( slots ),
+                      'refused'   : self.refused,
+                      'degraded'  : self.degraded }
+
+        result = OrderedDict()
+        for slot in slots:
+            used    = slot.used()
+            metrics = getattr( slot.stream, 'metrics', None )
+            window  = metrics.window() if metrics is not None else {}
+            result[ slot.name ] = { 'pid'      : slot.pid,
+                                    'cpus'     : slot.cpus,
+                                    'cores'    : slot.budget.cores,
+                                    'nice'     : slot.budget.nice,
+                                    'threads'  : slot.limits.threads,
+                                    'degraded' : slot.degraded,
+                                    'used'     : used,
+                                    'share'    : used / slot.budget.cores if used is not None and slot.budget.cores else None,
+                                    'fps'      : window.get( 'fps' ),
+                                    'speed'    : window.get( 'speed' ) }
+        return { 'host' : host, 'streams' : result }
+
+    def summary( self, sample = None ):
+        '''
+        sample() as text, one line for the host and one per stream
+        '''
+        sample = sample or self.sample()
+        fmt    = lambda v, spec, unit = '' : format( v, spec ) + unit if v is not None else 'N/A'
+        host   = sample[ 'host' ]
+        lines  = [ 'host: busy={} committed={:.2f}/{:.2f} cores free={:.2f} streams={} refused={} degraded={}'.format(
+            fmt( host[ 'busy' ], '.0%' ), host[ 'committed' ], host[ 'capacity' ], host[ 'free' ],
+            host[ 'streams' ], host[ 'refused' ], host[ 'degraded' ] ) ]
+        for name, s in sample[ 'streams' ].items():
+            lines.append( '{}: cpus={} used={}/{:.2f} cores ({}) fps={} speed={}{}'.format(
+                name, ','.join( str( c ) for c in s[ 'cpus' ] ), fmt( s[ 'used' ], '.2f' ), s[ 'cores' ],
+                fmt( s[ 'share' ], '.0%' ), fmt( s[ 'fps' ], '.1f' ), fmt( s[ 'speed' ], '.2f', 'x' ),
+                ' degraded' if s[ 'degraded' ] else '' ) )
+        return '\n'.join( lines )
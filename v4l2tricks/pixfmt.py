@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""Pixel formats - raw frame geometry
+"""
+
+# Bytes per pixel as ( numerator, denominator ), ffmpeg pix_fmt names
+bytes_per_pixel = {
+    'yuv420p' : ( 3, 2 ),
+    'nv12'    : ( 3, 2 ),
+    'yuyv422' : ( 2, 1 ),
+    'uyvy422' : ( 2, 1 ),
+    'gray'    : ( 1, 1 ),
+    'rgb24'   : ( 3, 1 ),
+    'bgr24'   : ( 3, 1 ),
+    'rgba'    : ( 4, 1 ),
+    'bgra'    : ( 4, 1 ),
+    'bgr0'    : ( 4, 1 ),
+}
+
+# V4L2 fourcc of each pix_fmt (byte order as laid out in memory)
+fourccs = {
+    'yuv420p' : 'YU12',
+    'nv12'    : 'NV12',
+    'yuyv422' : 'YUYV',
+    'uyvy422' : 'UYVY',
+    'gray'    : 'GREY',
+    'rgb24'   : 'RGB3',
+    'bgr24'   : 'BGR3',
+    'rgba'    : 'AB24',
+    'bgra'    : 'AR24',
+    'bgr0'    : 'XR24',
+}
+
+# Formats stored as separate planes, bytesperline is that of the luma plane
+planar = { 'yuv420p', 'nv12' }
+
+# Chroma subsampling ( horizontal, vertical ), sizes must be multiples
+subsampling = {
+    'yuv420p' : ( 2, 2 ),
+    'nv12'    : ( 2, 2 ),
+    'yuyv422' : ( 2, 1 ),
+    'uyvy422' : ( 2, 1 ),
+}
+
+def supported( pix_fmt ):
+    return pix_fmt in bytes_per_pixel
+
+def frame_size( width, height, pix_fmt ):
+    '''
+    Size in bytes of one rawvideo frame
+    '''
+    try:
+        num, den = bytes_per_pixel[ pix_fmt ]
+    except KeyError as e:
+        raise ValueError( 'Unsupported pix_fmt: {}'.format( pix_fmt ) )
+    return width * height * num // den
+
+def bytes_per_line( width, pix_fmt ):
+    if pix_fmt in planar:
+        return width
+    num, den = bytes_per_pixel[ pix_fmt ]
+    return width * num // den
+
+def fourcc( pix_fmt ):
+    '''
+    'yuv420p' -> v4l2_fourcc( 'Y', 'U', '1', '2' )
+    '''
+    try:
+        code = fourccs[ pix_fmt ]
+    except KeyError as e:
+        raise ValueError( 'No V4L2 fourcc for pix_fmt: {}'.format( pix_fmt ) )
+    return ord( code[0] ) | ( ord( code[1] ) << 8 ) | ( ord( code[2] ) << 16 ) | ( ord( code[3] ) << 24 )
+
+def shape( width, height, pix_fmt ):
+    '''
+    Array shape (uint8) of one frame: packed formats are
+    ( height, width, components ), planar ones are stacked planes
+    '''
+    if pix_fmt in planar:
+        return ( height * 3 // 2, width )
+    num, den = bytes_per_pixel[ pix_fmt ]
+    if num == 1:
+        return ( height, width )
+    return ( height, width, num )
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""Planner - the cheapest ffmpeg graph from a probed source to an output
+"""
+from .pixfmt import subsampling
+
+# swscale flags: downscaling loses detail anyway, fast_bilinear is a
+# fraction of the cost; upscaling keeps the default quality
+downscale_flags = 'fast_bilinear'
+upscale_flags   = 'bicubic'
+
+# Frame rates closer than this are the same rate
+fps_tolerance = 0.01
+
+
+class Plan( object ):
+    '''
+    Plan
+
+    How a source becomes <width>x<height> <pix_fmt> [at <fps>]: the
+    video filters ( name, args, kwargs ) in order, the output options
+    (video only: -an -sn -dn, and the pix_fmt) and the reasons, one per
+    decision (explain()).  apply() adds the filters to an ffmpeg-python
+    video stream.
+    '''
+    def __init__( self, width, height, pix_fmt, fps = None ):
+        super( Plan, self ).__init__()
+        self.width       = width
+        self.height      = height
+        self.pix_fmt     = pix_fmt
+        self.fps         = fps
+        self.filters     = []
+        self.conversions = 0
+        self.steps       = []
+        self.output_args = { 'pix_fmt' : pix_fmt, 'an' : None, 'sn' : None, 'dn' : None }
+
+    def add( self, name, *args, **kwargs ):
+        self.filters.append( ( name, args, kwargs ) )
+
+    def apply( self, stream ):
+        for name, args, kwargs in self.filters:
+            stream = stream.filter( name, *args, **kwargs )
+        return stream
+
+    @property
+    def identity( self ):
+        '''
+        Frames go out as decoded, no filter and no conversion
+        '''
+        return not self.filters and not self.conversions
+
+    def explain( self ):
+        return '\n'.join( self.steps )
+
+    def __str__( self ):
+        graph = ','.join( name + ( '=' + ':'.join( [ str( a ) for a in args ] +
+                                                   [ '{}={}'.format( k, v ) for k, v in sorted( kwargs.items() ) ] )
+                                   if args or kwargs else '' )
+                          for name, args, kwargs in self.filters )
+        return graph or '(no filters)'
+
+
+def _aligned( width, height, pix_fmt ):
+    '''
+    <width>x<height> rounded down to what <pix_fmt>'s subsampling allows
+    '''
+    sx, sy = subsampling.get( pix_fmt, ( 1, 1 ) )
+    return width - width % sx, height - height % sy
+
+def plan( info, width = None, height = None, pix_fmt = 'yuv420p', fps = None, letterbox = False, flags = None ):
+    '''
+    Plan the graph from a source described by <info> (see probe_info,
+    None when unknown: everything is done) to the output format.  A
+    missing <width> or <height> follows the source's aspect ratio, both
+    missing keep the source size; <fps> None keeps the source rate.
+    With <letterbox> a different aspect ratio is padded, not stretched.
+    <flags> overrides the scaler flags, e.g. for offline transcodes.
+    '''
+    if info is None:
+        return _full( width, height, pix_fmt, fps, letterbox )
+
+    src_w, src_h = info[ 'width' ], info[ 'height' ]
+    src_fmt      = info.get( 'pix_fmt' )
+    src_fps      = info.get( 'frame_rate' )
+
+    # Size
+    if width is None and height is None:
+        width, height = src_w, src_h
+        explicit      = False
+    else:
+        if width is None:
+            width  = int( round( src_w * height / float( src_h ) ) )
+        elif height is None:
+            height = int( round( src_h * width / float( src_w ) ) )
+        explicit = True
+    width, height = _aligned( width, height, pix_fmt )
+
+    p = Plan( width, height, pix_fmt, fps )
+    if ( width, height ) == ( src_w, src_h ):
+        p.steps.append( 'size {}x{} kept: no scale'.format( width, height ) )
+        scaled = False
+    elif not explicit:
+        # Only the subsampling alignment differs, drop the odd row/column
+        p.add( 'crop', width, height, 0, 0 )
+        p.steps.append( 'size {}x{} -> {}x{}: cropped to even for {}, no scale'.format( src_w, src_h, width, height, pix_fmt ) )
+        scaled = False
+    else:
+        down  = width * height < src_w * src_h
+        flags = flags or ( downscale_flags if down else upscale_flags )
+        if letterbox and width * src_h != height * src_w:
+            p.add( 'scale', width, height, force_original_aspect_ratio = 'decrease', flags = flags )
+            p.add( 'pad', width, height, '(ow-iw)/2', '(oh-ih)/2' )
+            p.add( 'setsar', 1 )
+            what = 'letterboxed'
+        else:
+            p.add( 'scale', width, height, flags = flags )
+            what = 'scaled'
+        p.steps.append( 'size {}x{} -> {}x{}: {} ({}scaling, {})'.format(
+            src_w, src_h, width, height, what, 'down' if down else 'up', flags ) )
+        scaled = True
+
+    # Pixel format, converted once: by the scale when there is one
+    if src_fmt == pix_fmt:
+        p.steps.append( 'pix_fmt {} kept: no conversion'.format( pix_fmt ) )
+    else:
+        p.conversions = 1
+        p.steps.append( 'pix_fmt {} -> {}: one conversion{}'.format(
+            src_fmt or 'unknown', pix_fmt, ', in the same scale' if scaled else '' ) )
+
+    # Frame rate
+    if fps and src_fps and abs( fps - src_fps ) > fps_tolerance:
+        p.add( 'fps', fps )
+        p.steps.append( 'fps {:g} -> {:g}: fps filter'.format( src_fps, fps ) )
+    elif fps and not src_fps:
+        p.add( 'fps', fps )
+        p.steps.append( 'fps unknown -> {:g}: fps filter'.format( fps ) )
+    else:
+        p.steps.append( 'fps {} kept'.format( '{:g}'.format( src_fps ) if src_fps else 'of the source' ) )
+
+    # Streams
+    dropped = {}
+    for kind in info.get( 'streams', [] ):
+        dropped[ kind ] = dropped.get( kind, 0 ) + 1
+    dropped[ 'video' ] = dropped.get( 'video', 1 ) - 1
+    dropped = [ '{} {}'.format( n, kind ) for kind, n in sorted( dropped.items() ) if n > 0 ]
+    p.steps.append( 'first video stream only (-an -sn -dn){}'.format(
+        ', not decoded: ' + ', '.join( dropped ) if dropped else '' ) )
+    return p
+
+def _full( width, height, pix_fmt, fps, letterbox ):
+    '''
+    Nothing known about the source: scale (letterboxed), convert and
+    resample the rate to be sure of the output
+    '''
+    p = Plan( width, height, pix_fmt, fps )
+    if width is not None or height is not None:
+        w = width  if width  is not None else -2
+        h = height if height is not None else -2
+        if letterbox and width is not None and height is not None:
+            p.add( 'scale', w, h, force_original_aspect_ratio = 'decrease' )
+            p.add( 'pad', w, h, '(ow-iw)/2', '(oh-ih)/2' )
+            p.add( 'setsar', 1 )
+        else:
+            p.add( 'scale', w, h )
+    if fps:
+        p.add( 'fps', fps )
+    p.conversions = 1
+    p.steps.append( 'source unknown: scale, convert to {} and set the rate'.format( pix_fmt ) )
+    p.steps.append( 'first video stream only (-an -sn -dn)' )
+    return p
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""Prefetch - prepare the next playlist item while the current one plays
+"""
+import os
+import time
+from collections import deque
+from threading import Thread, Event, Lock
+
+try:
+    from queue import Queue
+except ImportError as e:
+    # Python 2.x
+    from Queue import Queue
+
+from .ffmpeg_if import probe_info
+
+# Bytes of the head and tail of a file pulled into the page cache: the
+# head holds the first GOPs, the tail an mp4 index (moov) written last
+readahead_head = 8 * 1024 * 1024
+readahead_tail = 1 * 1024 * 1024
+
+# Prepared items kept for a ready() that has not been asked yet
+prepared_keep = 16
+
+
+def warm_page_cache( path, head = readahead_head, tail = readahead_tail ):
+    '''
+    Ask the kernel to read the head and tail of <path> ahead
+    (posix_fadvise WILLNEED, reading them where that is missing)
+    '''
+    fd = os.open( path, os.O_RDONLY )
+    try:
+        size   = os.fstat( fd ).st_size
+        ranges = [ ( 0, min( head, size ) ) ]
+        if size > head:
+            start = max( head, size - tail )
+            ranges.append( ( start, size - start ) )
+        for offset, length in ranges:
+            if hasattr( os, 'posix_fadvise' ):
+                os.posix_fadvise( fd, offset, length, os.POSIX_FADV_WILLNEED )
+            else:
+                os.lseek( fd, offset, os.SEEK_SET )
+                while length > 0:
+                    chunk = os.read( fd, min( length, 1024 * 1024 ) )
+                    if not chunk:
+                        break
+                    length -= len( chunk )
+    finally:
+        os.close( fd )
+
+
+class Prefetcher( object ):
+    '''
+    Prefetcher
+
+    Background look-ahead for playlist items: prefetch( fname ) queues
+    it, a worker thread then warms the page cache, fills the probe cache
+    (see probe_info) and, given a <pool> (WarmPool), starts its decoder
+    so the first frames are decoded before the switch.  A closed pool
+    is dropped, not fed.  ready( fname ) waits for an item to be
+    prepared and consumes it; only the last <prepared_keep> prepared
+    items are remembered for it.
+    '''
+    def __init__( self, pool = None, head = readahead_head, tail = readahead_tail, verbose = False ):
+        super( Prefetcher, self ).__init__()
+        self.pool     = pool
+        self.head     = head
+        self.tail     = tail
+        self._verbose = verbose
+        self._queue   = Queue()
+        self._lock    = Lock()
+        self._items   = {} # fname -> Event, set once prepared
+        self._done    = deque() # Prepared fnames, oldest first
+        self.prepared = 0
+        self.seconds  = 0.0
+
+        self._worker = Thread( target = self.run, name = 'Prefetcher' )
+        self._worker.daemon = True
+        self._worker.start()
+
+    def prefetch( self, fname ):
+        if fname is None:
+            return
+        with self._lock:
+            event = self._items.get( fname )
+            if event is not None and not event.is_set():
+                return # Already on its way
+            self._items[ fname ] = Event()
+        self._queue.put( fname )
+
+    def ready( self, fname, timeout = None ):
+        with self._lock:
+            event = self._items.get( fname )
+        if event is None or not event.wait( timeout ):
+            return False
+        with self._lock:
+            if self._items.get( fname ) is event:
+                del self._items[ fname ]
+        return True
+
+    def run( self ):
+        while True:
+            fname = self._queue.get()
+            if fname is None:
+                break
+            t0 = time.time()
+            try:
+                warm_page_cache( fname, self.head, self.tail )
+                probe_info( fname )
+                pool = self.pool
+                if pool is not None and getattr( pool, 'closed', False ):
+                    # Its stream stopped, nothing would stop its decoders.
+                    # Only drop it if no new pool was installed meanwhile
+                    with self._lock:
+                        if self.pool is pool:
+                            self.pool = None
+                    pool = None
+                if pool is not None:
+                    pool.prepare( [ fname ] )
+            except Exception as e:
+                print( 'Could not prefetch {}: {}'.format( fname, e ) )
+            elapsed = time.time() - t0
+            self.prepared += 1
+            self.seconds  += elapsed
+            if self._verbose: print( 'Prefetched {} in {:.3f}s'.format( fname, elapsed ) )
+            with self._lock:
+                event = self._items.get( fname )
+                self._done.append( fname )
+                while len( self._done ) > prepared_keep:
+                    old      = self._done.popleft()
+                    finished = self._items.get( old )
+                    if finished is not None and finished.is_set():
+                        del self._items[ old ]
+            if event is not None:
+                event.set()
+
+    def stop( self ):
+        self._queue.put( None )
+        self._worker.join()
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""Probe cache - persistent ffprobe results
+"""
+import os
+import json
+import time
+import atexit
+from threading import Lock
+
+from . import fsutil
+
+cache_dir  = os.path.expanduser( '~/.v4l2tricks' )
+cache_file = os.path.join( cache_dir, 'probe.json' )
+
+# Fields kept for each media file
+fields = ( 'width', 'height', 'pix_fmt', 'frame_rate', 'duration', 'codec', 'num_frames' )
+
+
+class ProbeCache( object ):
+    '''
+    ProbeCache
+
+    On-disk store of probed stream information, keyed by
+    (path, size, mtime).  A file that changes on disk no longer matches
+    its entry and is probed again.
+
+    Writes are batched: put() only flushes when <flush_interval> seconds
+    have passed since the last save, the rest is flushed at exit.
+    '''
+    def __init__( self, path = cache_file, flush_interval = 2.0 ):
+        super( ProbeCache, self ).__init__()
+        self._path           = path
+        self._flush_interval = flush_interval
+        self._lock           = Lock()
+        self._entries        = None
+        self._dirty          = False
+        self._saved          = 0.0
+        self.hits            = 0
+        self.misses          = 0
+        atexit.register( self.flush )
+
+    @property
+    def path( self ):
+        return self._path
+
+    def _load( self ):
+        if self._entries is not None:
+            return
+        self._entries = {}
+        try:
+            with open( self._path, 'r' ) as f:
+                self._entries = json.load( f )
+        except ( OSError, ValueError ) as e:
+            pass
+
+    def get( self, fname ):
+        '''
+        Cached info for <fname>, or None if missing or stale
+        '''
+        try:
+            path, size, mtime = fsutil.stat_key( fname )
+        except OSError as e:
+            return None
+
+        with self._lock:
+            self._load()
+            entry = self._entries.get( path )
+            if entry is None or entry[ 'size' ] != size or entry[ 'mtime' ] != mtime:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return dict( entry[ 'info' ] )
+
+    def put( self, fname, info ):
+        path, size, mtime = fsutil.stat_key( fname )
+        entry = { 'size'  : size,
+                  'mtime' : mtime,
+                  'info'  : { k : info.get( k ) for k in fields } }
+        with self._lock:
+            self._load()
+            self._entries[ path ] = entry
+            self._dirty = True
+            flush = time.time() - self._saved >= self._flush_interval
+        if flush:
+            self.flush()
+
+    def invalidate( self, fname ):
+        path = os.path.realpath( fname )
+        with self._lock:
+            self._load()
+            if self._entries.pop( path, None ) is not None:
+                self._dirty = True
+
+    def clear( self ):
+        with self._lock:
+            self._entries = {}
+            self._dirty   = True
+        self.flush()
+
+    def flush( self ):
+        '''
+        Write the cache out if anything changed (atomic replace)
+        '''
+        with self._lock:
+            if not self._dirty:
+                return
+            data        = json.dumps( self._entries )
+            self._dirty = False
+            self._saved = time.time()
+
+        tmp = '{}.{}.tmp'.format( self._path, os.getpid() )
+        try:
+            dirname = os.path.dirname( self._path )
+            if dirname and not os.path.isdir( dirname ):
+                fsutil.mkdir_p( dirname )
+            with open( tmp, 'w' ) as f:
+                f.write( data )
+            os.replace( tmp, self._path )
+        except OSError as e:
+            print( 'Could not save probe cache {}: {}'.format( self._path, e ) )
+
+    def __len__( self ):
+        with self._lock:
+            self._load()
+            return len( self._entries )
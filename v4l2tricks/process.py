@@ -2,7 +2,91 @@
 """Subprocess - tools
 """
 from subprocess import Popen, PIPE,STDOUT,DEVNULL
+import os
 import shlex
+import ctypes
+import platform
+
+# ioprio_set(2) has no Python binding: syscall numbers per architecture
+ioprio_syscalls    = { 'x86_64' : 251, 'aarch64' : 30, 'i386' : 289, 'i686' : 289, 'armv7l' : 314 }
+ioprio_class_shift = 13
+ioprio_who_process = 1
+
+# ionice classes
+IOPRIO_CLASS_RT   = 1
+IOPRIO_CLASS_BE   = 2
+IOPRIO_CLASS_IDLE = 3
+
+# Looked up once, here: set_ionice runs between fork and exec (see
+# Limits.preexec) where loading a library could deadlock on a lock held
+# by another thread of the parent
+_ioprio_nr = ioprio_syscalls.get( platform.machine() )
+try:
+    _syscall = ctypes.CDLL( None, use_errno = True ).syscall
+except ( OSError, AttributeError ) as e:
+    _syscall = None
+
+def set_ionice( klass, level = 0, pid = 0 ):
+    '''
+    I/O scheduling class and level (0 highest - 7) of <pid> (0: this
+    process), False where the kernel call is not available
+    '''
+    if _ioprio_nr is None or _syscall is None:
+        return False
+    return _syscall( _ioprio_nr, ioprio_who_process, pid, ( klass << ioprio_class_shift ) | level ) == 0
+
+
+class Limits( object ):
+    '''
+    Limits
+
+    Scheduling of one child process: the <cpus> it may run on, its
+    <nice> value and <ionice> ( class, level ), all set between fork and
+    exec (preexec) so every thread it starts inherits them, and the
+    <threads> ffmpeg may use for decoding and filtering (args()).  None
+    leaves a setting alone.
+    '''
+    def __init__( self, cpus = None, nice = None, ionice = None, threads = None ):
+        super( Limits, self ).__init__()
+        self.cpus    = sorted( cpus ) if cpus is not None else None
+        self.nice    = nice
+        self.ionice  = ionice
+        self.threads = threads
+
+    def preexec( self ):
+        # Runs in the child, an exception here would fail the spawn
+        if self.cpus:
+            try:
+                os.sched_setaffinity( 0, self.cpus )
+            except ( OSError, AttributeError ) as e:
+                pass
+        if self.nice is not None:
+            try:
+                os.setpriority( os.PRIO_PROCESS, 0, self.nice )
+            except OSError as e:
+                pass
+        if self.ionice is not None:
+            set_ionice( *self.ionice )
+
+    def args( self, args ):
+        '''
+        ffmpeg command line <args> with the thread limits: -threads for
+        every input's decoder, the filter thread counts as globals
+        '''
+        if not self.threads:
+            return list( args )
+        threads = str( self.threads )
+        limited = [ args[ 0 ], '-filter_threads', threads, '-filter_complex_threads', threads ]
+        for arg in args[ 1: ]:
+            if arg == '-i':
+                limited += [ '-threads', threads ]
+            limited.append( arg )
+        return limited
+
+    def __str__( self ):
+        return 'cpus={} nice={} ionice={} threads={}'.format(
+            ','.join( str( c ) for c in self.cpus ) if self.cpus else 'any', self.nice, self.ionice, self.threads )
+
 
 class Subprocess( object ):
     '''
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""Progress - ffmpeg -progress telemetry
+"""
+import time
+from collections import deque
+from threading import Lock, Condition
+
+# Below this speed (x realtime) over the window a stream is falling behind
+realtime_threshold = 0.97
+
+
+def _number( value, cast = float ):
+    '''
+    '1.02x' -> 1.02, '2500.3kbits/s' -> 2500.3, 'N/A' -> None
+    '''
+    value = value.strip().rstrip( 'x' )
+    if value.endswith( 'kbits/s' ):
+        value = value[ :-len( 'kbits/s' ) ]
+    try:
+        return cast( value )
+    except ValueError as e:
+        return None
+
+
+class StreamMetrics( object ):
+    '''
+    StreamMetrics
+
+    Live view of an ffmpeg process fed from its -progress output, one
+    key=value per line, each block ended by progress=continue|end:
+
+    frame, fps, bitrate (kbit/s), out_time (s), dup_frames,
+    drop_frames, speed (x realtime)
+
+    snapshot() returns the latest block, poll() waits for the next one,
+    subscribe() registers a callback for every block.  window() gives
+    rates over the last <window> seconds.
+    '''
+    def __init__( self, window = 5.0 ):
+        super( StreamMetrics, self ).__init__()
+        self._window      = window
+        self._lock        = Lock()
+        self._cond        = Condition( self._lock )
+        self._block       = {}
+        self._latest      = {}
+        self._samples     = deque()
+        self._subscribers = []
+        self.updates      = 0
+        self.ended        = False
+
+    def feed( self, line ):
+        key, sep, value = line.partition( '=' )
+        if not sep:
+            return
+        key = key.strip()
+        self._block[ key ] = value.strip()
+        if key == 'progress':
+            # Values persist, a partial block only updates what it carries
+            self._commit( self._block )
+
+    def _commit( self, block ):
+        now = time.time()
+        out_time = _number( block.get( 'out_time_us', 'N/A' ), int )
+        snapshot = {
+            'time'        : now,
+            'frame'       : _number( block.get( 'frame', 'N/A' ), int ),
+            'fps'         : _number( block.get( 'fps', 'N/A' ) ),
+            'bitrate'     : _number( block.get( 'bitrate', 'N/A' ) ),
+            'out_time'    : out_time / 1e6 if out_time is not None else None,
+            'dup_frames'  : _number( block.get( 'dup_frames', 'N/A' ), int ),
+            'drop_frames' : _number( block.get( 'drop_frames', 'N/A' ), int ),
+            'speed'       : _number( block.get( 'speed', 'N/A' ) ),
+            'progress'    : block.get( 'progress' ),
+        }
+        with self._cond:
+            self._latest = snapshot
+            self._samples.append( snapshot )
+            while self._samples and now - self._samples[0][ 'time' ] > self._window:
+                self._samples.popleft()
+            self.updates += 1
+            if snapshot[ 'progress' ] == 'end':
+                self.ended = True
+            subscribers = list( self._subscribers )
+            self._cond.notify_all()
+
+        for callback in subscribers:
+            try:
+                callback( snapshot )
+            except Exception as e:
+                print( 'Metrics subscriber failed: {}'.format( e ) )
+
+    def finish( self ):
+        '''
+        The progress pipe closed (process exited)
+        '''
+        with self._cond:
+            self.ended = True
+            self._cond.notify_all()
+
+    def snapshot( self ):
+        with self._lock:
+            return dict( self._latest )
+
+    def poll( self, timeout = None ):
+        '''
+        Wait for the next update, None on timeout or once ended
+        '''
+        with self._cond:
+            seen = self.updates
+            self._cond.wait_for( lambda : self.updates != seen or self.ended, timeout )
+            if self.updates == seen:
+                return None
+            return dict( self._latest )
+
+    def subscribe( self, callback ):
+        with self._lock:
+            self._subscribers.append( callback )
+
+    def unsubscribe( self, callback ):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove( callback )
+
+    def window( self ):
+        '''
+        Aggregates over the rolling window: fps, speed, dropped and
+        duplicated frames, measured between the oldest and newest block
+        '''
+        with self._lock:
+            samples = list( self._samples )
+        result = { 'fps' : None, 'speed' : None, 'drop_frames' : 0, 'dup_frames' : 0, 'seconds' : 0.0 }
+        if len( samples ) < 2:
+            return result
+        first, last = samples[0], samples[-1]
+        elapsed = last[ 'time' ] - first[ 'time' ]
+        if elapsed <= 0:
+            return result
+        delta = lambda key : ( last[ key ] - first[ key ] ) if last[ key ] is not None and first[ key ] is not None else None
+        frames   = delta( 'frame' )
+        out_time = delta( 'out_time' )
+        result[ 'seconds' ]     = elapsed
+        result[ 'fps' ]         = frames / elapsed if frames is not None else None
+        result[ 'speed' ]       = out_time / elapsed if out_time is not None else None
+        result[ 'drop_frames' ] = delta( 'drop_frames' ) or 0
+        result[ 'dup_frames' ]  = delta( 'dup_frames' ) or 0
+        return result
+
+    @property
+    def behind_realtime( self ):
+        speed = self.window()[ 'speed' ]
+        return speed is not None and speed < realtime_threshold
+
+    def summary( self ):
+        '''
+        One line status, e.g. for the console
+        '''
+        latest = self.snapshot()
+        if not latest:
+            return 'waiting for progress'
+        window = self.window()
+        fmt    = lambda v, spec, unit = '' : format( v, spec ) + unit if v is not None else 'N/A'
+        return 'frame={} fps={} speed={} drop={} dup={} bitrate={}{}'.format(
+            fmt( latest[ 'frame' ], 'd' ),
+            fmt( window[ 'fps' ] if window[ 'fps' ] is not None else latest[ 'fps' ], '.1f' ),
+            fmt( window[ 'speed' ] if window[ 'speed' ] is not None else latest[ 'speed' ], '.2f', 'x' ),
+            fmt( latest[ 'drop_frames' ], 'd' ),
+            fmt( latest[ 'dup_frames' ], 'd' ),
+            fmt( latest[ 'bitrate' ], '.1f', 'kbit/s' ),
+            ' (behind realtime)' if self.behind_realtime else '' )
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""Proxy - cheap to decode copies of the library at device resolution
+"""
+import os
+import re
+import time
+import subprocess
+from threading import Thread, Event, Lock
+
+try:
+    from queue import Queue
+except ImportError as e:
+    # Python 2.x
+    from Queue import Queue
+
+import ffmpeg
+
+from .ffmpeg_if  import probe_info
+from .mediacache import MediaCache
+from .planner    import plan, _aligned
+
+# Not under probecache.cache_dir: the preview cache there clears every
+# directory it holds
+proxy_dir    = os.path.join( os.environ.get( 'XDG_CACHE_HOME' ) or os.path.expanduser( '~/.cache' ),
+                             'v4l2tricks', 'proxies' )
+proxy_budget = 8 * 1024 * 1024 * 1024
+
+# One file per size a proxy was made for, e.g. proxy_1920x1080.mp4
+proxy_name    = 'proxy_{}x{}.mp4'
+proxy_name_re = re.compile( r'^proxy_(\d+)x(\d+)\.mp4$' )
+
+# Device resolution the proxies are made for (fit within, never upscaled)
+proxy_width  = 1280
+proxy_height = 720
+
+# Sources decoded at full cost even at device size
+costly_codecs = ( 'hevc', 'vp9', 'av1' )
+
+# x264 for decode speed: baseline (no B-frames, no CABAC), fastdecode
+# (no deblocking, no weighted prediction) and a short GOP so seeks and
+# loops restart quickly.  Audio, subtitles and data are not streamed.
+proxy_codec_args = { 'c:v'      : 'libx264',
+                     'preset'   : 'veryfast',
+                     'tune'     : 'fastdecode',
+                     'profile:v': 'baseline',
+                     'g'        : 15,
+                     'crf'      : 20,
+                     'movflags' : '+faststart' }
+
+# Offline, the scaler can take its time
+proxy_scale_flags = 'bicubic'
+
+# Transcodes run below the streams
+proxy_nice = 10
+
+
+def fit( info, width = proxy_width, height = proxy_height ):
+    '''
+    Size of the source described by <info> fitted within <width>x<height>,
+    aspect ratio kept, never upscaled, even for yuv420p
+    '''
+    src_w, src_h = info[ 'width' ], info[ 'height' ]
+    scale = min( 1.0, width / float( src_w ), height / float( src_h ) )
+    return _aligned( int( round( src_w * scale ) ), int( round( src_h * scale ) ), 'yuv420p' )
+
+def needs_proxy( info, width = proxy_width, height = proxy_height ):
+    '''
+    A source larger than the device or in a codec costly to decode
+    '''
+    if info is None:
+        return False
+    return ( info[ 'width' ] > width or info[ 'height' ] > height or
+             info.get( 'codec' ) in costly_codecs )
+
+def transcode_args( src, dst, info, width = proxy_width, height = proxy_height ):
+    '''
+    ffmpeg command line making the proxy of <src> at <dst>
+    '''
+    w, h = fit( info, width, height )
+    p    = plan( info, w, h, pix_fmt = 'yuv420p', flags = proxy_scale_flags )
+    stream = p.apply( ffmpeg.input( src )[ 'v:0' ] )
+    return stream.output( dst, f='mp4', **dict( p.output_args, **proxy_codec_args ) ).compile( overwrite_output = True )
+
+
+class ProxyCache( MediaCache ):
+    '''
+    ProxyCache
+
+    MediaCache of proxies: one mp4 per media, fitted within
+    <width>x<height>, made on a background thread (request()) by an
+    ffmpeg at <nice>.  resolve( media, width, height ) is the smallest
+    proxy made for at least that size, whichever cache made it, the
+    media when there is none; a proxy is written under a temporary name
+    and renamed when done, so a half made one is never streamed.
+    '''
+    def __init__( self, width = proxy_width, height = proxy_height, root = proxy_dir, budget = proxy_budget,
+                  nice = proxy_nice, verbose = False ):
+        super( ProxyCache, self ).__init__( root, budget )
+        self.width    = width
+        self.height   = height
+        self.nice     = nice
+        self.name     = proxy_name.format( width, height )
+        self._verbose = verbose
+        self._queue   = Queue()
+        self._items   = {} # media -> Event, set once handled
+        self._items_lock = Lock()
+        self._proc    = None
+        self._worker  = None
+        self._stopped = False
+        self.made     = 0
+        self.failed   = 0
+        self.skipped  = 0
+        self.seconds  = 0.0
+
+    def proxy( self, media ):
+        '''
+        Path of the proxy of <media>, None if there is none
+        '''
+        try:
+            return self.lookup( media, self.name )
+        except OSError as e:
+            return None
+
+    def proxies( self, media ):
+        '''
+        { ( width, height ) : file name } of every proxy of <media>, by
+        the size it was made for
+        '''
+        try:
+            path = os.path.join( self.root, self.key( media ) )
+            with os.scandir( path ) as it:
+                names = [ node.name for node in it ]
+        except OSError as e:
+            return {}
+        found = {}
+        for name in names:
+            match = proxy_name_re.match( name )
+            if match is not None:
+                found[ ( int( match.group( 1 ) ), int( match.group( 2 ) ) ) ] = name
+        return found
+
+    def resolve( self, media, width = None, height = None ):
+        '''
+        Smallest proxy of <media> made for at least <width>x<height>
+        (None: this cache's size), <media> itself when there is none
+        '''
+        width  = self.width  if width  is None else width
+        height = self.height if height is None else height
+        found  = self.proxies( media )
+        sizes  = sorted( ( w * h, ( w, h ) ) for w, h in found if w >= width and h >= height )
+        for area, size in sizes:
+            try:
+                path = self.lookup( media, found[ size ] )
+            except OSError as e:
+                path = None
+            if path is not None:
+                return path
+        return media
+
+    def request( self, media ):
+        '''
+        Queue <media> for a proxy, made in the background when it needs
+        one (see needs_proxy) and has none yet
+        '''
+        if media is None or self._stopped:
+            return
+        with self._items_lock:
+            event = self._items.get( media )
+            if event is not None and not event.is_set():
+                return # Already on its way
+            self._items[ media ] = Event()
+            if self._worker is None:
+                self._worker = Thread( target = self.run, name = 'ProxyCache' )
+                self._worker.daemon = True
+                self._worker.start()
+        self._queue.put( media )
+
+    def ready( self, media, timeout = None ):
+        with self._items_lock:
+            event = self._items.get( media )
+        return event is not None and event.wait( timeout )
+
+    def run( self ):
+        while True:
+            media = self._queue.get()
+            if media is None:
+                break
+            try:
+                self.make( media )
+            except Exception as e:
+                self.failed += 1
+                print( 'Could not make a proxy of {}: {}'.format( media, e ) )
+            with self._items_lock:
+                event = self._items.get( media )
+            if event is not None:
+                event.set()
+
+    def make( self, media ):
+        '''
+        Transcode the proxy of <media> now, returns its path (None when
+        not needed)
+        '''
+        if self.proxy( media ) is not None:
+            return self.proxy( media )
+        info = probe_info( media )
+        if not needs_proxy( info, self.width, self.height ):
+            self.skipped += 1
+            if self._verbose: print( 'No proxy needed for {}'.format( media ) )
+            return None
+
+        dst = os.path.join( self.entry( media ), self.name )
+        tmp = '{}.{}.tmp'.format( dst, os.getpid() )
+        t0  = time.time()
+        args = transcode_args( media, tmp, info, self.width, self.height )
+        nice = self.nice
+        self._proc = subprocess.Popen( args,
+                                       stdin      = subprocess.DEVNULL,
+                                       stdout     = subprocess.DEVNULL,
+                                       stderr     = subprocess.PIPE,
+                                       preexec_fn = ( lambda : os.nice( nice ) ) if nice else None )
+        err = self._proc.communicate()[ 1 ]
+        code, self._proc = self._proc.returncode, None
+        if code != 0:
+            try:
+                os.remove( tmp )
+            except OSError as e:
+                pass
+            raise RuntimeError( 'ffmpeg exited with {}: {}'.format( code, err.decode( 'utf-8', 'replace' ).strip()[ -200: ] ) )
+        os.replace( tmp, dst )
+        self.commit( media )
+
+        elapsed = time.time() - t0
+        self.made    += 1
+        self.seconds += elapsed
+        if self._verbose: print( 'Proxy of {} made in {:.1f}s'.format( media, elapsed ) )
+        return dst
+
+    def stop( self ):
+        '''
+        Drop the queue and kill the transcode in progress
+        '''
+        self._stopped = True
+        proc = self._proc
+        if proc is not None:
+            proc.kill()
+        if self._worker is not None:
+            while not self._queue.empty():
+                self._queue.get()
+            self._queue.put( None )
+            self._worker.join()
+
+
+_cache = None
+
+def proxy_cache():
+    '''
+    The proxy cache shared by stream_media and the GUI (made on first use)
+    '''
+    global _cache
+    if _cache is None:
+        _cache = ProxyCache()
+    return _cache
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""Reactor - one selector thread serving the pipes of every process
+"""
+import os
+import selectors
+from threading import Thread, Lock, Event, current_thread
+
+readsize = 64 * 1024
+
+
+class Channel( object ):
+    '''
+    Channel
+
+    A registered pipe: reads are as large as what is available (up to
+    readsize), in line mode the data is split into lines (on \\n or \\r,
+    ffmpeg uses both) and <callback> gets each line as str, otherwise it
+    gets the raw bytes.  A None <callback> discards the data.
+    '''
+    def __init__( self, fd, callback, lines, on_close ):
+        super( Channel, self ).__init__()
+        self.fd       = fd
+        self.callback = callback
+        self.lines    = lines
+        self.on_close = on_close
+        self._partial = b''
+
+    def feed( self, data ):
+        if self.callback is None:
+            return
+        if not self.lines:
+            self.callback( data )
+            return
+        data = self._partial + data.replace( b'\r', b'\n' )
+        *complete, self._partial = data.split( b'\n' )
+        for line in complete:
+            if line:
+                self.callback( line.decode( 'utf-8', errors = 'replace' ) )
+
+    def flush( self ):
+        if self.callback is not None and self.lines and self._partial:
+            self.callback( self._partial.decode( 'utf-8', errors = 'replace' ) )
+        self._partial = b''
+
+
+class Reactor( object ):
+    '''
+    Reactor
+
+    Event loop (selectors, i.e. epoll on Linux) on a single daemon
+    thread.  register()/unregister() may be called from any thread, the
+    changes are handed to the loop through a wake-up pipe.
+    '''
+    def __init__( self ):
+        super( Reactor, self ).__init__()
+        self._selector         = selectors.DefaultSelector()
+        self._lock             = Lock()
+        self._pending          = []
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking( self._wake_r, False )
+        os.set_blocking( self._wake_w, False )
+        self._selector.register( self._wake_r, selectors.EVENT_READ, None )
+        self._thread = Thread( target = self.run, name = 'Reactor' )
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _wake( self ):
+        try:
+            os.write( self._wake_w, b'x' )
+        except BlockingIOError as e:
+            pass # Already awake
+
+    def _submit( self, op ):
+        '''
+        Run <op> on the loop thread and wait for it, an exception raised
+        by <op> is raised again here
+        '''
+        if current_thread() is self._thread:
+            op()
+            return
+        if not self._thread.is_alive():
+            raise RuntimeError( 'Reactor thread is not running' )
+        done   = Event()
+        errors = []
+        def wrapped():
+            try:
+                op()
+            except Exception as e:
+                errors.append( e )
+            finally:
+                done.set()
+        with self._lock:
+            self._pending.append( wrapped )
+        self._wake()
+        while not done.wait( 0.5 ):
+            if not self._thread.is_alive():
+                raise RuntimeError( 'Reactor thread is not running' )
+        if errors:
+            raise errors[ 0 ]
+
+    def register( self, fileobj, callback, lines = True, on_close = None ):
+        '''
+        Watch <fileobj> (anything with fileno()), see Channel
+        '''
+        fd      = fileobj if isinstance( fileobj, int ) else fileobj.fileno()
+        channel = Channel( fd, callback, lines, on_close )
+        self._submit( lambda : self._selector.register( fd, selectors.EVENT_READ, channel ) )
+        return channel
+
+    def unregister( self, channel ):
+        '''
+        Stop watching the pipe of <channel> (as returned by register()),
+        once this returns the loop no longer touches it and it can be
+        closed
+        '''
+        def op():
+            try:
+                key = self._selector.get_key( channel.fd )
+            except ( KeyError, ValueError ) as e:
+                return # Already closed on EOF
+            if key.data is channel:
+                self._selector.unregister( channel.fd )
+        self._submit( op )
+
+    def _close( self, channel ):
+        self._selector.unregister( channel.fd )
+        try:
+            channel.flush()
+        except Exception as e:
+            print( 'Reactor callback failed: {}'.format( e ) )
+        if channel.on_close is not None:
+            try:
+                channel.on_close()
+            except Exception as e:
+                print( 'Reactor on_close failed: {}'.format( e ) )
+
+    def _apply_pending( self ):
+        try:
+            while os.read( self._wake_r, 4096 ):
+                pass
+        except BlockingIOError as e:
+            pass
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for op in pending:
+            op()
+
+    def run( self ):
+        while True:
+            woken = False
+            for key, events in self._selector.select():
+                channel = key.data
+                if channel is None:
+                    woken = True
+                    continue
+
+                try:
+                    data = os.read( channel.fd, readsize )
+                except OSError as e:
+                    data = b''
+                if data:
+                    try:
+                        channel.feed( data )
+                    except Exception as e:
+                        print( 'Reactor callback failed: {}'.format( e ) )
+                else:
+                    self._close( channel )
+
+            # Registration changes last, so nothing in this batch of
+            # events refers to a pipe that was unregistered (and closed)
+            if woken:
+                self._apply_pending()
+
+
+_reactor      = None
+_reactor_lock = Lock()
+
+def reactor():
+    '''
+    The process wide Reactor, started on first use
+    '''
+    global _reactor
+    with _reactor_lock:
+        if _reactor is None:
+            _reactor = Reactor()
+    return _reactor
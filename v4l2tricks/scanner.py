@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""Scanner - incremental media library scans
+"""
+import os
+import json
+import hashlib
+from collections import namedtuple
+
+from . import fsutil
+from .probecache import cache_dir
+
+snapshot_dir = os.path.join( cache_dir, 'scans' )
+
+ScanDiff = namedtuple( 'ScanDiff', [ 'added', 'removed', 'modified' ] )
+
+
+class IncrementalScanner( object ):
+    '''
+    IncrementalScanner
+
+    Scans <root> for files with one of the <patterns> extensions and
+    persists a snapshot: every directory's mtime and listing, every
+    matching file's (size, mtime).  On a rescan a directory whose mtime
+    did not change is not listed again, its previous listing is reused,
+    so only changed directories are read.  scan() returns what was
+    added, removed and modified since the previous scan.
+
+    A directory's mtime only changes when entries are added, removed or
+    renamed in it.  Files rewritten in place are caught in changed
+    directories; set <deep> to also stat the files of unchanged ones.
+    '''
+    def __init__( self, root, patterns, excludes = ( '.git', '.svn' ), deep = False, store = None ):
+        super( IncrementalScanner, self ).__init__()
+        self.root     = os.path.abspath( root )
+        self.patterns = frozenset( p.lower() for p in patterns )
+        self.excludes = frozenset( excludes )
+        self.deep     = deep
+        if store is None:
+            ident = '{}\0{}'.format( self.root, ','.join( sorted( self.patterns ) ) )
+            name  = hashlib.sha1( ident.encode( 'utf-8', 'surrogateescape' ) ).hexdigest()[ :24 ]
+            store = os.path.join( snapshot_dir, name + '.json' )
+        self.store     = store
+        self._snapshot = None
+        self.listed    = 0 # Directories actually listed by the last scan
+
+    def _load( self ):
+        if self._snapshot is not None:
+            return self._snapshot
+        self._snapshot = { 'dirs' : {}, 'files' : {} }
+        try:
+            with open( self.store, 'r' ) as f:
+                self._snapshot = json.load( f )
+        except ( OSError, ValueError ) as e:
+            pass
+        return self._snapshot
+
+    def save( self ):
+        tmp = '{}.{}.tmp'.format( self.store, os.getpid() )
+        try:
+            dirname = os.path.dirname( self.store )
+            if dirname and not os.path.isdir( dirname ):
+                fsutil.mkdir_p( dirname )
+            with open( tmp, 'w' ) as f:
+                json.dump( self._snapshot, f )
+            os.replace( tmp, self.store )
+        except OSError as e:
+            print( 'Could not save scan snapshot {}: {}'.format( self.store, e ) )
+
+    @property
+    def files( self ):
+        '''
+        Matching files as of the last scan
+        '''
+        return set( self._load()[ 'files' ].keys() )
+
+    def _list( self, path ):
+        subdirs = []
+        files   = []
+        with os.scandir( path ) as it:
+            for node in it:
+                if node.name.startswith( '.' ):
+                    continue
+                if node.is_dir( follow_symlinks = False ):
+                    if node.name not in self.excludes:
+                        subdirs.append( node.name )
+                elif os.path.splitext( node.name )[1].lower() in self.patterns:
+                    files.append( node.name )
+        return subdirs, files
+
+    def scan( self, callback = None ):
+        '''
+        Walk <root> and persist the new snapshot, <callback>( path ) is
+        called for every matching file as it is found
+        '''
+        old_dirs  = self._load()[ 'dirs' ]
+        old_files = self._snapshot[ 'files' ]
+        dirs      = {}
+        files     = {}
+        self.listed = 0
+
+        stack = [ self.root ]
+        while stack:
+            path = stack.pop()
+            try:
+                mtime = os.stat( path ).st_mtime_ns
+            except OSError as e:
+                continue
+
+            prev = old_dirs.get( path )
+            if prev is not None and prev[ 'mtime' ] == mtime:
+                subdirs, names, changed = prev[ 'dirs' ], prev[ 'files' ], False
+            else:
+                try:
+                    subdirs, names = self._list( path )
+                except OSError as e:
+                    continue
+                changed = True
+                self.listed += 1
+            dirs[ path ] = { 'mtime' : mtime, 'dirs' : subdirs, 'files' : names }
+
+            for name in names:
+                fpath = os.path.join( path, name )
+                known = old_files.get( fpath )
+                if known is not None and not changed and not self.deep:
+                    files[ fpath ] = known
+                else:
+                    try:
+                        st = os.stat( fpath )
+                    except OSError as e:
+                        continue
+                    files[ fpath ] = [ st.st_size, st.st_mtime_ns ]
+                if callback is not None:
+                    callback( fpath )
+
+            stack.extend( os.path.join( path, d ) for d in subdirs )
+
+        added    = sorted( set( files ) - set( old_files ) )
+        removed  = sorted( set( old_files ) - set( files ) )
+        modified = sorted( f for f in files if f in old_files and list( old_files[ f ] ) != files[ f ] )
+
+        self._snapshot = { 'dirs' : dirs, 'files' : files }
+        self.save()
+        return ScanDiff( added, removed, modified )
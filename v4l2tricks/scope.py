@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""Scope - live desktop region to a v4l2 device
+"""
+import time
+from threading import Thread, Lock
+
+try:
+    import numpy as np
+except ImportError as e:
+    np = None
+
+from .ffmpeg_if import FrameTap
+from .sink      import open_writer
+from .pixfmt    import bytes_per_pixel, planar
+
+# Byte offsets of luma and chroma in a 4:2:2 packed macropixel
+packed_422 = { 'yuyv422' : ( 0, 1 ), 'uyvy422' : ( 1, 0 ) }
+
+
+class RegionScaler( object ):
+    '''
+    RegionScaler
+
+    Crop a region of a packed ( height, width * bpp ) source frame and
+    resample it (nearest neighbour) into a fixed output frame.  The
+    region is turned into row and byte column indices once, each frame
+    is then two np.take() into preallocated buffers.  set_region() can be
+    called from any thread, it applies from the next frame on.
+    '''
+    def __init__( self, src_w, src_h, out_w, out_h, pix_fmt = 'yuyv422', mirror = False ):
+        super( RegionScaler, self ).__init__()
+        if np is None:
+            raise ImportError( 'RegionScaler requires numpy' )
+        if pix_fmt in planar:
+            raise ValueError( 'Planar format {} is not supported, use a packed one'.format( pix_fmt ) )
+        num, den = bytes_per_pixel[ pix_fmt ]
+        self.src_w   = src_w
+        self.src_h   = src_h
+        self.out_w   = out_w
+        self.out_h   = out_h
+        self.pix_fmt = pix_fmt
+        self.mirror  = mirror
+        self.bpp     = num // den
+        self.region  = None
+        self._rows_buf = np.empty( ( out_h, src_w * self.bpp ), dtype = np.uint8 )
+        self._out      = np.empty( ( out_h, out_w * self.bpp ), dtype = np.uint8 )
+        self._index    = None
+        self.set_region( 0, 0, src_w, src_h )
+
+    def set_region( self, x, y, w, h ):
+        # Clamp to the source, 4:2:2 needs even offsets to keep U/V in place
+        w = max( 1, min( int( w ), self.src_w ) )
+        h = max( 1, min( int( h ), self.src_h ) )
+        x = max( 0, min( int( x ), self.src_w - w ) )
+        y = max( 0, min( int( y ), self.src_h - h ) )
+        if self.pix_fmt in packed_422:
+            x -= x % 2
+
+        rows  = y + ( np.arange( self.out_h ) * h ) // self.out_h
+        x_map = x + ( np.arange( self.out_w ) * w ) // self.out_w
+        if self.mirror:
+            x_map = x_map[ ::-1 ]
+
+        if self.pix_fmt in packed_422:
+            y_off, c_off = packed_422[ self.pix_fmt ]
+            out_x  = np.arange( self.out_w )
+            paired = x_map[ out_x - out_x % 2 ] # Chroma of each output pair from one source pair
+            cols   = np.empty( self.out_w * 2, dtype = np.intp )
+            cols[ y_off::2 ] = 2 * x_map + y_off
+            cols[ c_off::2 ] = 4 * ( paired // 2 ) + c_off + 2 * ( out_x % 2 )
+        else:
+            cols = ( x_map[ :, None ] * self.bpp + np.arange( self.bpp ) ).ravel()
+
+        self._index = ( rows.astype( np.intp ), cols.astype( np.intp ) )
+        self.region = ( x, y, w, h )
+
+    def apply( self, frame ):
+        '''
+        The region of <frame> at the output size, the returned array is
+        reused by the next call
+        '''
+        rows, cols = self._index
+        flat = frame.reshape( self.src_h, -1 )
+        np.take( flat, rows, axis = 0, out = self._rows_buf )
+        np.take( self._rows_buf, cols, axis = 1, out = self._out )
+        return self._out
+
+
+class LiveScope( object ):
+    '''
+    LiveScope
+
+    One x11grab of the whole <screen> ( x, y, w, h ) is kept running and
+    piped into NumPy (FrameTap); every frame the current region is cut
+    out, resampled to <out_w>x<out_h> and written to <device>.  Moving
+    the region takes effect on the next frame, nothing is restarted.
+    Size changes are debounced by <debounce> seconds so a resize drag
+    settles before the region follows.
+
+    Quacks like a StreamProcess for the StreamController: wait(), stop(),
+    alive and metrics (ffmpeg's progress of the capture).
+    '''
+    def __init__( self,
+                  x,
+                  y,
+                  w,
+                  h,
+                  screen,
+                  out_w    = None,
+                  out_h    = None,
+                  display  = ':0',
+                  device   = '/dev/video20',
+                  fps      = 30,
+                  pix_fmt  = 'yuyv422',
+                  mirror   = True,
+                  debounce = 0.15,
+                  verbose  = True ):
+        super( LiveScope, self ).__init__()
+        sx, sy, sw, sh = screen
+        self.screen   = screen
+        self.out_w    = out_w or w
+        self.out_h    = out_h or h
+        self.debounce = debounce
+        self._verbose = verbose
+        self._lock    = Lock()
+        self._pending = None # ( region, time requested )
+        self._running = True
+        self.frames   = 0
+        self.updates  = 0
+
+        self.scaler = RegionScaler( sw, sh, self.out_w, self.out_h, pix_fmt, mirror )
+        self.scaler.set_region( x - sx, y - sy, w, h )
+
+        # The device first: a grab with nowhere to go would be left running
+        self.writer = open_writer( device, self.out_w, self.out_h, pix_fmt )
+        try:
+            self.tap = FrameTap( '{0}.0+{1},{2}'.format( display, sx, sy ),
+                                 sw,
+                                 sh,
+                                 pix_fmt,
+                                 ring       = 2,
+                                 input_args = { 'f'          : 'x11grab',
+                                                'video_size' : '{0}x{1}'.format( sw, sh ),
+                                                'framerate'  : fps },
+                                 verbose    = verbose )
+        except Exception as e:
+            self.writer.close()
+            raise
+        self.metrics = self.tap.metrics
+        if verbose: print( 'Scope: {0} of {1} -> {2}x{3} on {4}'.format(
+            self.scaler.region, screen, self.out_w, self.out_h, device ) )
+
+        self._pump_t = Thread( target = self._pump, name = 'LiveScope' )
+        self._pump_t.daemon = True
+        self._pump_t.start()
+
+    def move( self, x, y ):
+        '''
+        Move the region (screen coordinates), from the next frame on
+        '''
+        sx, sy = self.screen[ :2 ]
+        with self._lock:
+            if self._pending is not None:
+                # A resize is settling, it lands at the new place
+                ( px, py, w, h ), t = self._pending
+                self._pending = ( ( x - sx, y - sy, w, h ), t )
+            x0, y0, w, h = self.scaler.region
+            self.scaler.set_region( x - sx, y - sy, w, h )
+            self.updates += 1
+
+    def resize( self, x, y, w, h ):
+        '''
+        New region (screen coordinates), applied once no other resize
+        came in for <debounce> seconds
+        '''
+        sx, sy = self.screen[ :2 ]
+        with self._lock:
+            self._pending = ( ( x - sx, y - sy, w, h ), time.time() )
+
+    def _settle( self ):
+        with self._lock:
+            if self._pending is None or time.time() - self._pending[1] < self.debounce:
+                return
+            region, self._pending = self._pending[0], None
+            self.scaler.set_region( *region )
+            self.updates += 1
+
+    def _pump( self ):
+        try:
+            for frame in self.tap:
+                if not self._running:
+                    break
+                if self._pending is not None:
+                    self._settle()
+                self.writer.write( self.scaler.apply( frame ) )
+                self.frames += 1
+        except ( OSError, ValueError ) as e:
+            # ValueError: stop() closed the tap under a read
+            if self._running:
+                print( 'Scope stopped: {}'.format( e ) )
+        finally:
+            self._running = False
+
+    @property
+    def alive( self ):
+        return self._pump_t.is_alive()
+
+    def wait( self, timeout = None ):
+        self._pump_t.join( timeout )
+
+    def lines( self ):
+        return self.tap.lines()
+
+    def stop( self ):
+        self._running = False
+        self.tap.stop()
+        self._pump_t.join()
+        self.writer.close()
@@ -0,0 +1,452 @@
+# -*- coding: utf-8 -*-
+"""Sinks - where frames go: a v4l2loopback device, a file or an emulator
+"""
+import os
+import sys
+import stat
+import json
+import time
+import mmap
+import fcntl
+import struct
+import shutil
+import tempfile
+import subprocess
+from threading import Thread, Lock
+
+from . import pixfmt
+from . import emulator
+
+#-------------------------------------------------
+# linux/videodev2.h (only what an output needs)
+#-------------------------------------------------
+_IOC_WRITE = 1
+_IOC_READ  = 2
+
+def _IOC( direction, kind, nr, size ):
+    return ( direction << 30 ) | ( size << 16 ) | ( ord( kind ) << 8 ) | nr
+
+_IOW  = lambda kind, nr, size : _IOC( _IOC_WRITE, kind, nr, size )
+_IOWR = lambda kind, nr, size : _IOC( _IOC_READ | _IOC_WRITE, kind, nr, size )
+
+BUF_TYPE_VIDEO_OUTPUT = 2
+FIELD_NONE            = 1
+MEMORY_MMAP           = 1
+
+# struct v4l2_format: type + (8 byte aligned) 200 byte union, here holding
+# struct v4l2_pix_format (12 x __u32) padded out to the union size
+format_fmt          = '@I0L12I152s'
+# struct v4l2_requestbuffers
+requestbuffers_fmt  = '@4IB3s'
+# struct v4l2_buffer: index, type, bytesused, flags, field, timeval,
+# timecode, sequence, memory, m (union), length, reserved2, request_fd
+buffer_fmt          = '@5I2l2I4B4s2IL2Ii0L'
+buffer_m_offset     = 16
+buffer_length       = 17
+
+VIDIOC_G_FMT    = _IOWR( 'V',  4, struct.calcsize( format_fmt ) )
+VIDIOC_S_FMT    = _IOWR( 'V',  5, struct.calcsize( format_fmt ) )
+VIDIOC_REQBUFS  = _IOWR( 'V',  8, struct.calcsize( requestbuffers_fmt ) )
+VIDIOC_QUERYBUF = _IOWR( 'V',  9, struct.calcsize( buffer_fmt ) )
+VIDIOC_QBUF     = _IOWR( 'V', 15, struct.calcsize( buffer_fmt ) )
+VIDIOC_DQBUF    = _IOWR( 'V', 17, struct.calcsize( buffer_fmt ) )
+VIDIOC_STREAMON = _IOW(  'V', 18, struct.calcsize( 'i' ) )
+VIDIOC_STREAMOFF= _IOW(  'V', 19, struct.calcsize( 'i' ) )
+
+
+def pack_format( width, height, pix_fmt ):
+    return struct.pack( format_fmt,
+                        BUF_TYPE_VIDEO_OUTPUT,
+                        width,
+                        height,
+                        pixfmt.fourcc( pix_fmt ),
+                        FIELD_NONE,
+                        pixfmt.bytes_per_line( width, pix_fmt ),
+                        pixfmt.frame_size( width, height, pix_fmt ),
+                        0, 0, 0, 0, 0, 0,
+                        b'' )
+
+def pack_buffer( index, bytesused = 0, length = 0 ):
+    return struct.pack( buffer_fmt,
+                        index, BUF_TYPE_VIDEO_OUTPUT, bytesused, 0, FIELD_NONE,
+                        0, 0,             # timestamp
+                        0, 0, 0, 0, 0, 0, # timecode
+                        b'',
+                        0,                # sequence
+                        MEMORY_MMAP,
+                        0,                # m.offset
+                        length,
+                        0, 0 )
+
+def as_buffer( frame ):
+    '''
+    Flat byte view of <frame>: bytes, bytearray, memoryview or a NumPy
+    array (anything exporting the buffer protocol).  Only
+    non-contiguous arrays get copied.
+    '''
+    view = memoryview( frame )
+    if not view.c_contiguous:
+        view = memoryview( view.tobytes() )
+    if view.ndim != 1 or view.format != 'B':
+        view = view.cast( 'B' )
+    return view
+
+
+class FrameWriter( object ):
+    '''
+    FrameWriter
+
+    Base of the Python side frame writers: fixed width, height and
+    pix_fmt, every write() is exactly one frame.
+    '''
+    def __init__( self, width, height, pix_fmt = 'yuv420p' ):
+        super( FrameWriter, self ).__init__()
+        self.width      = width
+        self.height     = height
+        self.pix_fmt    = pix_fmt
+        self.frame_size = pixfmt.frame_size( width, height, pix_fmt )
+        self.frames     = 0
+        self.bytes      = 0
+        self.sink       = None # Closed with the writer (see open_writer)
+        self._fd        = None
+
+    def _check( self, frame ):
+        view = as_buffer( frame )
+        if len( view ) != self.frame_size:
+            raise ValueError( 'Frame is {} bytes, expected {} ({}x{} {})'.format(
+                len( view ), self.frame_size, self.width, self.height, self.pix_fmt ) )
+        return view
+
+    def _write_all( self, view ):
+        while len( view ):
+            n = os.write( self._fd, view )
+            view = view[ n: ]
+
+    def write( self, frame ):
+        view = self._check( frame )
+        self._write_all( view )
+        self.frames += 1
+        self.bytes  += len( view )
+
+    def fileno( self ):
+        return self._fd
+
+    @property
+    def closed( self ):
+        return self._fd is None
+
+    def close( self ):
+        if self._fd is not None:
+            os.close( self._fd )
+            self._fd = None
+        sink, self.sink = self.sink, None
+        if sink is not None:
+            sink.close()
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, *exc ):
+        self.close()
+
+
+class FileWriter( FrameWriter ):
+    '''
+    FileWriter
+
+    Test double for V4l2Writer: same interface, frames go to a regular
+    file or a FIFO (rawvideo), no kernel module needed.  Opening a FIFO
+    blocks until something opens it for reading.
+    '''
+    def __init__( self, path, width, height, pix_fmt = 'yuv420p' ):
+        super( FileWriter, self ).__init__( width, height, pix_fmt )
+        self.path = path
+        flags = os.O_WRONLY
+        if not os.path.exists( path ) or not stat.S_ISFIFO( os.stat( path ).st_mode ):
+            flags |= os.O_CREAT | os.O_TRUNC
+        self._fd = os.open( path, flags, 0o644 )
+
+
+class V4l2Writer( FrameWriter ):
+    '''
+    V4l2Writer
+
+    Writes frames straight to a v4l2loopback device, no ffmpeg process
+    in between.  The output format is negotiated with VIDIOC_S_FMT when
+    the device is opened.
+
+    By default frames are written with write(); with <use_mmap> the
+    driver's buffers are mapped (VIDIOC_REQBUFS/QUERYBUF) and frames are
+    copied into them and queued (VIDIOC_QBUF/DQBUF).
+    '''
+    def __init__( self, device, width, height, pix_fmt = 'yuv420p', use_mmap = False, buffers = 4 ):
+        super( V4l2Writer, self ).__init__( width, height, pix_fmt )
+        self.device     = device
+        self._maps      = []
+        self._free      = []
+        self._streaming = False
+        self._fd        = os.open( device, os.O_RDWR )
+        try:
+            self.set_format()
+            if use_mmap:
+                self._map_buffers( buffers )
+        except OSError as e:
+            self.close()
+            raise
+
+    def set_format( self ):
+        fmt = fcntl.ioctl( self._fd, VIDIOC_S_FMT, pack_format( self.width, self.height, self.pix_fmt ) )
+        fields = struct.unpack( format_fmt, fmt )
+        if ( fields[1], fields[2], fields[3] ) != ( self.width, self.height, pixfmt.fourcc( self.pix_fmt ) ):
+            raise OSError( 'Device {} refused {}x{} {}'.format( self.device, self.width, self.height, self.pix_fmt ) )
+
+    def _map_buffers( self, count ):
+        req = struct.pack( requestbuffers_fmt, count, BUF_TYPE_VIDEO_OUTPUT, MEMORY_MMAP, 0, 0, b'' )
+        req = fcntl.ioctl( self._fd, VIDIOC_REQBUFS, req )
+        count = struct.unpack( requestbuffers_fmt, req )[0]
+        for index in range( count ):
+            buf = fcntl.ioctl( self._fd, VIDIOC_QUERYBUF, pack_buffer( index ) )
+            fields = struct.unpack( buffer_fmt, buf )
+            self._maps.append( mmap.mmap( self._fd,
+                                          fields[ buffer_length ],
+                                          mmap.MAP_SHARED,
+                                          mmap.PROT_READ | mmap.PROT_WRITE,
+                                          offset = fields[ buffer_m_offset ] ) )
+        self._free = list( range( count - 1, -1, -1 ) )
+
+    def write( self, frame ):
+        if not self._maps:
+            return super( V4l2Writer, self ).write( frame )
+
+        view = self._check( frame )
+        if self._free:
+            index = self._free.pop()
+        else:
+            # All buffers queued, wait for the driver to hand one back
+            buf   = fcntl.ioctl( self._fd, VIDIOC_DQBUF, pack_buffer( 0 ) )
+            index = struct.unpack( buffer_fmt, buf )[0]
+
+        mapped = self._maps[ index ]
+        mapped[ :len( view ) ] = view
+        fcntl.ioctl( self._fd, VIDIOC_QBUF, pack_buffer( index, len( view ), len( mapped ) ) )
+        if not self._streaming:
+            fcntl.ioctl( self._fd, VIDIOC_STREAMON, struct.pack( 'i', BUF_TYPE_VIDEO_OUTPUT ) )
+            self._streaming = True
+        self.frames += 1
+        self.bytes  += len( view )
+
+    def close( self ):
+        if self._fd is None:
+            return
+        if self._streaming:
+            try:
+                fcntl.ioctl( self._fd, VIDIOC_STREAMOFF, struct.pack( 'i', BUF_TYPE_VIDEO_OUTPUT ) )
+            except OSError as e:
+                pass
+            self._streaming = False
+        for mapped in self._maps:
+            mapped.close()
+        self._maps = []
+        super( V4l2Writer, self ).close()
+
+
+def open_writer( target, width, height, pix_fmt = 'yuv420p', **kwargs ):
+    '''
+    V4l2Writer for a character device, FileWriter for anything else.
+    <target> can be a Sink, it is opened here and closed with the writer.
+    '''
+    sink = None
+    if isinstance( target, Sink ):
+        sink   = target
+        target = sink.open( width, height, pix_fmt )
+    if os.path.exists( target ) and stat.S_ISCHR( os.stat( target ).st_mode ):
+        writer = V4l2Writer( target, width, height, pix_fmt, **kwargs )
+    else:
+        writer = FileWriter( target, width, height, pix_fmt )
+    writer.sink = sink
+    return writer
+
+
+#-------------------------------------------------
+# Outputs of the ffmpeg streams
+#-------------------------------------------------
+class Sink( object ):
+    '''
+    Sink
+
+    Where an ffmpeg stream writes: the output <target> and its format
+    <fmt>.  The stream calls open() with the frame format before ffmpeg
+    is launched, it returns the target, and close() once ffmpeg is gone.
+    '''
+    fmt = None
+
+    def __init__( self, target ):
+        super( Sink, self ).__init__()
+        self.target  = target
+        self.width   = None
+        self.height  = None
+        self.pix_fmt = None
+
+    def open( self, width, height, pix_fmt ):
+        self.width   = width
+        self.height  = height
+        self.pix_fmt = pix_fmt
+        return self.target
+
+    def close( self ):
+        pass
+
+    @property
+    def stats( self ):
+        return {}
+
+    def __str__( self ):
+        return str( self.target )
+
+
+class DeviceSink( Sink ):
+    '''
+    DeviceSink
+
+    A v4l2loopback device, ffmpeg writes to it with -f v4l2
+    '''
+    fmt = 'v4l2'
+
+
+class FileSink( Sink ):
+    '''
+    FileSink
+
+    A regular file or a FIFO, rawvideo unless told otherwise
+    '''
+    def __init__( self, path, fmt = 'rawvideo' ):
+        super( FileSink, self ).__init__( path )
+        self.fmt = fmt
+
+    @property
+    def stats( self ):
+        try:
+            return { 'bytes' : os.path.getsize( self.target ) }
+        except OSError as e:
+            return {}
+
+
+class EmulatorSink( FileSink ):
+    '''
+    EmulatorSink
+
+    Stand-in for a v4l2loopback device with a client attached: ffmpeg
+    writes rawvideo into a FIFO, a reader process (see emulator) takes
+    frames off it at <rate> frames per second, as fast as they come when
+    None, and reports frames received, inter-frame jitter and stalls,
+    see stats.  Without a <path> the FIFO goes in a temporary directory
+    made by open() and removed by close().  Can be opened again once
+    closed, stats start over.
+    '''
+    def __init__( self, path = None, rate = None, stall = emulator.stall_factor, report = 1.0, verbose = False ):
+        super( EmulatorSink, self ).__init__( path )
+        self._path    = path
+        self._tmpdir  = None
+        self.rate     = rate
+        self.stall    = stall
+        self.report   = report
+        self._verbose = verbose
+        self._lock    = Lock()
+        self._stats   = {}
+        self._reader  = None
+        self._watch_t = None
+
+    def open( self, width, height, pix_fmt ):
+        if self._reader is not None:
+            self.close()
+        super( EmulatorSink, self ).open( width, height, pix_fmt )
+        if self._path is None:
+            self._tmpdir = tempfile.mkdtemp( prefix = 'v4l2emu_' )
+            self.target  = os.path.join( self._tmpdir, 'loopback.fifo' )
+        if os.path.lexists( self.target ):
+            os.remove( self.target )
+        os.mkfifo( self.target )
+
+        args = [ sys.executable,
+                 emulator.__file__,
+                 self.target,
+                 str( pixfmt.frame_size( width, height, pix_fmt ) ),
+                 '--stall',  str( self.stall ),
+                 '--report', str( self.report ) ]
+        if self.rate:
+            args += [ '--rate', str( self.rate ) ]
+        with self._lock:
+            self._stats = {}
+        self._reader  = subprocess.Popen( args, stdout = subprocess.PIPE )
+        self._watch_t = Thread( target = self._watch, args = ( self._reader, ), name = 'EmulatorSink' )
+        self._watch_t.daemon = True
+        self._watch_t.start()
+        if self._verbose: print( 'Emulating a loopback device: {}x{} {} on {}'.format( width, height, pix_fmt, self.target ) )
+        return self.target
+
+    def _watch( self, reader ):
+        for line in reader.stdout:
+            try:
+                stats = json.loads( line.decode( 'utf-8' ) )
+            except ValueError as e:
+                continue
+            with self._lock:
+                self._stats = stats
+
+    @property
+    def stats( self ):
+        with self._lock:
+            return dict( self._stats )
+
+    def summary( self ):
+        '''
+        One line status, e.g. for the console
+        '''
+        stats = self.stats
+        if not stats:
+            return 'no frames yet'
+        fmt = lambda key, spec, unit = '' : format( stats[ key ], spec ) + unit if stats.get( key ) is not None else 'N/A'
+        return 'frames={} fps={} interval={} jitter={} max={} stalls={}'.format(
+            stats[ 'frames' ],
+            fmt( 'fps', '.1f' ),
+            fmt( 'interval_ms', '.1f', 'ms' ),
+            fmt( 'jitter_ms', '.1f', 'ms' ),
+            fmt( 'max_ms', '.1f', 'ms' ),
+            stats[ 'stalls' ] )
+
+    def close( self, timeout = 5.0 ):
+        reader, self._reader = self._reader, None
+        if reader is not None:
+            # Open and close the FIFO once: a reader still waiting for a
+            # writer gets EOF.  Fails until the reader has it open itself.
+            deadline = time.time() + timeout
+            while reader.poll() is None and time.time() < deadline:
+                try:
+                    os.close( os.open( self.target, os.O_WRONLY | os.O_NONBLOCK ) )
+                    break
+                except OSError as e:
+                    time.sleep( 0.01 )
+            try:
+                reader.wait( timeout )
+            except subprocess.TimeoutExpired as e:
+                reader.kill()
+                reader.wait()
+            self._watch_t.join()
+            reader.stdout.close()
+        if self.target is not None and os.path.lexists( self.target ):
+            os.remove( self.target )
+        if self._tmpdir is not None:
+            shutil.rmtree( self._tmpdir, ignore_errors = True )
+            self._tmpdir = None
+
+
+def as_sink( target, fmt = 'v4l2' ):
+    '''
+    <target> as a Sink: a Sink as is, a path as a DeviceSink (-f v4l2)
+    or, for any other <fmt>, a FileSink
+    '''
+    if isinstance( target, Sink ):
+        return target
+    if fmt == 'v4l2':
+        return DeviceSink( target )
+    return FileSink( target, fmt )
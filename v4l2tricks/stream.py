@@ -1,21 +1,106 @@
 # -*- coding: utf-8 -*-
 """ffmpeg interfaces
 """
-from .ffmpeg_if import StreamProcess, OverlayStreamProcess, DesktopStreamProcess
+from .ffmpeg_if import StreamProcess, FanoutStreamProcess, OverlayStreamProcess, DesktopStreamProcess, PlayoutProcess, SwitchProcess, Target, probe_info
+from .proxy     import proxy_cache
+from .compositor import CompositeStream
 
-def stream_media( fname, dev ='/dev/video20', verbose = True ):
+# Every <dev> below is a device path or a Sink (see sink.py): DeviceSink,
+# FileSink, or EmulatorSink to stream without the v4l2loopback module.
+# <limits> (process.Limits) schedules the ffmpeg, see orchestrator.py
+
+def stream_media( fname, dev ='/dev/video20', verbose = True, loop = False, proxy = True, limits = None ):
     '''
     Stream the video <fname> to <dev> (defaults to '/dev/video1')
 
     Notes:  Per the producer section of the v4l2loopback wiki.
     ffmpeg -re -i "{0}" -f v4l2 "{1}"
+
+    With <loop> the file is looped by ffmpeg (-stream_loop -1).  With
+    <proxy> a proxy made for at least the device's size is streamed when
+    there is one (see proxy.py), the file itself otherwise: <proxy> is
+    the device's ( width, height ), True for the default proxy size.
+    '''
+    if proxy:
+        fname = _resolve_proxy( fname, proxy, verbose )
+    return StreamProcess( fname, dev, verbose = verbose, loop = loop, limits = limits )
+
+
+def _resolve_proxy( fname, size, verbose ):
+    width, height = size if isinstance( size, tuple ) else ( None, None )
+    resolved = proxy_cache().resolve( fname, width, height )
+    if resolved != fname:
+        if verbose: print( 'Streaming the proxy of {}: {}'.format( fname, resolved ) )
+    return resolved
+
+
+def parse_target( spec ):
+    '''
+    Target from 'DEVICE[:WIDTHxHEIGHT][:PIX_FMT]', e.g. /dev/video21,
+    /dev/video21:640x360 or /dev/video21:640x-1:yuyv422 (-1 follows the
+    aspect ratio)
+    '''
+    parts  = spec.split( ':' )
+    target = Target( parts[ 0 ] )
+    for part in parts[ 1: ]:
+        if 'x' in part:
+            w, h   = [ int( v ) for v in part.split( 'x' ) ]
+            target = target._replace( width  = w if w > 0 else None,
+                                      height = h if h > 0 else None )
+        elif part:
+            target = target._replace( pix_fmt = part )
+    return target
+
+
+def fanout_stream( fname, targets, verbose = True, loop = False, proxy = True, limits = None ):
+    '''
+    Decode <fname> once and write it to every one of <targets> (devices,
+    Sinks, Targets or parse_target specs), see FanoutStreamProcess.
+    With <proxy> the proxy used is large enough for the largest target
+    (the default proxy size when no target has one)
     '''
-    return StreamProcess( fname, dev, verbose )
+    targets = [ parse_target( t ) if isinstance( t, str ) else t for t in targets ]
+    if proxy:
+        sized = [ t for t in targets if isinstance( t, Target ) and ( t.width or t.height ) ]
+        if sized and proxy is True:
+            proxy = ( max( t.width or 0 for t in sized ), max( t.height or 0 for t in sized ) )
+        fname = _resolve_proxy( fname, proxy, verbose )
+    return FanoutStreamProcess( fname, targets, verbose = verbose, loop = loop, limits = limits )
 
 
-def overlay_stream( fname, overlay, dev = '/dev/video20', verbose = True ):
-    return OverlayStreamProcess( fname, overlay, dev, verbose )
+def overlay_stream( fname, overlay, dev = '/dev/video20', verbose = True, limits = None ):
+    return OverlayStreamProcess( fname, overlay, dev, verbose = verbose, limits = limits )
 
 
-def desktop_stream( x = 0, y = 0, w = 640, h = 480, display = ':0', dev = '/dev/video20', verbose = True ):
-    return DesktopStreamProcess( x, y, w, h, display,  dev, verbose )
+def composite_stream( fname, layers = (), dev = '/dev/video20', pix_fmt = 'yuv420p', verbose = True ):
+    '''
+    <fname> with overlay <layers> ( name, image, x, y[, opacity] ) blended
+    in Python (see compositor.py): the returned stream's compositor adds,
+    moves and removes layers while it plays, no restart
+    '''
+    return CompositeStream( fname, dev, layers, pix_fmt = pix_fmt, verbose = verbose )
+
+
+def desktop_stream( x = 0, y = 0, w = 640, h = 480, display = ':0', dev = '/dev/video20', verbose = True, limits = None ):
+    return DesktopStreamProcess( x, y, w, h, display,  dev, verbose, limits = limits )
+
+
+def playout_stream( sources, dev = '/dev/video20', loop = False, verbose = True ):
+    '''
+    Gapless playout of <sources> to <dev>, one writer for the whole list
+    '''
+    return PlayoutProcess( sources, dev, loop = loop, verbose = verbose )
+
+
+def switch_stream( first, dev = '/dev/video20', pool_size = 2, verbose = True ):
+    '''
+    Live switching to <dev>: the writer takes its format from <first>,
+    switch()/prepare() then change or warm up the source
+    '''
+    info = probe_info( first )
+    return SwitchProcess( dev,
+                          info[ 'width' ],
+                          info[ 'height' ],
+                          fps       = info[ 'frame_rate' ] or 30,
+                          pool_size = pool_size,
+                          verbose   = verbose )